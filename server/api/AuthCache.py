@@ -0,0 +1,140 @@
+import copy
+from datetime import datetime, timezone
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+USER_CACHE_SIZE = 10000   # Users kept at most, the cache is emptied when it grows beyond
+
+
+class AuthCache:
+  """
+  Keeps the users authenticated by JWT and the jti of the blacklisted tokens for
+  AUTH_CACHE_TTL seconds, so authenticating a request does not query the database.
+  Changes in this process invalidate the cache directly (see signals); other processes,
+  e.g. the superuserUpdate/superuserDelete commands, touch AUTH_GENERATION_FILE, which
+  every lookup checks with a stat().
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.users = {}                  # user id -> (expires, User)
+    self.blacklist = frozenset()     # jti of the blacklisted tokens that did not expire yet
+    self.blacklistExpires = 0
+    self.generation = None
+
+  def checkGeneration(self):
+    try:
+      generation = os.stat(settings.AUTH_GENERATION_FILE).st_mtime_ns
+    except OSError:
+      generation = None
+    if generation != self.generation:
+      with self.lock:
+        self.generation = generation
+        self.users.clear()
+        self.blacklistExpires = 0
+
+  def getUser(self, userId, load):
+    """Returns a copy of the cached user, or load()s and caches it."""
+    if settings.AUTH_CACHE_TTL <= 0:
+      return load()
+    self.checkGeneration()
+    now = time.monotonic()
+    with self.lock:
+      cached = self.users.get(userId)
+    if cached is not None and cached[0] > now:
+      # Each request gets its own instance, views may modify request.user
+      return copy.copy(cached[1])
+
+    user = load()
+    with self.lock:
+      if len(self.users) >= USER_CACHE_SIZE:
+        self.users.clear()
+      self.users[userId] = (now + settings.AUTH_CACHE_TTL, user)
+    return copy.copy(user)
+
+  def isBlacklisted(self, jti):
+    if settings.AUTH_CACHE_TTL <= 0:
+      return BlacklistedToken.objects.filter(token__jti=jti).exists()
+    self.checkGeneration()
+    now = time.monotonic()
+    with self.lock:
+      blacklist = self.blacklist if self.blacklistExpires > now else None
+    if blacklist is None:
+      blacklist = frozenset(BlacklistedToken.objects.filter(
+        token__expires_at__gt=datetime.now(timezone.utc)
+      ).values_list('token__jti', flat=True))
+      with self.lock:
+        self.blacklist = blacklist
+        self.blacklistExpires = now + settings.AUTH_CACHE_TTL
+    return jti in blacklist
+
+  def addBlacklisted(self, jti):
+    with self.lock:
+      self.blacklist = self.blacklist | {jti}
+
+  def invalidateUser(self, userId=None):
+    with self.lock:
+      if userId is None:
+        self.users.clear()
+      else:
+        self.users.pop(userId, None)
+
+  def invalidateBlacklist(self):
+    with self.lock:
+      self.blacklistExpires = 0
+
+
+def bumpAuthGeneration():
+  """Makes the other processes drop their AuthCache."""
+  try:
+    with open(settings.AUTH_GENERATION_FILE, 'a'):
+      pass
+    os.utime(settings.AUTH_GENERATION_FILE)
+  except OSError as exc:
+    print('bumpAuthGeneration(), exception:', exc)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+  """JWTAuthentication that rejects blacklisted access tokens and looks users up in the AuthCache."""
+
+  def get_validated_token(self, raw_token):
+    validated_token = super().get_validated_token(raw_token)
+    if authCache.isBlacklisted(validated_token.get(api_settings.JTI_CLAIM)):
+      raise InvalidToken(_('Token is blacklisted'))
+    return validated_token
+
+  def get_user(self, validated_token):
+    userId = validated_token.get(api_settings.USER_ID_CLAIM)
+    return authCache.getUser(userId, lambda: super(CachedJWTAuthentication, self).get_user(validated_token))
+
+
+class CachedRefreshToken(RefreshToken):
+  """RefreshToken whose blacklist check uses the AuthCache."""
+
+  def check_blacklist(self):
+    if authCache.isBlacklisted(self.payload[api_settings.JTI_CLAIM]):
+      raise TokenError(_('Token is blacklisted'))
+
+
+def blacklistAccessToken(accessToken, user):
+  """Logout blacklists the access token too, it stays valid for its lifetime otherwise."""
+  jti = accessToken[api_settings.JTI_CLAIM]
+  token, _created = OutstandingToken.objects.get_or_create(jti=jti, defaults={
+    'user': user,
+    'token': str(accessToken),
+    'expires_at': datetime.fromtimestamp(accessToken['exp'], tz=timezone.utc),
+  })
+  BlacklistedToken.objects.get_or_create(token=token)
+  authCache.addBlacklisted(jti)
+
+
+authCache = AuthCache()
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class Subscription:
+  def __init__(self, loop, uuids):
+    self.loop = loop
+    self.uuids = set(uuids)   # Empty set: status events of all operations, no output events
+    self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    self.droppedEvents = 0
+
+  def wants(self, uuid, eventType):
+    if self.uuids:
+      return uuid in self.uuids
+    return eventType == 'status'
+
+  def deliver(self, event):
+    # Runs in the subscriber's event loop
+    try:
+      self.queue.put_nowait(event)
+    except asyncio.QueueFull:
+      self.droppedEvents += 1
+
+
+class EventBroker:
+  """
+  Fans out operation events, published from the monitor threads, to the asyncio
+  queues of the streaming connections that subscribed to them.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.subscriptions = set()
+
+  def subscribe(self, uuids):
+    subscription = Subscription(asyncio.get_running_loop(), uuids)
+    with self.lock:
+      self.subscriptions.add(subscription)
+    return subscription
+
+  def unsubscribe(self, subscription):
+    with self.lock:
+      self.subscriptions.discard(subscription)
+
+  def publish(self, uuid, event):
+    eventType = event['type']
+    with self.lock:
+      subscriptions = [subscription for subscription in self.subscriptions if subscription.wants(uuid, eventType)]
+    for subscription in subscriptions:
+      try:
+        subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+      except RuntimeError:
+        # The event loop of the connection is already closed
+        self.unsubscribe(subscription)
+
+
+eventBroker = EventBroker()
@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.db.models import Max
+from django.utils import timezone
+
+from .EventBroker import eventBroker
+from .models import OperationEvent
+
+RELAY_BATCH_SIZE = 500
+RELAY_RETENTION = timedelta(minutes=5)   # Events older than this are deleted by the process holding the monitor lease
+RELAY_ID_LOOKBACK = 100   # Rows committed out of id order by concurrent writers are still picked up
+
+
+class EventRelay:
+  """
+  Passes the status events between the server processes, on any host sharing the database.
+  A process delivers the events it publishes to its own streams directly and stores them in
+  the OperationEvent table; the other processes poll the table and deliver them to theirs.
+  """
+
+  def __init__(self, origin):
+    self.origin = origin
+    self.lastId = None
+    self.seenIds = set()   # Ids above lastId - RELAY_ID_LOOKBACK that were delivered already
+
+  def record(self, events):
+    """Stores the (uuid, event) pairs published by this process."""
+    now = timezone.now()
+    OperationEvent.objects.bulk_create([OperationEvent(uuid=uuid, origin=self.origin, event=event, created_at=now)
+                                        for uuid, event in events])
+
+  def poll(self):
+    """Delivers the events the other processes stored since the last poll, returns how many."""
+    if self.lastId is None:
+      # Streams reload the current state when they start, older events are of no use
+      self.lastId = OperationEvent.objects.aggregate(lastId=Max('id'))['lastId'] or 0
+      self.seenIds = set(OperationEvent.objects.filter(id__gt=self.lastId - RELAY_ID_LOOKBACK).values_list('id', flat=True))
+      return 0
+
+    delivered = 0
+    while True:
+      rows = list(OperationEvent.objects.filter(id__gt=self.lastId - RELAY_ID_LOOKBACK).exclude(origin=self.origin)
+                  .order_by('id').values_list('id', 'uuid', 'event')[:RELAY_BATCH_SIZE])
+      for id, uuid, event in rows:
+        if id in self.seenIds:
+          continue
+        self.seenIds.add(id)
+        eventBroker.publish(uuid, event)
+        delivered += 1
+      if rows:
+        self.lastId = max(self.lastId, rows[-1][0])
+        self.seenIds = {id for id in self.seenIds if id > self.lastId - RELAY_ID_LOOKBACK}
+      if len(rows) < RELAY_BATCH_SIZE:
+        return delivered
+
+  def prune(self):
+    OperationEvent.objects.filter(created_at__lt=timezone.now() - RELAY_RETENTION).delete()
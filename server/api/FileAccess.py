@@ -0,0 +1,268 @@
+import base64
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+import codecs
+from fnmatch import fnmatchcase
+import json
+import os
+import stat
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+
+READ_CHUNK_SIZE = 64 * 1024
+LISTING_CACHE_TTL = 5       # Seconds a listing is reused while the directory mtime is unchanged
+LISTING_CACHE_SIZE = 128    # Number of directories kept in the listing cache
+LISTING_SORT_KEYS = {
+  'name': lambda entry: (entry['name'],),
+  'size': lambda entry: (entry['size'], entry['name']),
+  'mtime': lambda entry: (entry['mtime'], entry['name']),
+  'type': lambda entry: (entry['type'], entry['name']),
+}
+
+
+def tailOffset(openFile, size, numLines):
+  """Returns the byte offset at which the last numLines lines of the file start."""
+  if numLines <= 0:
+    return size
+  end = size
+  newlines = 0
+  # A newline at the very end terminates the last line, it does not start a new one
+  if size > 0:
+    openFile.seek(size - 1)
+    if openFile.read(1) == b'\n':
+      end -= 1
+
+  while end > 0:
+    start = max(end - READ_CHUNK_SIZE, 0)
+    openFile.seek(start)
+    block = openFile.read(end - start)
+    idx = len(block)
+    while True:
+      idx = block.rfind(b'\n', 0, idx)
+      if idx < 0:
+        break
+      newlines += 1
+      if newlines == numLines:
+        return start + idx + 1
+    end = start
+  return 0
+
+
+def fileRange(openFile, size, query):
+  """
+  Works out the byte range [offset, end) asked for by the query parameters:
+  offset/length page through the file, tail=N gives the last N lines and since=X
+  everything appended after byte X. Without parameters the whole file is returned.
+  Raises ValueError for invalid parameters.
+  """
+  truncated = False
+  if 'tail' in query:
+    numLines = int(query['tail'])
+    if numLines < 0:
+      raise ValueError('tail must not be negative')
+    offset = tailOffset(openFile, size, numLines)
+  elif 'since' in query:
+    offset = int(query['since'])
+    if offset > size:
+      # The file was truncated or replaced since the client read it
+      offset = 0
+      truncated = True
+  else:
+    offset = int(query.get('offset', 0))
+
+  if offset < 0:
+    raise ValueError('offset must not be negative')
+  offset = min(offset, size)
+
+  end = size
+  if 'length' in query:
+    length = int(query['length'])
+    if length < 0:
+      raise ValueError('length must not be negative')
+    end = min(offset + length, size)
+
+  return offset, end, truncated
+
+
+def streamFileJson(openFile, size, offset, end, truncated):
+  """
+  Yields a JSON object describing the range of the file, with the content read, decoded
+  and escaped in chunks of READ_CHUNK_SIZE so the file is never loaded as a whole.
+  """
+  try:
+    header = {
+      'type': 'file',
+      'size': size,
+      'offset': offset,
+      'next_offset': end,
+      'truncated': truncated,
+    }
+    yield json.dumps(header)[:-1] + ', "content": "'
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    openFile.seek(offset)
+    remaining = end - offset
+    while remaining > 0:
+      chunk = openFile.read(min(READ_CHUNK_SIZE, remaining))
+      if not chunk:
+        break
+      remaining -= len(chunk)
+      yield json.dumps(decoder.decode(chunk))[1:-1]
+    yield json.dumps(decoder.decode(b'', final=True))[1:-1] + '"}'
+
+  finally:
+    openFile.close()
+
+
+async def astreamFileJson(openFile, size, offset, end, truncated):
+  """
+  streamFileJson() for ASGI, Django would otherwise read a sync iterator as a whole
+  before sending it. The chunks are read in a worker thread, off the event loop.
+  """
+  chunks = streamFileJson(openFile, size, offset, end, truncated)
+  nextChunk = sync_to_async(next, thread_sensitive=False)
+  try:
+    while True:
+      chunk = await nextChunk(chunks, None)
+      if chunk is None:
+        break
+      yield chunk
+  finally:
+    await sync_to_async(chunks.close, thread_sensitive=False)()
+
+
+def openFileRange(path, query):
+  """Opens path and returns the arguments for streamFileJson()."""
+  openFile = open(path, 'rb')
+  try:
+    size = os.fstat(openFile.fileno()).st_size
+    offset, end, truncated = fileRange(openFile, size, query)
+  except Exception:
+    openFile.close()
+    raise
+  return openFile, size, offset, end, truncated
+
+
+def entryType(mode):
+  if stat.S_ISDIR(mode):
+    return 'directory'
+  if stat.S_ISREG(mode):
+    return 'file'
+  if stat.S_ISLNK(mode):
+    return 'symlink'
+  return 'other'
+
+
+def scanDirectory(path):
+  entries = []
+  with os.scandir(path) as dirEntries:
+    for dirEntry in dirEntries:
+      try:
+        entryStat = dirEntry.stat()
+      except OSError:
+        # Broken symlink, or the entry disappeared while scanning
+        try:
+          entryStat = dirEntry.stat(follow_symlinks=False)
+        except OSError:
+          continue
+      entries.append({
+        'name': dirEntry.name,
+        'type': entryType(entryStat.st_mode),
+        'size': entryStat.st_size,
+        'mtime': entryStat.st_mtime,
+      })
+  return entries
+
+
+class ListingCache:
+  """
+  Keeps recent directory listings. A listing is reused while the mtime of the directory
+  is unchanged, which covers entries being added or removed, and at most LISTING_CACHE_TTL
+  seconds, since the sizes and mtimes of the entries change without touching the directory.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.listings = OrderedDict()   # path -> (directory mtime_ns, time scanned, entries)
+
+  def get(self, path):
+    mtime_ns = os.stat(path).st_mtime_ns
+    now = time.monotonic()
+    with self.lock:
+      cached = self.listings.get(path)
+      if cached is not None and cached[0] == mtime_ns and now - cached[1] < LISTING_CACHE_TTL:
+        self.listings.move_to_end(path)
+        return cached[2]
+
+    entries = scanDirectory(path)
+    with self.lock:
+      self.listings[path] = (mtime_ns, now, entries)
+      self.listings.move_to_end(path)
+      while len(self.listings) > LISTING_CACHE_SIZE:
+        self.listings.popitem(last=False)
+    return entries
+
+
+listingCache = ListingCache()
+
+
+def encodeCursor(key):
+  return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decodeCursor(cursor):
+  try:
+    return tuple(json.loads(base64.urlsafe_b64decode(cursor.encode())))
+  except (ValueError, TypeError):
+    raise ValueError('Invalid cursor')
+
+
+def listDirectory(path, query):
+  """
+  Lists a directory with the type, size and mtime of each entry. The query may hold
+  sort (name, size, mtime or type), order (asc or desc), pattern (a glob on the name),
+  limit and the cursor returned as next_cursor by the previous page.
+  Raises ValueError for invalid parameters.
+  """
+  sortBy = query.get('sort', 'name')
+  if sortBy not in LISTING_SORT_KEYS:
+    raise ValueError(f'Cannot sort on {sortBy}')
+  descending = query.get('order', 'asc') == 'desc'
+  limit = int(query['limit']) if 'limit' in query else None
+  if limit is not None and limit <= 0:
+    raise ValueError('limit must be positive')
+
+  entries = listingCache.get(path)
+  pattern = query.get('pattern')
+  if pattern:
+    entries = [entry for entry in entries if fnmatchcase(entry['name'], pattern)]
+
+  sortKey = LISTING_SORT_KEYS[sortBy]
+  entries = sorted(entries, key=sortKey)
+  keys = [sortKey(entry) for entry in entries]
+
+  cursor = query.get('cursor')
+  try:
+    if descending:
+      end = bisect_left(keys, decodeCursor(cursor)) if cursor else len(entries)
+    else:
+      start = bisect_right(keys, decodeCursor(cursor)) if cursor else 0
+  except TypeError:
+    raise ValueError('Cursor does not belong to this sort order')
+
+  if descending:
+    start = 0 if limit is None else max(end - limit, 0)
+    page = entries[start:end][::-1]
+    more = start > 0
+  else:
+    end = len(entries) if limit is None else start + limit
+    page = entries[start:end]
+    more = end < len(entries)
+
+  return {
+    'total': len(entries),
+    'entries': page,
+    'next_cursor': encodeCursor(sortKey(page[-1])) if more and page else None,
+  }
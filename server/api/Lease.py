@@ -0,0 +1,44 @@
+from datetime import timedelta
+import os
+import socket
+import uuid
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import MonitorLease
+
+
+class DbLease:
+  """
+  A named lease in the MonitorLease table. Only one process at a time, on any host sharing
+  the database, holds it. The holder has to renew it within ttl seconds or another process
+  can take it over.
+  """
+
+  def __init__(self, name, ttl):
+    self.name = name
+    self.ttl = ttl
+    self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+  def acquire(self):
+    """Takes or renews the lease, returns whether this process holds it."""
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=self.ttl)
+    updated = MonitorLease.objects.filter(name=self.name).filter(
+      Q(owner=self.owner) | Q(expires_at__lt=now)
+    ).update(owner=self.owner, expires_at=expires_at)
+    if updated:
+      return True
+    if MonitorLease.objects.filter(name=self.name).exists():
+      return False
+    try:
+      with transaction.atomic():
+        MonitorLease.objects.create(name=self.name, owner=self.owner, expires_at=expires_at)
+    except IntegrityError:
+      return False   # Another process created it first
+    return True
+
+  def release(self):
+    MonitorLease.objects.filter(name=self.name, owner=self.owner).delete()
@@ -0,0 +1,190 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from webcligui_api import AsyncLibraryAPI, LibraryAPI
+from .Metrics import libraryCallErrors, libraryCallSeconds
+
+# Threads running the calls of the synchronous libraries for the async views
+libraryExecutor = ThreadPoolExecutor(max_workers=settings.LIBRARY_THREAD_POOL_SIZE, thread_name_prefix='LibraryAPI')
+
+
+def callHook(libraryApiImpl, name, *args, default=None):
+  # Libraries registered before the hooks were added may not implement them
+  hook = getattr(libraryApiImpl, name, None)
+  return hook(*args) if hook else default
+
+
+class ThreadPoolLibrary(AsyncLibraryAPI):
+  """Makes a synchronous LibraryAPI awaitable, its methods run on the libraryExecutor threads."""
+
+  def __init__(self, wrapped: LibraryAPI):
+    self.wrapped = wrapped
+
+  async def run(self, method, *args):
+    return await asyncio.get_running_loop().run_in_executor(libraryExecutor, partial(method, *args))
+
+  async def getOperationHierarchy(self):
+    return await self.run(self.wrapped.getOperationHierarchy)
+
+  def getOperationHierarchyVersion(self):
+    return callHook(self.wrapped, 'getOperationHierarchyVersion')
+
+  async def getOperationSubtree(self, operationBranch, depth):
+    if not hasattr(self.wrapped, 'getOperationSubtree'):
+      return None
+    return await self.run(self.wrapped.getOperationSubtree, operationBranch, depth)
+
+  async def getDescription(self, operationBranch):
+    return await self.run(self.wrapped.getDescription, operationBranch)
+
+  async def getParameters(self, operationBranch):
+    return await self.run(self.wrapped.getParameters, operationBranch)
+
+  def isDescriptionCacheable(self, operationBranch):
+    return callHook(self.wrapped, 'isDescriptionCacheable', operationBranch, default=True)
+
+  def isParametersCacheable(self, operationBranch):
+    return callHook(self.wrapped, 'isParametersCacheable', operationBranch, default=True)
+
+  async def submitOperation(self, operationBranch, command, servers):
+    return await self.run(self.wrapped.submitOperation, operationBranch, command, servers)
+
+
+class BlockingLibrary(LibraryAPI):
+  """
+  Makes an AsyncLibraryAPI callable from the synchronous code, the queue workers and the
+  sync views. Must not be called from a thread running an event loop.
+  """
+
+  def __init__(self, wrapped: AsyncLibraryAPI):
+    self.wrapped = wrapped
+
+  def getOperationHierarchy(self):
+    return async_to_sync(self.wrapped.getOperationHierarchy)()
+
+  def getOperationHierarchyVersion(self):
+    return callHook(self.wrapped, 'getOperationHierarchyVersion')
+
+  def getOperationSubtree(self, operationBranch, depth):
+    if not hasattr(self.wrapped, 'getOperationSubtree'):
+      return None
+    return async_to_sync(self.wrapped.getOperationSubtree)(operationBranch, depth)
+
+  def getDescription(self, operationBranch):
+    return async_to_sync(self.wrapped.getDescription)(operationBranch)
+
+  def getParameters(self, operationBranch):
+    return async_to_sync(self.wrapped.getParameters)(operationBranch)
+
+  def isDescriptionCacheable(self, operationBranch):
+    return callHook(self.wrapped, 'isDescriptionCacheable', operationBranch, default=True)
+
+  def isParametersCacheable(self, operationBranch):
+    return callHook(self.wrapped, 'isParametersCacheable', operationBranch, default=True)
+
+  def submitOperation(self, operationBranch, command, servers):
+    return async_to_sync(self.wrapped.submitOperation)(operationBranch, command, servers)
+
+
+class TimedLibrary(LibraryAPI):
+  """Records the duration of the calls of a synchronous LibraryAPI in the metrics."""
+
+  def __init__(self, wrapped: LibraryAPI, libraryName):
+    self.wrapped = wrapped
+    self.libraryName = libraryName
+
+  def call(self, method, *args):
+    startTime = time.perf_counter()
+    try:
+      return getattr(self.wrapped, method)(*args)
+    except Exception:
+      libraryCallErrors.inc(self.libraryName, method)
+      raise
+    finally:
+      libraryCallSeconds.observe(time.perf_counter() - startTime, self.libraryName, method)
+
+  def getOperationHierarchy(self):
+    return self.call('getOperationHierarchy')
+
+  def getOperationHierarchyVersion(self):
+    return callHook(self.wrapped, 'getOperationHierarchyVersion')
+
+  def getOperationSubtree(self, operationBranch, depth):
+    if not hasattr(self.wrapped, 'getOperationSubtree'):
+      return None
+    return self.call('getOperationSubtree', operationBranch, depth)
+
+  def getDescription(self, operationBranch):
+    return self.call('getDescription', operationBranch)
+
+  def getParameters(self, operationBranch):
+    return self.call('getParameters', operationBranch)
+
+  def isDescriptionCacheable(self, operationBranch):
+    return callHook(self.wrapped, 'isDescriptionCacheable', operationBranch, default=True)
+
+  def isParametersCacheable(self, operationBranch):
+    return callHook(self.wrapped, 'isParametersCacheable', operationBranch, default=True)
+
+  def submitOperation(self, operationBranch, command, servers):
+    return self.call('submitOperation', operationBranch, command, servers)
+
+  def close(self):
+    callHook(self.wrapped, 'close')
+
+
+class TimedAsyncLibrary(AsyncLibraryAPI):
+  """Records the duration of the calls of an AsyncLibraryAPI in the metrics."""
+
+  def __init__(self, wrapped: AsyncLibraryAPI, libraryName):
+    self.wrapped = wrapped
+    self.libraryName = libraryName
+
+  async def call(self, method, *args):
+    startTime = time.perf_counter()
+    try:
+      return await getattr(self.wrapped, method)(*args)
+    except Exception:
+      libraryCallErrors.inc(self.libraryName, method)
+      raise
+    finally:
+      libraryCallSeconds.observe(time.perf_counter() - startTime, self.libraryName, method)
+
+  async def getOperationHierarchy(self):
+    return await self.call('getOperationHierarchy')
+
+  def getOperationHierarchyVersion(self):
+    return callHook(self.wrapped, 'getOperationHierarchyVersion')
+
+  async def getOperationSubtree(self, operationBranch, depth):
+    if not hasattr(self.wrapped, 'getOperationSubtree'):
+      return None
+    return await self.call('getOperationSubtree', operationBranch, depth)
+
+  async def getDescription(self, operationBranch):
+    return await self.call('getDescription', operationBranch)
+
+  async def getParameters(self, operationBranch):
+    return await self.call('getParameters', operationBranch)
+
+  def isDescriptionCacheable(self, operationBranch):
+    return callHook(self.wrapped, 'isDescriptionCacheable', operationBranch, default=True)
+
+  def isParametersCacheable(self, operationBranch):
+    return callHook(self.wrapped, 'isParametersCacheable', operationBranch, default=True)
+
+  async def submitOperation(self, operationBranch, command, servers):
+    return await self.call('submitOperation', operationBranch, command, servers)
+
+
+def adaptLibrary(libraryApiImpl, libraryName):
+  """Returns the (sync, async) interfaces of a library, both timed, see Metrics."""
+  if isinstance(libraryApiImpl, AsyncLibraryAPI):
+    timed = TimedAsyncLibrary(libraryApiImpl, libraryName)
+    return BlockingLibrary(timed), timed
+  timed = TimedLibrary(libraryApiImpl, libraryName)
+  return timed, ThreadPoolLibrary(timed)
@@ -0,0 +1,156 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import importlib
+import sys
+import threading
+import time
+
+from django.conf import settings
+from .LibraryAdapters import adaptLibrary
+from .LibraryWorkers import ProcessLibrary
+from .Metrics import libraryImportSeconds
+from .models import LibraryRegistration
+from .ResponseCache import branchCache, hierarchyCache
+
+REGISTRATION_CHECK_INTERVAL = 30   # Seconds, picks up libraries registered by other processes (register_library)
+
+
+@dataclass
+class LoadedLibrary:
+  registration: tuple   # (module_path, class_name) it was loaded from
+  syncApi: object       # LibraryAPI
+  asyncApi: object      # AsyncLibraryAPI
+  importSeconds: float
+
+
+class LibraryRegistry:
+  """
+  The registered libraries, each imported and instantiated the first time it is used, or
+  all at once by loadAll(). The registrations are re-read at most every REGISTRATION_CHECK_INTERVAL
+  seconds, or on the next use after invalidate(); a library whose registration changed or
+  was removed is dropped and, when used again, loaded anew with its module reloaded.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.loadLocks = {}         # library name -> Lock, one import of a library at a time
+    self.registrations = None   # library name -> (module_path, class_name), in registration order
+    self.libraries = {}         # library name -> LoadedLibrary
+    self.reloadModules = set()  # library names whose module must be reloaded before the next import
+    self.checkedAt = 0
+
+  def invalidate(self, libraryName=None):
+    with self.lock:
+      self.checkedAt = 0
+      if libraryName is not None:
+        self.reloadModules.add(libraryName)
+
+  def refresh(self):
+    with self.lock:
+      if self.registrations is not None and time.monotonic() - self.checkedAt < REGISTRATION_CHECK_INTERVAL:
+        return
+
+    rows = LibraryRegistration.objects.order_by('id').values_list('library_name', 'module_path', 'class_name')
+    registrations = {libraryName: (module_path, class_name) for libraryName, module_path, class_name in rows}
+    with self.lock:
+      changed = [libraryName for libraryName, loaded in self.libraries.items()
+                 if registrations.get(libraryName) != loaded.registration or libraryName in self.reloadModules]
+      dropped = [self.libraries.pop(libraryName) for libraryName in changed]
+      self.reloadModules.update(changed)
+      self.registrations = registrations
+      self.checkedAt = time.monotonic()
+
+    for loaded in dropped:
+      # Stops the worker processes of a library hosted by LibraryWorkers
+      closeHook = getattr(loaded.syncApi, 'close', None)
+      if closeHook:
+        closeHook()
+    for libraryName in changed:
+      print(f'LibraryRegistry: registration of {libraryName} changed, it is reloaded when used')
+      hierarchyCache.invalidate(libraryName)
+      branchCache.invalidate(libraryName)
+
+  def names(self):
+    self.refresh()
+    with self.lock:
+      return list(self.registrations)
+
+  def get(self, libraryName):
+    """Returns the LoadedLibrary, importing it if needed, or None when no such library is registered."""
+    self.refresh()
+    with self.lock:
+      registration = self.registrations.get(libraryName)
+      loaded = self.libraries.get(libraryName)
+      loadLock = self.loadLocks.setdefault(libraryName, threading.Lock())
+    if loaded is not None or registration is None:
+      return loaded
+
+    with loadLock:
+      with self.lock:
+        loaded = self.libraries.get(libraryName)   # Loaded by another thread meanwhile
+        reloadModule = libraryName in self.reloadModules
+      if loaded is not None:
+        return loaded
+
+      loaded = self.load(libraryName, registration, reloadModule)
+      with self.lock:
+        if self.registrations.get(libraryName) == registration:
+          self.libraries[libraryName] = loaded
+          self.reloadModules.discard(libraryName)
+      return loaded
+
+  def load(self, libraryName, registration, reloadModule):
+    module_path, class_name = registration
+    startTime = time.perf_counter()
+    if settings.LIBRARY_EXECUTION == 'subprocess':
+      # The workers import the module themselves, new ones always get the current code
+      libraryApiImpl = ProcessLibrary(libraryName, module_path, class_name)
+    else:
+      if reloadModule and module_path in sys.modules:
+        module = importlib.reload(sys.modules[module_path])
+      else:
+        module = importlib.import_module(module_path)
+      libraryApiImpl = getattr(module, class_name)()
+    importSeconds = time.perf_counter() - startTime
+    print(f'LibraryRegistry: loaded {libraryName} ({module_path}.{class_name}) in {importSeconds:.3f} s')
+
+    syncApi, asyncApi = adaptLibrary(libraryApiImpl, libraryName)
+    return LoadedLibrary(registration=registration, syncApi=syncApi, asyncApi=asyncApi, importSeconds=importSeconds)
+
+  def loadAll(self, numThreads=1):
+    """Loads all registered libraries, numThreads of them at the same time, returns [(name, LoadedLibrary)]."""
+    libraryNames = self.names()
+    if numThreads > 1 and len(libraryNames) > 1:
+      with ThreadPoolExecutor(max_workers=numThreads, thread_name_prefix='LibraryRegistry') as executor:
+        loaded = list(executor.map(self.get, libraryNames))
+    else:
+      loaded = [self.get(libraryName) for libraryName in libraryNames]
+    return [(libraryName, library) for libraryName, library in zip(libraryNames, loaded) if library is not None]
+
+  def importTimes(self):
+    """Seconds each loaded library took to import, as webcligui_library_import_seconds."""
+    with self.lock:
+      return {(libraryName,): loaded.importSeconds for libraryName, loaded in self.libraries.items()}
+
+
+def preload(numThreads):
+  """Imports all libraries ahead of the first request, see LIBRARY_PRELOAD_THREADS."""
+  try:
+    startTime = time.perf_counter()
+    loaded = libraryRegistry.loadAll(numThreads)
+    print(f'LibraryRegistry: preloaded {len(loaded)} libraries in {time.perf_counter() - startTime:.3f} s')
+  except Exception as exc:
+    print('LibraryRegistry.preload(), exception:', exc)
+
+
+def startPreload():
+  """
+  Imports the libraries in the background instead of on the first request, when LIBRARY_PRELOAD_THREADS
+  is set. Called by wsgi.py and asgi.py, the management commands do not need the libraries.
+  """
+  if settings.LIBRARY_PRELOAD_THREADS > 0:
+    threading.Thread(target=preload, args=(settings.LIBRARY_PRELOAD_THREADS,), name='LibraryPreload', daemon=True).start()
+
+
+libraryRegistry = LibraryRegistry()
+libraryImportSeconds.setFunction(libraryRegistry.importTimes)
@@ -0,0 +1,103 @@
+"""
+A library worker process, started by LibraryWorkers as
+
+    python -m api.LibraryWorkerProcess <module_path> <class_name>
+
+It imports the library, then answers calls on stdin/stdout until stdin is closed. The
+coroutines of an AsyncLibraryAPI are run to completion on an event loop of the worker.
+Every message is a frame: a 4 byte big endian length followed by a pickle.
+  request:  (method name, args)
+  response: ('ok', result, rss bytes) or ('error', exception type name, message, rss bytes)
+The first response, ('ok', None, rss bytes), tells the library was imported.
+"""
+import asyncio
+import importlib
+import inspect
+import os
+import pickle
+import resource
+import struct
+import sys
+import traceback
+
+FRAME_HEADER = struct.Struct('>I')
+# Answers for the optional LibraryAPI hooks when the library does not implement them
+HOOK_DEFAULTS = {
+  'getOperationHierarchyVersion': None,
+  'getOperationSubtree': None,
+  'isDescriptionCacheable': True,
+  'isParametersCacheable': True,
+}
+
+
+def readExactly(readInto, numBytes):
+  buffer = bytearray(numBytes)
+  view = memoryview(buffer)
+  pos = 0
+  while pos < numBytes:
+    numRead = readInto(view[pos:])
+    if not numRead:
+      raise EOFError('Pipe closed')
+    pos += numRead
+  return buffer
+
+
+def writeFrame(outFile, message):
+  data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+  outFile.write(FRAME_HEADER.pack(len(data)) + data)
+  outFile.flush()
+
+
+def readFrame(inFile):
+  numBytes, = FRAME_HEADER.unpack(readExactly(inFile.readinto, FRAME_HEADER.size))
+  return pickle.loads(readExactly(inFile.readinto, numBytes))
+
+
+def currentRss():
+  try:
+    with open('/proc/self/statm') as statm:
+      return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (OSError, ValueError, IndexError):
+    # Peak instead of current RSS, in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def main(module_path, class_name):
+  # The pipes carry the protocol, whatever the library prints goes to stderr
+  inFile = os.fdopen(os.dup(0), 'rb', buffering=0)
+  outFile = os.fdopen(os.dup(1), 'wb')
+  devNull = os.open(os.devnull, os.O_RDONLY)
+  os.dup2(devNull, 0)
+  os.dup2(2, 1)
+  sys.stdout = sys.stderr
+
+  try:
+    libraryApiImpl = getattr(importlib.import_module(module_path), class_name)()
+  except Exception as exc:
+    writeFrame(outFile, ('error', type(exc).__name__, str(exc), currentRss()))
+    return
+  writeFrame(outFile, ('ok', None, currentRss()))
+  loop = None   # Created for the first coroutine, kept for the objects an async library binds to it
+
+  while True:
+    try:
+      method, args = readFrame(inFile)
+    except EOFError:
+      return
+    try:
+      if method in HOOK_DEFAULTS and not hasattr(libraryApiImpl, method):
+        result = HOOK_DEFAULTS[method]
+      else:
+        result = getattr(libraryApiImpl, method)(*args)
+        if inspect.isawaitable(result):
+          if loop is None:
+            loop = asyncio.new_event_loop()
+          result = loop.run_until_complete(result)
+      writeFrame(outFile, ('ok', result, currentRss()))
+    except Exception as exc:
+      traceback.print_exc()
+      writeFrame(outFile, ('error', type(exc).__name__, str(exc), currentRss()))
+
+
+if __name__ == '__main__':
+  main(sys.argv[1], sys.argv[2])
@@ -0,0 +1,255 @@
+import importlib.util
+import os
+import pickle
+import select
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from webcligui_api import LibraryAPI
+from .LibraryWorkerProcess import FRAME_HEADER
+from .ResponseCache import BRANCH_CACHE_SIZE
+
+WORKER_START_TIMEOUT = 60   # Seconds a worker may take to import its library
+HIERARCHY_VERSION_TTL = 5   # Seconds the hierarchy version of a library is reused before it is asked again
+# Answered from the cache of ProcessLibrary and not counted towards LIBRARY_WORKER_MAX_CALLS
+HOOK_METHODS = {'getOperationHierarchyVersion', 'isDescriptionCacheable', 'isParametersCacheable'}
+
+
+class LibraryWorkerError(Exception):
+  pass
+
+
+class LibraryWorker:
+  """One worker process hosting a library, used by one call at a time."""
+
+  def __init__(self, libraryName, module_path, class_name):
+    self.libraryName = libraryName
+    self.numCalls = 0
+    self.rss = 0
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    self.process = subprocess.Popen(
+      [sys.executable, '-m', 'api.LibraryWorkerProcess', module_path, class_name],
+      stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=settings.BASE_DIR, env=env,
+    )
+    try:
+      self.receive(time.monotonic() + WORKER_START_TIMEOUT, 'import')
+    except Exception:
+      self.kill()
+      raise
+
+  def readExactly(self, numBytes, deadline, method):
+    fd = self.process.stdout.fileno()
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
+    chunks = []
+    while numBytes > 0:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0 or not poller.poll(remaining * 1000):
+        self.kill()
+        raise TimeoutError(f'{self.libraryName}.{method}() did not answer within the timeout')
+      chunk = os.read(fd, numBytes)
+      if not chunk:
+        self.kill()
+        raise LibraryWorkerError(f'Worker of {self.libraryName} exited during {method}()')
+      chunks.append(chunk)
+      numBytes -= len(chunk)
+    return b''.join(chunks)
+
+  def receive(self, deadline, method):
+    numBytes, = FRAME_HEADER.unpack(self.readExactly(FRAME_HEADER.size, deadline, method))
+    response = pickle.loads(self.readExactly(numBytes, deadline, method))
+    self.rss = response[-1]
+    if response[0] == 'error':
+      raise LibraryWorkerError(f'{response[1]}: {response[2]}')
+    return response[1]
+
+  def call(self, method, args, timeout):
+    data = pickle.dumps((method, args), protocol=pickle.HIGHEST_PROTOCOL)
+    try:
+      self.process.stdin.write(FRAME_HEADER.pack(len(data)) + data)
+      self.process.stdin.flush()
+    except (BrokenPipeError, OSError):
+      self.kill()
+      raise LibraryWorkerError(f'Worker of {self.libraryName} exited')
+    if method not in HOOK_METHODS:
+      self.numCalls += 1
+    return self.receive(time.monotonic() + timeout, method)
+
+  def isAlive(self):
+    return self.process.poll() is None
+
+  def isWornOut(self):
+    maxCalls = settings.LIBRARY_WORKER_MAX_CALLS
+    maxRss = settings.LIBRARY_WORKER_MAX_RSS_MB * 1024 * 1024
+    return (0 < maxCalls <= self.numCalls) or (0 < maxRss <= self.rss)
+
+  def stop(self):
+    """Closing stdin makes the worker exit after its current call."""
+    try:
+      self.process.stdin.close()
+      self.process.wait(timeout=5)
+    except (OSError, subprocess.TimeoutExpired):
+      self.kill()
+
+  def kill(self):
+    self.process.kill()
+    self.process.wait()
+
+
+class LibraryWorkerPool:
+  """
+  Up to LIBRARY_WORKERS processes hosting one library. A call waits for an idle worker or
+  starts a new one; a worker is replaced after a timeout or crash, and recycled after
+  LIBRARY_WORKER_MAX_CALLS calls or once it uses more than LIBRARY_WORKER_MAX_RSS_MB.
+  """
+
+  def __init__(self, libraryName, module_path, class_name, size):
+    self.libraryName = libraryName
+    self.module_path = module_path
+    self.class_name = class_name
+    self.size = size
+    self.condition = threading.Condition()
+    self.idle = []
+    self.numWorkers = 0
+    self.closed = False
+    self.release(LibraryWorker(libraryName, module_path, class_name), starting=True)
+
+  def acquire(self):
+    with self.condition:
+      while not self.closed and not self.idle and self.numWorkers >= self.size:
+        self.condition.wait()
+      if self.closed:
+        raise LibraryWorkerError(f'Workers of {self.libraryName} were stopped')
+      if self.idle:
+        return self.idle.pop()
+      self.numWorkers += 1
+    try:
+      return LibraryWorker(self.libraryName, self.module_path, self.class_name)
+    except Exception:
+      with self.condition:
+        self.numWorkers -= 1
+        self.condition.notify()
+      raise
+
+  def release(self, worker, starting=False):
+    retire = not worker.isAlive() or worker.isWornOut()
+    with self.condition:
+      if starting:
+        self.numWorkers += 1
+      if retire or self.closed:
+        self.numWorkers -= 1
+      else:
+        self.idle.append(worker)
+      self.condition.notify()
+    if retire or self.closed:
+      if worker.isAlive():
+        print(f'LibraryWorkerPool: recycling a worker of {self.libraryName} after {worker.numCalls} calls, '
+              f'{worker.rss // (1024 * 1024)} MB')
+      worker.stop()
+
+  def call(self, method, *args):
+    worker = self.acquire()
+    try:
+      return worker.call(method, args, settings.LIBRARY_WORKER_TIMEOUT)
+    finally:
+      self.release(worker)
+
+  def close(self):
+    with self.condition:
+      self.closed = True
+      idle, self.idle = self.idle, []
+      self.numWorkers -= len(idle)
+      self.condition.notify_all()
+    for worker in idle:
+      worker.stop()
+
+
+class ProcessLibrary(LibraryAPI):
+  """
+  LibraryAPI whose calls are forwarded to a LibraryWorkerPool, see LIBRARY_EXECUTION.
+  The hooks the views ask on every request are answered without a round trip to a worker:
+  the hierarchy version is refreshed in the background every HIERARCHY_VERSION_TTL seconds
+  and whether a branch is cacheable is asked right after its description or parameters, on
+  the thread that fetched them.
+  """
+
+  def __init__(self, libraryName, module_path, class_name):
+    spec = importlib.util.find_spec(module_path)
+    self.moduleFile = spec.origin if spec else None   # For the cache versions, see ResponseCache.moduleMtime()
+    self.pool = LibraryWorkerPool(libraryName, module_path, class_name, settings.LIBRARY_WORKERS)
+    self.hookLock = threading.Lock()
+    self.cacheable = {}   # (hook name, branch tuple) -> answer of the hook, for the current version
+    self.version = self.pool.call('getOperationHierarchyVersion')
+    self.versionExpires = time.monotonic() + HIERARCHY_VERSION_TTL
+    self.refreshing = False
+
+  def refreshVersion(self):
+    try:
+      version = self.pool.call('getOperationHierarchyVersion')
+      with self.hookLock:
+        if version != self.version:
+          self.version = version
+          self.cacheable.clear()
+    except Exception as exc:
+      print('ProcessLibrary.refreshVersion(), exception:', exc)
+    finally:
+      with self.hookLock:
+        self.versionExpires = time.monotonic() + HIERARCHY_VERSION_TTL
+        self.refreshing = False
+
+  def callCacheableHook(self, hookName, operationBranch):
+    answer = self.pool.call(hookName, operationBranch)
+    with self.hookLock:
+      if len(self.cacheable) >= BRANCH_CACHE_SIZE:
+        self.cacheable.clear()
+      self.cacheable[hookName, tuple(operationBranch)] = answer
+    return answer
+
+  def cachedHook(self, hookName, operationBranch):
+    with self.hookLock:
+      answer = self.cacheable.get((hookName, tuple(operationBranch)))
+    if answer is None:
+      # Not asked together with the branch, or forgotten since the version changed
+      answer = self.callCacheableHook(hookName, operationBranch)
+    return answer
+
+  def getOperationHierarchy(self):
+    return self.pool.call('getOperationHierarchy')
+
+  def getOperationHierarchyVersion(self):
+    with self.hookLock:
+      startRefresh = not self.refreshing and time.monotonic() >= self.versionExpires
+      if startRefresh:
+        self.refreshing = True
+      version = self.version
+    if startRefresh:
+      threading.Thread(target=self.refreshVersion, name='ProcessLibraryVersion', daemon=True).start()
+    return version
+
+  def getOperationSubtree(self, operationBranch, depth):
+    return self.pool.call('getOperationSubtree', operationBranch, depth)
+
+  def getDescription(self, operationBranch):
+    description = self.pool.call('getDescription', operationBranch)
+    self.callCacheableHook('isDescriptionCacheable', operationBranch)
+    return description
+
+  def getParameters(self, operationBranch):
+    parameters = self.pool.call('getParameters', operationBranch)
+    self.callCacheableHook('isParametersCacheable', operationBranch)
+    return parameters
+
+  def isDescriptionCacheable(self, operationBranch):
+    return self.cachedHook('isDescriptionCacheable', operationBranch)
+
+  def isParametersCacheable(self, operationBranch):
+    return self.cachedHook('isParametersCacheable', operationBranch)
+
+  def submitOperation(self, operationBranch, command, servers):
+    return self.pool.call('submitOperation', operationBranch, command, servers)
+
+  def close(self):
+    self.pool.close()
@@ -0,0 +1,206 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import math
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+
+# Seconds, from a cached response to a slow library call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def formatValue(value):
+  if value == math.inf:
+    return '+Inf'
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def formatLabels(names, values, extra=()):
+  pairs = list(zip(names, values)) + list(extra)
+  if not pairs:
+    return ''
+  escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+  return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+  kind = None
+
+  def __init__(self, name, help, labelNames=()):
+    self.name = name
+    self.help = help
+    self.labelNames = labelNames
+    self.lock = threading.Lock()
+    registry.append(self)
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+    lines.extend(self.samples())
+    return lines
+
+
+class Counter(Metric):
+  kind = 'counter'
+
+  def __init__(self, name, help, labelNames=()):
+    super().__init__(name, help, labelNames)
+    self.values = {}   # label values -> count
+
+  def inc(self, *labels, amount=1):
+    with self.lock:
+      self.values[labels] = self.values.get(labels, 0) + amount
+
+  def samples(self):
+    with self.lock:
+      values = dict(self.values)
+    return [f'{self.name}{formatLabels(self.labelNames, labels)} {formatValue(value)}' for labels, value in values.items()]
+
+
+class Gauge(Metric):
+  """A value read when the metrics are rendered, from the function given to setFunction()."""
+  kind = 'gauge'
+
+  def __init__(self, name, help, labelNames=()):
+    super().__init__(name, help, labelNames)
+    self.function = None   # Returns {label values: value}
+
+  def setFunction(self, function):
+    self.function = function
+
+  def samples(self):
+    try:
+      values = self.function() if self.function else {}
+    except Exception as exc:
+      print(f'Gauge({self.name}), exception:', exc)
+      values = {}
+    return [f'{self.name}{formatLabels(self.labelNames, labels)} {formatValue(value)}' for labels, value in values.items()]
+
+
+class Histogram(Metric):
+  kind = 'histogram'
+
+  def __init__(self, name, help, labelNames=(), buckets=LATENCY_BUCKETS):
+    super().__init__(name, help, labelNames)
+    self.buckets = tuple(buckets) + (math.inf,)
+    self.values = {}   # label values -> [bucket counts..., sum]
+
+  def observe(self, value, *labels):
+    index = bisect_left(self.buckets, value)
+    with self.lock:
+      counts = self.values.get(labels)
+      if counts is None:
+        counts = self.values[labels] = [0] * len(self.buckets) + [0]
+      counts[index] += 1
+      counts[-1] += value
+
+  @contextmanager
+  def time(self, *labels):
+    startTime = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(time.perf_counter() - startTime, *labels)
+
+  def samples(self):
+    with self.lock:
+      values = {labels: list(counts) for labels, counts in self.values.items()}
+    lines = []
+    for labels, counts in values.items():
+      cumulative = 0
+      for bound, count in zip(self.buckets, counts):
+        cumulative += count
+        lines.append(f'{self.name}_bucket{formatLabels(self.labelNames, labels, [("le", formatValue(bound))])} {cumulative}')
+      lines.append(f'{self.name}_sum{formatLabels(self.labelNames, labels)} {formatValue(counts[-1])}')
+      lines.append(f'{self.name}_count{formatLabels(self.labelNames, labels)} {cumulative}')
+    return lines
+
+
+registry = []   # Every Metric, in the order they are rendered
+
+requestSeconds = Histogram('webcligui_request_duration_seconds', 'Time until the view returned its response', ('view', 'method'))
+requestsTotal = Counter('webcligui_requests_total', 'Requests served', ('view', 'method', 'status'))
+requestQueries = Histogram('webcligui_request_db_queries', 'Database queries per request', ('view',), QUERY_BUCKETS)
+libraryCallSeconds = Histogram('webcligui_library_call_duration_seconds', 'Duration of the LibraryAPI calls', ('library', 'method'))
+libraryImportSeconds = Gauge('webcligui_library_import_seconds', 'Time it took to import and instantiate the loaded libraries', ('library',))
+libraryCallErrors = Counter('webcligui_library_call_errors_total', 'LibraryAPI calls that raised an exception', ('library', 'method'))
+monitorSweepSeconds = Histogram('webcligui_monitor_check_duration_seconds',
+                                'Duration of checking the status files, of all tracked operations (sweep) or of changed ones (changes)',
+                                ('trigger',))
+monitorTracked = Gauge('webcligui_monitor_tracked_operations', 'Running operations followed by this process')
+monitorLeader = Gauge('webcligui_monitor_leader', '1 when this process holds the operation-monitor lease')
+queueInFlight = Gauge('webcligui_queue_in_flight_operations', 'Queued operations being submitted to their library')
+
+
+def render():
+  """The metrics in the Prometheus text exposition format."""
+  lines = []
+  for metric in registry:
+    lines.extend(metric.render())
+  return '\n'.join(lines) + '\n'
+
+
+# The queries of a request are counted in a list set by MetricsMiddleware, sync_to_async()
+# copies the context, so the queries a view runs on other threads are counted as well
+queryCounter = ContextVar('queryCounter', default=None)
+
+
+def countQuery(execute, sql, params, many, context):
+  counter = queryCounter.get()
+  if counter is not None:
+    counter[0] += 1
+  return execute(sql, params, many, context)
+
+
+def installQueryCounter(sender, connection, **kwargs):
+  if countQuery not in connection.execute_wrappers:
+    connection.execute_wrappers.append(countQuery)
+
+
+connection_created.connect(installQueryCounter)
+
+
+class MetricsMiddleware:
+  """Records the duration, the status and the number of database queries of every request, per view."""
+  sync_capable = True
+  async_capable = True
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+    self.isAsync = iscoroutinefunction(get_response)
+    if self.isAsync:
+      markcoroutinefunction(self)
+
+  def __call__(self, request):
+    if self.isAsync:
+      return self.acall(request)
+    counter = [0]
+    token = queryCounter.set(counter)
+    startTime = time.perf_counter()
+    try:
+      response = self.get_response(request)
+    finally:
+      queryCounter.reset(token)
+    self.record(request, response, time.perf_counter() - startTime, counter[0])
+    return response
+
+  async def acall(self, request):
+    counter = [0]
+    token = queryCounter.set(counter)
+    startTime = time.perf_counter()
+    try:
+      response = await self.get_response(request)
+    finally:
+      queryCounter.reset(token)
+    self.record(request, response, time.perf_counter() - startTime, counter[0])
+    return response
+
+  def record(self, request, response, seconds, numQueries):
+    match = getattr(request, 'resolver_match', None)
+    view = match.url_name or match.view_name if match else 'unmatched'
+    requestSeconds.observe(seconds, view, request.method)
+    requestsTotal.inc(view, request.method, str(response.status_code))
+    requestQueries.observe(numQueries, view)
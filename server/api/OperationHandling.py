@@ -1,18 +1,55 @@
 
-from collections import deque
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 import re
 import threading
+import time
+from uuid import UUID, uuid4
 
-from webcligui_api import LibraryAPI, OperationState
-from .models import Status
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+from webcligui_api import AsyncLibraryAPI, LibraryAPI, OperationState, OperationStatusStart
+from .models import Status, operationPath
 from .constants import OPERATION_ROOT_DIRECTORY
+from .EventBroker import eventBroker
+from .EventRelay import EventRelay
+from .Lease import DbLease
+from .Metrics import monitorLeader, monitorSweepSeconds, monitorTracked
+from .OperationQueue import FINAL_STATES, OperationQueue
+from .ResponseCache import statusCount
+from .Scheduler import DEFAULT_PRIORITY
+from .StatusTailer import OutputFollower, StatusTailer
+from .StatusWatcher import StatusWatcher
 
 STATUS_FILE_NAME = 'neda_status.txt'
 OPERATION_FILE_NAME ='neda_operation.txt'
 CHECK_UUIDS_TIMER_INTERVAL = 15
+CHECK_UUIDS_SAFETY_INTERVAL = 300   # Sweep interval when inotify is used, catches anything it missed
+MONITOR_LEASE_NAME = 'operation-monitor'
+MONITOR_LEASE_TTL = 4 * CHECK_UUIDS_TIMER_INTERVAL
+RECONCILE_MARGIN = timedelta(minutes=10)   # How far back to look for operations submitted by other processes
+UNTRACKED_STATES = [OperationState.QUEUED.value, *FINAL_STATES]
+
+ELAPSED_TIME_RE = re.compile(r"Elapsed time:\s*(\d+):(\d+):(\d+)(?:\.(\d+))?,\s*(.*)\n")
+
+def parseStatusLine(line):
+  """Returns (elapsed_time, statusText) for an 'Elapsed time' line, None for any other line."""
+  match = ELAPSED_TIME_RE.match(line)
+  if not match:
+    return None
+  h, m, s, us, statusText = match.groups()
+  elapsed_time = timedelta(
+    hours=int(h),
+    minutes=int(m),
+    seconds=int(s),
+    microseconds=int(us or 0)
+  )
+  return elapsed_time, statusText
 
 @dataclass
 class OperationStatus:
@@ -24,59 +61,358 @@ class OperationStatus:
     elapsed_time: timedelta | None = None
 
 class OperationHandling:
+  """
+  Monitors the running operations. Every process has one, but only the one holding the
+  monitor lease, on any host sharing the database, tracks and checks the operations. It
+  rebuilds the set of operations to track from the unfinished Status rows when it takes
+  the lease, and picks up operations submitted by other processes as they appear.
+  When OPERATION_EVENT_RELAY_INTERVAL is set the status events reach the streams of the other
+  processes through the EventRelay, each process follows the output of the operations its own
+  streams ask for.
+  """
   uuids = {}
 
-  def __init__(self):
+  def __init__(self, getLibraryApi=None):
     self.uuidsLock = threading.Lock()
+    self.checkLock = threading.Lock()
+    self.tailers = {}   # uuid -> StatusTailer, only touched while holding checkLock
+    self.lastStatus = {}   # uuid -> (status, elapsed_time) last written, only touched while holding checkLock
+    self.followersLock = threading.Lock()
+    self.followers = {}   # uuid -> [OutputFollower, number of streams following it]
+    self.lease = DbLease(MONITOR_LEASE_NAME, MONITOR_LEASE_TTL)
+    self.isLeader = False
+    self.lastSweep = None
+    self.lastReconcile = None
+    self.watcher = self.createWatcher()
+    self.queue = None
+    if getLibraryApi is not None and settings.OPERATION_QUEUE_WORKERS > 0:
+      self.queue = OperationQueue(self, getLibraryApi, settings.OPERATION_QUEUE_WORKERS)
+    monitorTracked.setFunction(lambda: {(): len(self.uuids)})
+    monitorLeader.setFunction(lambda: {(): int(self.isLeader)})
+    self.relay = EventRelay(self.lease.owner) if settings.OPERATION_EVENT_RELAY_INTERVAL > 0 else None
+    atexit.register(self.releaseLease)
     self.runInterval()
+    if self.relay is not None:
+      threading.Thread(target=self.runRelay, name='OperationEventRelay', daemon=True).start()
+
+  def createWatcher(self):
+    mode = settings.OPERATION_MONITOR_MODE
+    if mode == 'poll':
+      return None
+    try:
+      return StatusWatcher(self.onFolderChanges, self.checkUuids)
+    except OSError as exc:
+      if mode == 'inotify':
+        raise
+      print('OperationHandling: inotify not available, falling back to polling:', exc)
+      return None
+
+  def onFolderChanges(self, changed):
+    statusUuids = []
+    for uuid, fileNames in changed.items():
+      self.publishOutput(uuid, fileNames)
+      if STATUS_FILE_NAME in fileNames:
+        statusUuids.append(uuid)
+    if statusUuids:
+      with self.uuidsLock:
+        folders = {uuid: self.uuids[uuid] for uuid in statusUuids if uuid in self.uuids}
+      try:
+        self.checkUuids(folders)
+      finally:
+        close_old_connections()
+
+  def followOutput(self, uuid):
+    """Starts publishing the lines appended to the files of a running operation."""
+    with self.uuidsLock:
+      folder = self.uuids.get(uuid)
+    if folder is None:
+      # Tracked by the process holding the monitor lease, or not running
+      folder = Status.objects.filter(id=uuid).exclude(status__in=UNTRACKED_STATES).values_list('directory', flat=True).first()
+      if not folder:
+        return False
+    with self.followersLock:
+      if uuid in self.followers:
+        self.followers[uuid][1] += 1
+        return True
+      try:
+        self.followers[uuid] = [OutputFollower(OPERATION_ROOT_DIRECTORY / folder), 1]
+      except OSError as exc:
+        print(f'OperationHandling.followOutput({uuid}), exception:', exc)
+        return False
+    return True
+
+  def unfollowOutput(self, uuid):
+    with self.followersLock:
+      follower = self.followers.get(uuid)
+      if follower is None:
+        return
+      follower[1] -= 1
+      if follower[1] <= 0:
+        del self.followers[uuid]
+
+  def publishOutput(self, uuid, fileNames=None):
+    with self.followersLock:
+      follower = self.followers.get(uuid)
+      if follower is None:
+        return
+      follower = follower[0]
+      try:
+        if fileNames is None:
+          fileNames = follower.fileNames()
+        for fileName in fileNames:
+          while lines := follower.newLines(fileName):
+            eventBroker.publish(uuid, {'type': 'output', 'uuid': uuid, 'file': fileName, 'lines': lines})
+      except OSError as exc:
+        print(f'OperationHandling.publishOutput({uuid}), exception:', exc)
+
+  def publishFollowedOutput(self):
+    """Publishes the output of the followed operations this process does not track, no watcher reports their changes."""
+    with self.followersLock:
+      followed = list(self.followers)
+    with self.uuidsLock:
+      untracked = [uuid for uuid in followed if uuid not in self.uuids]
+    for uuid in untracked:
+      self.publishOutput(uuid)
+
+  def runRelay(self):
+    while True:
+      try:
+        self.relay.poll()
+        self.publishFollowedOutput()
+      except Exception as exc:
+        print('OperationHandling.runRelay(), exception:', exc)
+      finally:
+        close_old_connections()
+      time.sleep(settings.OPERATION_EVENT_RELAY_INTERVAL)
 
   def runInterval(self):
     startTime = datetime.now()
-    self.checkUuids()
+    try:
+      self.monitorTick()
+    except Exception as exc:
+      print('OperationHandling.runInterval(), exception:', exc)
+    finally:
+      # Every interval runs in a new Timer thread, its connection would stay open (or out of the pool) otherwise
+      connections.close_all()
 
     diffTime = max(CHECK_UUIDS_TIMER_INTERVAL - (datetime.now() - startTime).total_seconds(), 0)
     timer = threading.Timer(diffTime, self.runInterval)
     timer.daemon = True
     timer.start()
 
-  def checkUuids(self):
+  def monitorTick(self):
+    if not self.updateLeadership():
+      return
+    if self.relay is not None:
+      self.relay.prune()
+    self.trackUnfinished(self.lastReconcile)
+
+    interval = CHECK_UUIDS_SAFETY_INTERVAL if self.watcher else CHECK_UUIDS_TIMER_INTERVAL
+    now = time.monotonic()
+    if self.lastSweep is None or now - self.lastSweep >= interval - 1:
+      self.lastSweep = now
+      self.checkUuids()
+
+  def updateLeadership(self):
+    isLeader = self.lease.acquire()
+    if isLeader and not self.isLeader:
+      print('OperationHandling: this process monitors the operations now')
+      self.isLeader = True
+      self.lastReconcile = None
+    elif not isLeader and self.isLeader:
+      print('OperationHandling: another process took over monitoring the operations')
+      self.isLeader = False
+      self.untrackAll()
+    return isLeader
+
+  def releaseLease(self):
+    # Lets another process take over right away instead of after the lease expired
+    if self.isLeader:
+      try:
+        self.lease.release()
+      except Exception as exc:
+        print('OperationHandling.releaseLease(), exception:', exc)
+
+  def trackUnfinished(self, startedAfter):
+    """Tracks the unfinished operations in the Status table, only those started after startedAfter if given."""
+    reconcileTime = timezone.now()
+    qs = Status.objects.exclude(status__in=UNTRACKED_STATES)
+    if startedAfter is not None:
+      qs = qs.filter(start_time__gte=startedAfter - RECONCILE_MARGIN)
+    newFolders = {}
     with self.uuidsLock:
-      uuidsCopy = deepcopy(self.uuids)
-    for uuid, folder in uuidsCopy.items():
-      print('  uuid:', uuid)
-      self.checkUuid(uuid, folder)
-          
-  def checkUuid(self, uuid, folder):
-    status_filename = OPERATION_ROOT_DIRECTORY / folder / STATUS_FILE_NAME
-    with status_filename.open("r") as statusFile:
-      lastLine = deque(statusFile, maxlen=1)[0] if statusFile else None
-    print(lastLine)
-    if not lastLine.startswith('Elapsed time'):
+      for id, directory in qs.values_list('id', 'directory'):
+        uuid = str(id)
+        if uuid not in self.uuids:
+          self.uuids[uuid] = directory
+          newFolders[uuid] = directory
+    self.lastReconcile = reconcileTime
+
+    for uuid, folder in newFolders.items():
+      self.watch(uuid, folder)
+    if newFolders:
+      self.checkUuids(newFolders)
+
+  def track(self, uuid, folder):
+    with self.uuidsLock:
+      self.uuids[uuid] = folder
+    self.watch(uuid, folder)
+    # The operation may have written to its status file before the watch was in place
+    self.checkUuids({uuid: folder})
+
+  def watch(self, uuid, folder):
+    if not self.watcher:
       return
-    match = re.match(r"Elapsed time:\s*(\d+):(\d+):(\d+)(?:\.(\d+))?,\s*(.*)\n", lastLine)
-    if match:
-      h, m, s, us, statusText = match.groups()
-      elapsed_time = timedelta(
-        hours=int(h),
-        minutes=int(m),
-        seconds=int(s),
-        microseconds=int(us or 0)
-      )
-
-    stat = Status.objects.get(id=uuid)
-    stat.elapsed_time = elapsed_time
-    stat.status = statusText
-    stat.save()
-
-    if statusText == OperationState.FINISHED.value:
+    try:
+      self.watcher.addWatch(uuid, OPERATION_ROOT_DIRECTORY / folder)
+    except OSError as exc:
+      print(f'OperationHandling.watch({uuid}), cannot watch', folder, exc)
+
+  def untrackAll(self):
+    with self.uuidsLock:
+      uuids = list(self.uuids)
+      self.uuids.clear()
+    with self.checkLock:
+      self.tailers.clear()
+      self.lastStatus.clear()
+    if self.watcher:
+      for uuid in uuids:
+        self.watcher.removeWatch(uuid)
+
+  def checkUuids(self, folders=None):
+    """Checks the status files of the given {uuid: folder}, all tracked operations by default."""
+    with monitorSweepSeconds.time('sweep' if folders is None else 'changes'):
+      self.checkFolders(folders)
+
+  def checkFolders(self, folders):
+    if folders is None:
       with self.uuidsLock:
-        del self.uuids[uuid]
+        folders = deepcopy(self.uuids)
+      for uuid in folders:
+        self.publishOutput(uuid)
 
-  def submitOperation(self, libraryApiImpl: LibraryAPI, operationBranch: list[str], command: list[str], servers: list[str]):
+    with self.checkLock:
+      changes = []
+      for uuid, folder in folders.items():
+        print('  uuid:', uuid)
+        change = self.readStatusChange(uuid, folder)
+        if change is not None:
+          changes.append(change)
+      if changes:
+        self.saveStatusChanges(changes)
 
+  def readStatusChange(self, uuid, folder):
+    """Returns a Status holding the new status and elapsed_time, or None when they did not change."""
+    try:
+      tailer = self.tailers.get(uuid)
+      if tailer is None:
+        tailer = self.tailers[uuid] = StatusTailer(OPERATION_ROOT_DIRECTORY / folder / STATUS_FILE_NAME)
+      lastLine = tailer.newLastLine()
+    except Exception as exc:
+      print(f'OperationHandling.readStatusChange({uuid}), exception:', exc)
+      self.tailers.pop(uuid, None)   # Re-read the last line on the next check
+      return None
+    if lastLine is None:
+      return None
+    print(lastLine)
+    parsed = parseStatusLine(lastLine)
+    if parsed is None:
+      return None
+    elapsed_time, statusText = parsed
+    if self.lastStatus.get(uuid) == (statusText, elapsed_time):
+      return None
+    return Status(id=uuid, status=statusText, elapsed_time=elapsed_time)
+
+  def saveStatusChanges(self, changes):
+    """Writes all changes of one check in a single transaction, then publishes them."""
+    try:
+      with transaction.atomic():
+        Status.objects.bulk_update(changes, ['status', 'elapsed_time'])
+    except Exception as exc:
+      print('OperationHandling.saveStatusChanges(), exception:', exc)
+      for stat in changes:
+        self.tailers.pop(str(stat.id), None)   # Re-read the last line on the next check
+      return
+
+    finished = []
+    self.publishEvents([self.statusEvent(str(stat.id), stat.status, stat.elapsed_time) for stat in changes])
+    for stat in changes:
+      uuid = str(stat.id)
+      self.lastStatus[uuid] = (stat.status, stat.elapsed_time)
+
+      if stat.status in FINAL_STATES:
+        finished.append(uuid)
+        with self.uuidsLock:
+          self.uuids.pop(uuid, None)
+        self.tailers.pop(uuid, None)
+        self.lastStatus.pop(uuid, None)
+        if self.watcher:
+          self.watcher.removeWatch(uuid)
+
+    if finished and self.queue is not None:
+      self.queue.markDone(finished)
+
+  def publishEvents(self, events):
+    """Delivers the (uuid, event) pairs to the streams of this process and, through the relay, of the others."""
+    for uuid, event in events:
+      eventBroker.publish(uuid, event)
+    if self.relay is not None and events:
+      try:
+        self.relay.record(events)
+      except Exception as exc:
+        print('OperationHandling.publishEvents(), exception:', exc)
+
+  def statusEvent(self, uuid, statusText, elapsed_time=None):
+    return uuid, {'type': 'status', 'uuid': uuid, 'status': statusText,
+                  'elapsed_time': elapsed_time.total_seconds() if elapsed_time else None}
+
+  def startedEvent(self, status: OperationStatus):
+    return status.uuid, {'type': 'status', 'uuid': status.uuid, 'operation_branch': status.operation_branch,
+                         'start_time': status.start_time.isoformat(), 'status': status.status,
+                         'folder': status.folder, 'elapsed_time': None}
+
+  def publishStatus(self, uuid, statusText, elapsed_time=None):
+    self.publishEvents([self.statusEvent(uuid, statusText, elapsed_time)])
+
+  def submitOperation(self, libraryApiImpl: LibraryAPI, operationBranch: list[str], command: list[str], servers: list[str],
+                      username: str = '', priority: int = DEFAULT_PRIORITY):
+    """
+    Puts the operation in the queue and returns its queued status right away, or, when
+    the queue is disabled, submits it to the library and returns its started status.
+    """
+    if self.queue is None:
+      return self.startOperation(libraryApiImpl, operationBranch, command, servers)
+    return self.enqueueOperations([(operationBranch, command, servers, priority)], username)[0]
+
+  def submitOperations(self, operations: list[tuple], parallelism: int, username: str = ''):
+    """
+    Submits many operations, each a (libraryApiImpl, operationBranch, command, servers, priority) tuple.
+    Returns per operation its OperationStatus, or the exception raised by its library.
+    Without the queue at most parallelism library calls run at the same time.
+    """
+    if self.queue is not None:
+      return self.enqueueOperations([operation[1:] for operation in operations], username)
+    return self.startOperations([operation[:4] for operation in operations], parallelism)
+
+  def enqueueOperations(self, operations: list[tuple], username: str = ''):
+    """Queues (operationBranch, command, servers, priority) tuples, their Status rows are created in one transaction."""
+    queued = [(str(uuid4()), *operation) for operation in operations]
+    enqueued_at = self.queue.enqueue(queued, username)
+    statusList = [OperationStatus(uuid=uuid, operation_branch=operationBranch, start_time=enqueued_at,
+                                  elapsed_time=None, status=OperationState.QUEUED.value, folder='')
+                  for uuid, operationBranch, _command, _servers, _priority in queued]
+    self.publishEvents([self.startedEvent(status) for status in statusList])
+    return statusList
+
+  def launchOperation(self, libraryApiImpl: LibraryAPI, operationBranch: list[str], command: list[str], servers: list[str],
+                      queuedUuid: str | None = None):
+    """Calls the library and writes the operation and status files to the folder it returned, no database access."""
     operationStatusStart = libraryApiImpl.submitOperation(operationBranch[1:], command, servers)
+    return self.writeOperationFiles(operationBranch, command, operationStatusStart, queuedUuid)
 
-    status = OperationStatus(uuid=operationStatusStart.uuid, operation_branch=operationBranch, 
+  def writeOperationFiles(self, operationBranch: list[str], command: list[str], operationStatusStart: OperationStatusStart,
+                          queuedUuid: str | None = None):
+    status = OperationStatus(uuid=queuedUuid or operationStatusStart.uuid, operation_branch=operationBranch, 
                              start_time=operationStatusStart.start_time, elapsed_time=None,
                             status=OperationState.STARTED.value, folder=operationStatusStart.folder)
 
@@ -85,6 +421,8 @@ class OperationHandling:
     operation_filename = folder / OPERATION_FILE_NAME
     with operation_filename.open("w") as opFile:
         opFile.write(f"uuid: {status.uuid}\n")
+        if queuedUuid:
+          opFile.write(f"library_uuid: {operationStatusStart.uuid}\n")
         opFile.write(f"operationBranch: {operationBranch}\n")
         opFile.write(f"command: {command}\n")
         opFile.write(f"folder: {status.folder}\n")
@@ -94,10 +432,58 @@ class OperationHandling:
     with status_filename.open("a") as statusFile:      
         statusFile.write(f"Start time: {status.start_time.isoformat()}, {status.status}\n")
 
-    Status.objects.create(id=status.uuid, operation_branch=operationBranch, start_time=status.start_time,
-                          status=status.status, directory=status.folder)
-    
-    with self.uuidsLock:
-      self.uuids[status.uuid] = status.folder
-    
     return status
+
+  def announceStarted(self, statusList: list[OperationStatus]):
+    self.publishEvents([self.startedEvent(status) for status in statusList])
+    for status in statusList:
+      # Otherwise the process holding the monitor lease picks it up from the Status table
+      if self.isLeader:
+        self.track(str(UUID(str(status.uuid))), status.folder)
+
+  def startOperation(self, libraryApiImpl: LibraryAPI, operationBranch: list[str], command: list[str], servers: list[str],
+                     queuedUuid: str | None = None):
+    """Submits the operation to the library. A queued operation keeps the uuid it got when it was queued."""
+    operationStatusStart = libraryApiImpl.submitOperation(operationBranch[1:], command, servers)
+    return self.recordStarted(operationBranch, command, operationStatusStart, queuedUuid)
+
+  def recordStarted(self, operationBranch: list[str], command: list[str], operationStatusStart: OperationStatusStart,
+                    queuedUuid: str | None = None):
+    status = self.writeOperationFiles(operationBranch, command, operationStatusStart, queuedUuid)
+
+    if queuedUuid:
+      Status.objects.filter(id=queuedUuid).update(start_time=status.start_time, status=status.status,
+                                                  directory=status.folder)
+    else:
+      Status.objects.create(id=status.uuid, operation_branch=operationBranch, start_time=status.start_time,
+                            status=status.status, directory=status.folder)
+
+    self.announceStarted([status])
+    return status
+
+  async def submitOperationAsync(self, libraryApiImpl: AsyncLibraryAPI, operationBranch: list[str], command: list[str],
+                                 servers: list[str], username: str = '', priority: int = DEFAULT_PRIORITY):
+    """submitOperation() for the async views, the library call is awaited instead of blocking a thread."""
+    if self.queue is not None:
+      statusList = await sync_to_async(self.enqueueOperations)([(operationBranch, command, servers, priority)], username)
+      return statusList[0]
+    operationStatusStart = await libraryApiImpl.submitOperation(operationBranch[1:], command, servers)
+    return await sync_to_async(self.recordStarted)(operationBranch, command, operationStatusStart)
+
+  def startOperations(self, operations: list[tuple], parallelism: int):
+    """Calls the libraries concurrently, then creates the Status rows of the started operations in one query."""
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(operations)))) as executor:
+      futures = [executor.submit(self.launchOperation, *operation) for operation in operations]
+    results = [future.exception() or future.result() for future in futures]
+
+    started = [result for result in results if isinstance(result, OperationStatus)]
+    Status.objects.bulk_create([
+      Status(id=status.uuid, operation_branch=status.operation_branch, operation_path=operationPath(status.operation_branch),
+             start_time=status.start_time, status=status.status, directory=status.folder)
+      for status in started
+    ])
+    # bulk_create() does not send post_save
+    statusCount.invalidate()
+
+    self.announceStarted(started)
+    return results
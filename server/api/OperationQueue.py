@@ -0,0 +1,167 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from webcligui_api import OperationState
+from .Metrics import queueInFlight
+from .models import QueuedOperation, Status, operationPath
+from .ResponseCache import statusCount
+from .Scheduler import Candidate, Scheduler, parseLimits
+
+QUEUE_POLL_INTERVAL = 1   # Seconds, picks up operations queued by other processes
+FINAL_STATES = [OperationState.FINISHED.value, OperationState.FAILED.value]
+
+
+class OperationQueue:
+  """
+  Durable queue of submitted operations in the QueuedOperation table. Any process can
+  enqueue; the process holding the monitor lease drains the queue with a pool of worker
+  threads that call the library's submitOperation(). Which queued operation goes next
+  is up to the Scheduler, an operation counts as running until it is marked done.
+  """
+
+  def __init__(self, operationHandling, getLibraryApi, numWorkers):
+    self.operationHandling = operationHandling
+    self.getLibraryApi = getLibraryApi
+    self.numWorkers = numWorkers
+    self.executor = ThreadPoolExecutor(max_workers=numWorkers, thread_name_prefix='OperationQueue')
+    self.wakeUp = threading.Event()
+    self.inFlightLock = threading.Lock()
+    self.inFlight = set()   # ids handed to the executor and not done yet
+    self.wasLeader = False
+    self.scheduler = Scheduler(settings.OPERATION_SERVER_CONCURRENCY, settings.OPERATION_LIBRARY_CONCURRENCY,
+                               parseLimits(settings.OPERATION_SERVER_LIMITS), parseLimits(settings.OPERATION_LIBRARY_LIMITS))
+
+    queueInFlight.setFunction(lambda: {(): len(self.inFlight)})
+
+    thread = threading.Thread(target=self.dispatchLoop, name='OperationQueueDispatcher', daemon=True)
+    thread.start()
+
+  def enqueue(self, operations, username=''):
+    """Stores (uuid, operationBranch, command, servers, priority) tuples, returns the time they were queued at."""
+    now = timezone.now()
+    with transaction.atomic():
+      Status.objects.bulk_create([
+        Status(id=uuid, operation_branch=operationBranch, operation_path=operationPath(operationBranch),
+               start_time=now, status=OperationState.QUEUED.value, directory='')
+        for uuid, operationBranch, _command, _servers, _priority in operations
+      ])
+      QueuedOperation.objects.bulk_create([
+        QueuedOperation(id=uuid, operation_branch=operationBranch, command=command, servers=servers,
+                        username=username, priority=priority, enqueued_at=now)
+        for uuid, operationBranch, command, servers, priority in operations
+      ])
+    # bulk_create() does not send post_save
+    statusCount.invalidate()
+    self.wakeUp.set()
+    return now
+
+  def dispatchLoop(self):
+    while True:
+      self.wakeUp.wait(QUEUE_POLL_INTERVAL)
+      self.wakeUp.clear()
+      try:
+        self.dispatch()
+      except Exception as exc:
+        print('OperationQueue.dispatch(), exception:', exc)
+      finally:
+        close_old_connections()
+
+  def dispatch(self):
+    isLeader = self.operationHandling.isLeader
+    if isLeader and not self.wasLeader:
+      self.requeueAbandoned()
+    self.wasLeader = isLeader
+    if not isLeader:
+      return
+
+    with self.inFlightLock:
+      freeWorkers = self.numWorkers - len(self.inFlight)
+    if freeWorkers <= 0:
+      return
+
+    queued, running = self.loadCandidates()
+    for candidate in self.scheduler.select(queued, running, freeWorkers):
+      queuedOperation = QueuedOperation.objects.filter(id=candidate.id).first()
+      if queuedOperation is not None and self.claim(queuedOperation):
+        with self.inFlightLock:
+          self.inFlight.add(queuedOperation.id)
+        self.executor.submit(self.runQueued, queuedOperation)
+
+  def loadCandidates(self):
+    """Returns the queued and the running operations as scheduler candidates."""
+    queued = []
+    running = []
+    rows = QueuedOperation.objects.filter(state__in=[QueuedOperation.QUEUED, *QueuedOperation.RUNNING_STATES]).values_list(
+      'id', 'username', 'priority', 'enqueued_at', 'operation_branch', 'servers', 'state'
+    )
+    for id, username, priority, enqueued_at, operationBranch, servers, state in rows:
+      candidate = Candidate(id=id, username=username, priority=priority, enqueued_at=enqueued_at,
+                            libraryName=operationBranch[0], servers=servers)
+      (queued if state == QueuedOperation.QUEUED else running).append(candidate)
+    return queued, running
+
+  def queueInfo(self, uuids):
+    """Returns {uuid: (queue position or None, seconds waited in the queue)} for those of the uuids that were queued."""
+    rows = QueuedOperation.objects.filter(id__in=uuids).values_list('id', 'state', 'enqueued_at', 'dispatched_at')
+    if not rows:
+      return {}
+    now = timezone.now()
+    positions = {}
+    if any(state == QueuedOperation.QUEUED for _id, state, _enqueued_at, _dispatched_at in rows):
+      positions = self.scheduler.positions(*self.loadCandidates())
+    return {
+      id: (positions.get(id), ((dispatched_at or now) - enqueued_at).total_seconds())
+      for id, state, enqueued_at, dispatched_at in rows
+    }
+
+  def markDone(self, uuids):
+    """Called when operations finished, frees their place in the limits of the scheduler."""
+    if QueuedOperation.objects.filter(id__in=uuids, state__in=QueuedOperation.RUNNING_STATES).update(state=QueuedOperation.DONE):
+      self.wakeUp.set()
+
+  def claim(self, queued):
+    """Moves the row from queued to dispatching, False when another process got there first."""
+    queued.dispatched_at = timezone.now()
+    return QueuedOperation.objects.filter(id=queued.id, state=QueuedOperation.QUEUED).update(
+      state=QueuedOperation.DISPATCHING, dispatched_at=queued.dispatched_at
+    ) == 1
+
+  def requeueAbandoned(self):
+    """Operations a previous lease holder claimed but never got submitted go back into the queue."""
+    with self.inFlightLock:
+      inFlight = set(self.inFlight)
+    abandoned = QueuedOperation.objects.filter(state=QueuedOperation.DISPATCHING).exclude(id__in=inFlight)
+    numRequeued = abandoned.update(state=QueuedOperation.QUEUED, dispatched_at=None)
+    if numRequeued:
+      print(f'OperationQueue: requeued {numRequeued} abandoned operation(s)')
+
+    # Operations that finished while no process was monitoring
+    submitted = QueuedOperation.objects.filter(state=QueuedOperation.SUBMITTED).values('id')
+    self.markDone(Status.objects.filter(id__in=submitted, status__in=FINAL_STATES).values_list('id', flat=True))
+
+  def runQueued(self, queued):
+    try:
+      libraryName = queued.operation_branch[0]
+      libraryApiImpl = self.getLibraryApi(libraryName)
+      if libraryApiImpl is None:
+        raise Exception(f'Libraryname "{libraryName}" not known!')
+      self.operationHandling.startOperation(libraryApiImpl, queued.operation_branch, queued.command,
+                                            queued.servers, queuedUuid=str(queued.id))
+      # Unless the monitor already saw it finish
+      QueuedOperation.objects.filter(id=queued.id, state=QueuedOperation.DISPATCHING).update(state=QueuedOperation.SUBMITTED)
+
+    except Exception as exc:
+      print(f'OperationQueue.runQueued({queued.id}), exception:', exc)
+      with transaction.atomic():
+        QueuedOperation.objects.filter(id=queued.id).update(state=QueuedOperation.FAILED, error=str(exc))
+        Status.objects.filter(id=queued.id).update(status=OperationState.FAILED.value)
+      self.operationHandling.publishStatus(str(queued.id), OperationState.FAILED.value)
+
+    finally:
+      with self.inFlightLock:
+        self.inFlight.discard(queued.id)
+      close_old_connections()
+      self.wakeUp.set()
@@ -0,0 +1,52 @@
+from webcligui_api import Operation, OperationFolder, SlottedOperation, SlottedOperationFolder
+
+
+class NodeNotFound(Exception):
+  pass
+
+
+FOLDER_TYPES = (OperationFolder, SlottedOperationFolder)
+
+
+def compactTree(node):
+  """
+  Returns the hierarchy below node made of SlottedOperation and SlottedOperationFolder, which take
+  less memory. The slotted parts of the hierarchy are kept, a library building its hierarchy from
+  the slotted classes shares it with the cache instead of having it copied.
+  """
+  if isinstance(node, SlottedOperationFolder):
+    portfolio = [compactTree(child) for child in node.portfolio]
+    if all(compact is child for compact, child in zip(portfolio, node.portfolio)):
+      return node
+    return SlottedOperationFolder(name=node.name, portfolio=portfolio)
+  if isinstance(node, OperationFolder):
+    return SlottedOperationFolder(name=node.name, portfolio=[compactTree(child) for child in node.portfolio])
+  if isinstance(node, Operation):
+    return SlottedOperation(name=node.name, operation_type=node.operation_type, operation_module=node.operation_module)
+  return node
+
+
+def findNode(root, operationBranch):
+  """Returns the Operation or OperationFolder at operationBranch below root, None when it does not exist."""
+  node = root
+  for name in operationBranch:
+    if not isinstance(node, FOLDER_TYPES):
+      return None
+    node = next((child for child in node.portfolio if child.name == name), None)
+    if node is None:
+      return None
+  return node
+
+
+def subtreeJson(node, depth):
+  """
+  Converts node to the JSON of the subtree endpoint: the fields of the dataclass, with the
+  portfolio of folders replaced by depth levels of nodes. Every folder carries child_count,
+  the folders at the deepest level have no portfolio; their children are not sent.
+  """
+  if not isinstance(node, FOLDER_TYPES):
+    return node
+  data = {'name': node.name, 'child_count': len(node.portfolio)}
+  if depth > 0:
+    data['portfolio'] = [subtreeJson(child, depth - 1) for child in node.portfolio]
+  return data
@@ -0,0 +1,166 @@
+from collections import OrderedDict
+import hashlib
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+BRANCH_CACHE_SIZE = 4096   # Number of getDescription/getParameters responses kept
+STATUS_COUNT_TTL = 10      # Seconds the number of Status rows is reused
+
+
+def moduleMtime(libraryApiImpl):
+  """mtime of the file the library class was imported from, it changes when the library is upgraded."""
+  while hasattr(libraryApiImpl, 'wrapped'):   # See LibraryAdapters
+    libraryApiImpl = libraryApiImpl.wrapped
+  # Libraries hosted by worker processes are not imported here, see LibraryWorkers
+  path = getattr(libraryApiImpl, 'moduleFile', None)
+  if path is None:
+    module = sys.modules.get(type(libraryApiImpl).__module__)
+    path = getattr(module, '__file__', None)
+  if not path:
+    return None
+  try:
+    return os.stat(path).st_mtime_ns
+  except OSError:
+    return None
+
+
+def hierarchyVersion(libraryApiImpl):
+  # Libraries registered before LibraryAPI had the hook may not implement it
+  versionHook = getattr(libraryApiImpl, 'getOperationHierarchyVersion', None)
+  return (moduleMtime(libraryApiImpl), versionHook() if versionHook else None)
+
+
+@dataclass
+class HierarchyEntry:
+  version: tuple
+  body: bytes
+  etag: str
+  tree: object = None   # The hierarchy as SlottedOperationFolder, sliced by the subtree requests of libraries without getOperationSubtree()
+  msgpackBody: bytes | None = None   # The body as MessagePack, converted the first time it is asked for
+
+
+class HierarchyCache:
+  """
+  Serialized operation hierarchy per library. An entry is valid as long as the version
+  it was built for, see hierarchyVersion(), is unchanged and it was not invalidated.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.entries = {}   # library name -> HierarchyEntry
+
+  def lookup(self, libraryName, version):
+    with self.lock:
+      entry = self.entries.get(libraryName)
+    if entry is None or entry.version != version:
+      return None
+    return entry
+
+  def store(self, libraryName, version, body, tree=None):
+    entry = HierarchyEntry(version=version, body=body, etag=hashlib.sha256(body).hexdigest()[:32], tree=tree)
+    with self.lock:
+      self.entries[libraryName] = entry
+    return entry
+
+  def invalidate(self, libraryName=None):
+    with self.lock:
+      if libraryName is None:
+        self.entries.clear()
+      else:
+        self.entries.pop(libraryName, None)
+
+
+def combinedEtag(etags):
+  return '"' + hashlib.sha256(':'.join(etags).encode()).hexdigest()[:32] + '"'
+
+
+def etagMatches(ifNoneMatch, etag):
+  if not ifNoneMatch:
+    return False
+  for candidate in ifNoneMatch.split(','):
+    candidate = candidate.strip()
+    if candidate == '*' or candidate.removeprefix('W/') == etag:
+      return True
+  return False
+
+
+class BranchCache:
+  """
+  Bounded LRU of serialized getDescription/getParameters responses, keyed by library name,
+  method and operation branch. Entries also carry the hierarchyVersion() they were built for.
+  """
+
+  def __init__(self, maxSize=BRANCH_CACHE_SIZE):
+    self.maxSize = maxSize
+    self.lock = threading.Lock()
+    self.entries = OrderedDict()   # (library name, method, branch tuple) -> (version, body)
+
+  def lookup(self, libraryName, method, operationBranch, version):
+    key = (libraryName, method, tuple(operationBranch))
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return None
+      if entry[0] != version:
+        del self.entries[key]
+        return None
+      self.entries.move_to_end(key)
+      return entry[1]
+
+  def store(self, libraryName, method, operationBranch, version, body):
+    key = (libraryName, method, tuple(operationBranch))
+    with self.lock:
+      self.entries[key] = (version, body)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.maxSize:
+        self.entries.popitem(last=False)
+
+  def invalidate(self, libraryName=None):
+    with self.lock:
+      if libraryName is None:
+        self.entries.clear()
+        return
+      for key in [key for key in self.entries if key[0] == libraryName]:
+        del self.entries[key]
+
+
+CACHEABLE_HOOKS = {'description': 'isDescriptionCacheable', 'parameters': 'isParametersCacheable'}
+
+
+def isCacheable(libraryApiImpl, method, operationBranch):
+  """Asks the library's isDescriptionCacheable/isParametersCacheable hook, cacheable when it has none."""
+  hookName = CACHEABLE_HOOKS.get(method)
+  hook = getattr(libraryApiImpl, hookName, None) if hookName else None
+  return hook(operationBranch) if hook else True
+
+
+class TimedValue:
+  """A single value that is recomputed after ttl seconds or when invalidated."""
+
+  def __init__(self, ttl):
+    self.ttl = ttl
+    self.lock = threading.Lock()
+    self.value = None
+    self.expires = 0
+
+  def get(self, compute):
+    with self.lock:
+      if time.monotonic() < self.expires:
+        return self.value
+    value = compute()
+    with self.lock:
+      self.value = value
+      self.expires = time.monotonic() + self.ttl
+    return value
+
+  def invalidate(self):
+    with self.lock:
+      self.expires = 0
+
+
+hierarchyCache = HierarchyCache()
+branchCache = BranchCache()
+statusCount = TimedValue(STATUS_COUNT_TTL)
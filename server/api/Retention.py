@@ -0,0 +1,185 @@
+from dataclasses import dataclass
+from datetime import timedelta
+import gzip
+import json
+import os
+from pathlib import Path
+import shutil
+import tarfile
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .constants import OPERATION_ROOT_DIRECTORY
+from .models import QueuedOperation, Status
+from .OperationQueue import FINAL_STATES
+
+FOLDER_ACTIONS = ('compress', 'prune', 'keep')
+
+
+@dataclass
+class RetentionStats:
+  rows: int = 0
+  batches: int = 0
+  foldersCompressed: int = 0
+  foldersPruned: int = 0
+  foldersMissing: int = 0
+  foldersShared: int = 0    # Still used by a row that is kept, left alone
+  folderBytes: int = 0      # Size of the folders handled
+  compressedBytes: int = 0  # Size of their tar.gz files
+  archiveBytes: int = 0     # Compressed size of the archived rows
+
+
+def folderSize(folder):
+  size = 0
+  for root, _dirs, files in os.walk(folder):
+    for name in files:
+      try:
+        size += os.lstat(os.path.join(root, name)).st_size
+      except OSError:
+        pass
+  return size
+
+
+def operationFolder(directory):
+  """The folder of an operation, None when it is not strictly below OPERATION_ROOT_DIRECTORY."""
+  if not directory:
+    return None
+  folder = (OPERATION_ROOT_DIRECTORY / directory).resolve()
+  if folder == OPERATION_ROOT_DIRECTORY or not folder.is_relative_to(OPERATION_ROOT_DIRECTORY):
+    return None
+  return folder
+
+
+def statusRecord(stat):
+  return {
+    'id': str(stat.id),
+    'operation_branch': stat.operation_branch,
+    'start_time': stat.start_time.isoformat(),
+    'elapsed_time': stat.elapsed_time.total_seconds() if stat.elapsed_time is not None else None,
+    'status': stat.status,
+    'directory': stat.directory,
+  }
+
+
+def writeTar(folder, memberName, tarPath):
+  """Packs folder into tarPath as memberName, the file only gets its name once it is complete and on disk."""
+  tarPath.parent.mkdir(parents=True, exist_ok=True)
+  partPath = tarPath.with_name(tarPath.name + '.part')
+  with open(partPath, 'wb') as tarFile:
+    with tarfile.open(fileobj=tarFile, mode='w:gz') as tar:
+      tar.add(folder, arcname=str(memberName))
+    tarFile.flush()
+    os.fsync(tarFile.fileno())
+  os.replace(partPath, tarPath)
+
+
+class StatusRetention:
+  """
+  Moves the finished Status rows started more than olderThanDays ago to gzip compressed JSONL
+  files in archiveDirectory, one per month they started in, and compresses their operation
+  folders into archiveDirectory/folders or deletes them. Works in batches of batchSize rows;
+  the folders and rows of a batch are deleted only once its archive files are on disk, so an
+  interrupted run leaves at most one batch archived twice.
+  """
+
+  def __init__(self, olderThanDays, batchSize, maxBatches=0, folderAction='compress', archiveDirectory=None, dryRun=False):
+    self.cutoff = timezone.now() - timedelta(days=olderThanDays)
+    self.batchSize = batchSize
+    self.maxBatches = maxBatches
+    self.folderAction = folderAction
+    self.archiveDirectory = Path(archiveDirectory or settings.STATUS_ARCHIVE_DIRECTORY)
+    self.dryRun = dryRun
+    self.stats = RetentionStats()
+
+  def expired(self):
+    return Status.objects.filter(status__in=FINAL_STATES, start_time__lt=self.cutoff)
+
+  def run(self):
+    """Handles the expired rows batch by batch, returns the RetentionStats."""
+    last = None
+    while not self.maxBatches or self.stats.batches < self.maxBatches:
+      qs = self.expired().order_by('start_time', 'id')
+      if last is not None:
+        # A dry run deletes nothing, so continue after the previous batch
+        qs = qs.filter(Q(start_time__gt=last.start_time) | Q(start_time=last.start_time, id__gt=last.id))
+      batch = list(qs[:self.batchSize])
+      if not batch:
+        break
+      self.runBatch(batch)
+      last = batch[-1]
+      self.stats.batches += 1
+    return self.stats
+
+  def runBatch(self, batch):
+    ids = [stat.id for stat in batch]
+    directories = {stat.directory for stat in batch if stat.directory}
+    shared = set(Status.objects.filter(directory__in=directories).exclude(id__in=ids)
+                 .values_list('directory', flat=True).distinct())
+
+    records = []
+    packed = {}   # directory -> (folder, tar.gz path), the folders are deleted once the batch is archived
+    for stat in batch:
+      record = statusRecord(stat)
+      if stat.directory in shared:
+        self.stats.foldersShared += 1
+      else:
+        if stat.directory not in packed:
+          packed[stat.directory] = self.packFolder(stat)
+        record['folder_archive'] = packed[stat.directory][1]
+      records.append(record)
+    self.stats.rows += len(batch)
+
+    if self.dryRun:
+      return
+    self.writeArchive(batch, records)
+    for folder in [folder for folder, _tarPath in packed.values() if folder is not None]:
+      try:
+        shutil.rmtree(folder)
+      except OSError as exc:
+        print(f'StatusRetention.runBatch({folder}), exception:', exc)
+    with transaction.atomic():
+      QueuedOperation.objects.filter(id__in=ids).delete()
+      Status.objects.filter(id__in=ids).delete()
+
+  def packFolder(self, stat):
+    """Compresses the folder of stat unless it is pruned or kept, returns (folder to delete, path of its tar.gz file)."""
+    if self.folderAction == 'keep':
+      return None, None
+    folder = operationFolder(stat.directory)
+    if folder is None or not folder.is_dir():
+      self.stats.foldersMissing += 1
+      return None, None
+    self.stats.folderBytes += folderSize(folder)
+    if self.folderAction == 'prune':
+      self.stats.foldersPruned += 1
+      return folder, None
+
+    self.stats.foldersCompressed += 1
+    relativePath = folder.relative_to(OPERATION_ROOT_DIRECTORY)
+    tarPath = self.archiveDirectory / 'folders' / f'{relativePath}.tar.gz'
+    if not self.dryRun:
+      writeTar(folder, relativePath, tarPath)
+      self.stats.compressedBytes += tarPath.stat().st_size
+    return folder, str(tarPath)
+
+  def writeArchive(self, batch, records):
+    """Appends the records to the archive of the month their operation started in."""
+    months = {}
+    for stat, record in zip(batch, records):
+      months.setdefault(f'{stat.start_time:%Y-%m}', []).append(record)
+
+    self.archiveDirectory.mkdir(parents=True, exist_ok=True)
+    for month, monthRecords in months.items():
+      archivePath = self.archiveDirectory / f'status-{month}.jsonl.gz'
+      sizeBefore = archivePath.stat().st_size if archivePath.exists() else 0
+      # Appending adds a gzip member, gzip.open() and zcat read all members as one stream
+      with open(archivePath, 'ab') as archiveFile:
+        with gzip.open(archiveFile, 'wt', encoding='utf-8') as archive:
+          for record in monthRecords:
+            archive.write(json.dumps(record) + '\n')
+        archiveFile.flush()
+        os.fsync(archiveFile.fileno())
+      self.stats.archiveBytes += archivePath.stat().st_size - sizeBefore
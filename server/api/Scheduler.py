@@ -0,0 +1,85 @@
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+
+PRIORITY_CLASSES = {'high': 0, 'normal': 1, 'low': 2}
+DEFAULT_PRIORITY = PRIORITY_CLASSES['normal']
+
+
+def parseLimits(text):
+  """Parses 'name=N,name=N' into {name: N}, used for the per-server and per-library overrides."""
+  limits = {}
+  for item in (text or '').split(','):
+    if not item.strip():
+      continue
+    name, _, value = item.rpartition('=')
+    if not name:
+      raise ValueError(f'Invalid limit "{item}", expected name=N')
+    limits[name.strip()] = int(value)
+  return limits
+
+
+@dataclass
+class Candidate:
+  id: object
+  username: str
+  priority: int
+  enqueued_at: datetime
+  libraryName: str
+  servers: list
+
+
+class Scheduler:
+  """
+  Decides which queued operations may start. An operation starts when none of its servers
+  and not its library has reached its limit of concurrently running operations (0 means
+  unlimited). Queued operations are considered by priority class, within a class round robin
+  between users, so one user queueing many operations does not hold up the others, and
+  in the order they were queued within the turn of a user.
+  """
+
+  def __init__(self, serverLimit=0, libraryLimit=0, serverLimits=None, libraryLimits=None):
+    self.serverLimit = serverLimit
+    self.libraryLimit = libraryLimit
+    self.serverLimits = serverLimits or {}
+    self.libraryLimits = libraryLimits or {}
+
+  def limitOfServer(self, server):
+    return self.serverLimits.get(server, self.serverLimit)
+
+  def limitOfLibrary(self, libraryName):
+    return self.libraryLimits.get(libraryName, self.libraryLimit)
+
+  def order(self, queued, running):
+    """Returns the queued candidates in the order they are considered, running holds the running candidates."""
+    runningPerUser = Counter(candidate.username for candidate in running)
+    turn = Counter()
+    keys = {}
+    for candidate in sorted(queued, key=lambda candidate: (candidate.enqueued_at, str(candidate.id))):
+      turn[candidate.username, candidate.priority] += 1
+      keys[candidate.id] = (candidate.priority, runningPerUser[candidate.username] + turn[candidate.username, candidate.priority],
+                            candidate.enqueued_at, str(candidate.id))
+    return sorted(queued, key=lambda candidate: keys[candidate.id])
+
+  def select(self, queued, running, maxCount):
+    """Returns up to maxCount queued candidates that can start now without exceeding a limit."""
+    perServer = Counter(server for candidate in running for server in set(candidate.servers))
+    perLibrary = Counter(candidate.libraryName for candidate in running)
+
+    selected = []
+    for candidate in self.order(queued, running):
+      if len(selected) >= maxCount:
+        break
+      servers = set(candidate.servers)
+      if any(0 < self.limitOfServer(server) <= perServer[server] for server in servers):
+        continue
+      if 0 < self.limitOfLibrary(candidate.libraryName) <= perLibrary[candidate.libraryName]:
+        continue
+      perServer.update(servers)
+      perLibrary[candidate.libraryName] += 1
+      selected.append(candidate)
+    return selected
+
+  def positions(self, queued, running):
+    """Returns {id: position} of the queued candidates, 1 is considered first."""
+    return {candidate.id: idx for idx, candidate in enumerate(self.order(queued, running), start=1)}
@@ -0,0 +1,104 @@
+import os
+
+READ_BLOCK_SIZE = 4096
+
+
+class StatusTailer:
+  """
+  Follows one status file. Remembers the byte offset just past the last complete line
+  it has seen, so a check only touches what was appended since the previous one.
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self.offset = 0
+    self.lastLine = None
+
+  def newLastLine(self):
+    """Returns the last complete line appended since the previous call, or None if nothing changed."""
+    with open(self.path, 'rb') as statusFile:
+      size = os.fstat(statusFile.fileno()).st_size
+      if size < self.offset:
+        # The file was truncated or replaced, start over
+        self.offset = 0
+        self.lastLine = None
+      if size == self.offset:
+        return None
+
+      lineEnd = self.findLastNewline(statusFile, size)
+      if lineEnd is None:
+        return None   # Only a partial line was appended so far
+      lineStart = self.findLineStart(statusFile, lineEnd)
+
+      statusFile.seek(lineStart)
+      line = statusFile.read(lineEnd + 1 - lineStart)
+
+    self.offset = lineEnd + 1
+    self.lastLine = line.decode(errors='replace')
+    return self.lastLine
+
+  def findLastNewline(self, statusFile, size):
+    """Searches backwards from EOF, but never before self.offset, for the last newline."""
+    end = size
+    while end > self.offset:
+      start = max(end - READ_BLOCK_SIZE, self.offset)
+      statusFile.seek(start)
+      block = statusFile.read(end - start)
+      idx = block.rfind(b'\n')
+      if idx >= 0:
+        return start + idx
+      end = start
+    return None
+
+  def findLineStart(self, statusFile, lineEnd):
+    """self.offset is always at the start of a line, so the backwards search stops there."""
+    end = lineEnd
+    while end > self.offset:
+      start = max(end - READ_BLOCK_SIZE, self.offset)
+      statusFile.seek(start)
+      block = statusFile.read(end - start)
+      idx = block.rfind(b'\n')
+      if idx >= 0:
+        return start + idx + 1
+      end = start
+    return self.offset
+
+
+class OutputFollower:
+  """
+  Follows the files in an operation folder and returns the complete lines appended to
+  them. Files that exist when following starts are followed from their current end.
+  """
+
+  def __init__(self, folder):
+    self.folder = folder
+    self.offsets = {}
+    with os.scandir(folder) as entries:
+      for entry in entries:
+        if entry.is_file():
+          self.offsets[entry.name] = entry.stat().st_size
+
+  def newLines(self, fileName, maxBytes=64 * 1024):
+    """Returns the next complete lines of fileName, at most maxBytes of them."""
+    offset = self.offsets.get(fileName, 0)
+    try:
+      with open(os.path.join(self.folder, fileName), 'rb') as outputFile:
+        size = os.fstat(outputFile.fileno()).st_size
+        if size < offset:
+          offset = 0
+        outputFile.seek(offset)
+        data = outputFile.read(min(size - offset, maxBytes))
+    except (FileNotFoundError, IsADirectoryError):
+      return []
+
+    end = data.rfind(b'\n')
+    if end < 0:
+      if len(data) < maxBytes:
+        return []
+      end = len(data) - 1   # A single line longer than maxBytes, hand it out in pieces
+    self.offsets[fileName] = offset + end + 1
+    return data[:end + 1].decode(errors='replace').splitlines()
+
+  def fileNames(self):
+    with os.scandir(self.folder) as entries:
+      return [entry.name for entry in entries if entry.is_file()]
@@ -0,0 +1,119 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+
+# inotify(7) constants, see /usr/include/linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def loadInotify():
+  """Returns libc with the inotify functions, or None when inotify is not available."""
+  libcName = ctypes.util.find_library('c')
+  if libcName is None:
+    return None
+  try:
+    libc = ctypes.CDLL(libcName, use_errno=True)
+    libc.inotify_init1
+    libc.inotify_add_watch
+    libc.inotify_rm_watch
+  except (OSError, AttributeError):
+    return None
+  return libc
+
+
+class StatusWatcher:
+  """
+  Watches operation folders with inotify. For each batch of events read from the kernel
+  it calls onChanges({uuid: set of file names written to}). onOverflow() is called when
+  the kernel event queue overflowed and events may have been lost.
+  """
+
+  def __init__(self, onChanges, onOverflow):
+    self.libc = loadInotify()
+    if self.libc is None:
+      raise OSError('inotify is not available')
+
+    self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if self.fd < 0:
+      errno = ctypes.get_errno()
+      raise OSError(errno, os.strerror(errno))
+
+    self.onChanges = onChanges
+    self.onOverflow = onOverflow
+    self.watchLock = threading.Lock()
+    self.wd2uuid = {}
+    self.uuid2wd = {}
+
+    thread = threading.Thread(target=self.readEvents, name='StatusWatcher', daemon=True)
+    thread.start()
+
+  def addWatch(self, uuid, folder):
+    wd = self.libc.inotify_add_watch(self.fd, os.fsencode(str(folder)), WATCH_MASK)
+    if wd < 0:
+      errno = ctypes.get_errno()
+      raise OSError(errno, os.strerror(errno), str(folder))
+    with self.watchLock:
+      self.wd2uuid[wd] = uuid
+      self.uuid2wd[uuid] = wd
+
+  def removeWatch(self, uuid):
+    with self.watchLock:
+      wd = self.uuid2wd.pop(uuid, None)
+      if wd is None:
+        return
+      self.wd2uuid.pop(wd, None)
+    self.libc.inotify_rm_watch(self.fd, wd)
+
+  def readEvents(self):
+    poller = select.poll()
+    poller.register(self.fd, select.POLLIN)
+    while True:
+      poller.poll()
+      try:
+        data = os.read(self.fd, 64 * 1024)
+      except BlockingIOError:
+        continue
+
+      changed = {}
+      overflow = False
+      pos = 0
+      while pos < len(data):
+        wd, mask, _cookie, nameLen = EVENT_HEADER.unpack_from(data, pos)
+        pos += EVENT_HEADER.size
+        name = data[pos:pos + nameLen].rstrip(b'\0').decode(errors='replace')
+        pos += nameLen
+
+        if mask & IN_Q_OVERFLOW:
+          overflow = True
+          continue
+        with self.watchLock:
+          uuid = self.wd2uuid.get(wd)
+          if mask & IN_IGNORED and uuid is not None:
+            del self.wd2uuid[wd]
+            self.uuid2wd.pop(uuid, None)
+        if uuid is None or not name:
+          continue
+        changed.setdefault(uuid, set()).add(name)
+
+      # Several writes to the same file arrive in one read, report them once
+      try:
+        if overflow:
+          self.onOverflow()
+        if changed:
+          self.onChanges(changed)
+      except Exception as exc:
+        print('StatusWatcher.readEvents(), exception:', exc)
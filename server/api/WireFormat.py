@@ -0,0 +1,49 @@
+import json
+
+try:
+  import msgpack
+except ImportError:   # Optional, without it every response is JSON
+  msgpack = None
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+MSGPACK_MEDIA_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+
+def acceptQualities(accept):
+  """Parses an Accept header into {media type: q}."""
+  qualities = {}
+  for mediaRange in accept.split(','):
+    mediaType, *params = [part.strip() for part in mediaRange.split(';')]
+    if not mediaType:
+      continue
+    q = 1.0
+    for param in params:
+      name, _, value = param.partition('=')
+      if name.strip() == 'q':
+        try:
+          q = float(value)
+        except ValueError:
+          q = 0.0
+    qualities[mediaType.lower()] = q
+  return qualities
+
+
+def wantsMsgpack(request):
+  """True when the Accept header prefers MessagePack over JSON and msgpack is installed."""
+  if msgpack is None:
+    return False
+  qualities = acceptQualities(request.headers.get('Accept', ''))
+  msgpackQ = max((qualities.get(mediaType, 0.0) for mediaType in MSGPACK_MEDIA_TYPES), default=0.0)
+  jsonQ = qualities.get(JSON_CONTENT_TYPE, qualities.get('application/*', qualities.get('*/*', 0.0)))
+  return msgpackQ > 0 and msgpackQ >= jsonQ
+
+
+def jsonToMsgpack(body):
+  """Converts a serialized JSON response, so both formats carry exactly the same data."""
+  return msgpack.packb(json.loads(body))
+
+
+def msgpackArray(bodies):
+  """A MessagePack array of already packed items, like b'[' + b', '.join(bodies) + b']' for JSON."""
+  return msgpack.Packer().pack_array_header(len(bodies)) + b''.join(bodies)
@@ -1,52 +1,58 @@
-from datetime import datetime, timedelta
+import asyncio
+import hmac
+from datetime import datetime, timedelta, timezone as dt_timezone
 from enum import Enum
-from dataclasses import asdict
-import importlib
 import json
 import os
+import threading
 from time import sleep
+from uuid import UUID
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth import authenticate
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseServerError
-from django.http import HttpResponseForbidden, HttpResponseNotFound, JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseServerError, HttpResponseNotAllowed
+from django.http import HttpResponseForbidden, HttpResponseNotFound, HttpResponseNotModified
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils.html import escape
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
-from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from webcligui_api import to_json_bytes
+from .AuthCache import CachedJWTAuthentication, CachedRefreshToken, blacklistAccessToken
 from .constants import OPERATION_ROOT_DIRECTORY
-from .models import LibraryRegistration, Status
-from .OperationHandling import OperationHandling
-
-libraryApis = []
-library2Idx = {}   # Mapping from library_name to libraryApiImpl in libraryApis
+from .EventBroker import eventBroker
+from .FileAccess import astreamFileJson, decodeCursor, encodeCursor, listDirectory, openFileRange, streamFileJson
+from .LibraryRegistry import libraryRegistry
+from . import Metrics
+from .models import Status, operationPath
+from .OperationHandling import OperationHandling, OperationStatus
+from .OperationTree import NodeNotFound, compactTree, findNode, subtreeJson
+from .ResponseCache import branchCache, combinedEtag, etagMatches, hierarchyCache, hierarchyVersion, isCacheable
+from .ResponseCache import statusCount
+from .Scheduler import PRIORITY_CLASSES
+from .WireFormat import MSGPACK_CONTENT_TYPE, jsonToMsgpack, msgpackArray, wantsMsgpack
+
+EVENT_STREAM_KEEPALIVE = 15   # Seconds between keep-alive comments on an idle event stream
+STATUS_FILTER_PARAMS = ('branch', 'status', 'start_after', 'start_before', 'folder')
 
 operationHandling = None
 
 
+operationHandlingLock = threading.Lock()
+
 def get_operation_handling():
   global operationHandling
-  if operationHandling is None:
-    operationHandling = OperationHandling()
+  with operationHandlingLock:
+    if operationHandling is None:
+      operationHandling = OperationHandling(getLibraryApi)
   return operationHandling
 
-def instantiateLibraryModule(obj):
-    module = importlib.import_module(obj.module_path)
-    cls = getattr(module, obj.class_name)
-    libraryAPIImpl = cls()
-    return libraryAPIImpl
-
-def load_library_apis():
-  global libraryApis, library2Idx
-  if len(libraryApis) > 0:
-      return
-
-  for idx, obj in enumerate(LibraryRegistration.objects.all()):
-    libraryAPIImpl = instantiateLibraryModule(obj)
-    libraryApis.append(libraryAPIImpl)  
-    library2Idx[obj.library_name] = idx
-
 def to_json_safe(obj):
     if isinstance(obj, Enum):
         return obj.value
@@ -90,22 +96,22 @@ def login(request):
     return HttpResponseServerError(str(exc))
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def logout(request):
   try:
+    # First, a refresh token that is expired or already blacklisted raises TokenError
+    blacklistAccessToken(request.auth, request.user)
     raw_refresh = request.COOKIES.get('refresh_token')
     if raw_refresh:
-      token = RefreshToken(raw_refresh)
-      token.blacklist()
+      try:
+        CachedRefreshToken(raw_refresh).blacklist()
+      except TokenError:
+        pass   # Unusable already
     response = JsonResponse({'detail': 'logged out'})
     response.delete_cookie('refresh_token')
     return response
   
-  except TokenError:
-    response = JsonResponse({'detail': 'logged out'})
-    response.delete_cookie('refresh_token')
-    return response
   except Exception as exc:
     print('logout(), exception:', exc)
     return HttpResponseServerError(str(exc))
@@ -118,7 +124,7 @@ def get_access_token(request):
     raw_refresh = request.COOKIES.get('refresh_token')
     if not raw_refresh:
       return HttpResponseForbidden('No refresh token cookie')
-    refresh = RefreshToken(raw_refresh)
+    refresh = CachedRefreshToken(raw_refresh)
     return JsonResponse({'access': str(refresh.access_token)})
 
   except TokenError as exc:
@@ -127,92 +133,157 @@ def get_access_token(request):
     print('get_access_token(), exception:', exc)
     return HttpResponseServerError(str(exc))
 
-@api_view(['GET'])
-@authentication_classes([JWTAuthentication])
-@permission_classes([IsAuthenticated])
-def get_operation_hierarchy(request):
-  try:
-    load_library_apis()
-    operations = []
-
-    for libraryAPIImpl in libraryApis:
-      hierarchy = libraryAPIImpl.getOperationHierarchy()
-      dict = to_json_safe(asdict(hierarchy))
-      operations.append(dict)
+@csrf_exempt
+async def get_operation_hierarchy(request):
+  if request.method != 'GET':
+    return HttpResponseNotAllowed(['GET'])
+  if await sync_to_async(authenticateJwt)(request, allowQueryToken=False) is None:
+    return HttpResponse('Authentication credentials were not provided or are invalid', status=401)
 
-    return JsonResponse(operations, safe=False)
+  try:
+    entries = {}
+    missing = {}
+
+    for libraryName, loaded in await sync_to_async(libraryRegistry.loadAll)(settings.LIBRARY_PRELOAD_THREADS):
+      libraryAPIImpl = loaded.asyncApi
+      version = hierarchyVersion(libraryAPIImpl)
+      entries[libraryName] = hierarchyCache.lookup(libraryName, version)
+      if entries[libraryName] is None:
+        missing[libraryName] = (libraryAPIImpl, version)
+
+    # The libraries whose hierarchy is not cached are asked at the same time
+    hierarchies = await asyncio.gather(*(libraryAPIImpl.getOperationHierarchy() for libraryAPIImpl, _version in missing.values()))
+    for (libraryName, (_libraryAPIImpl, version)), hierarchy in zip(missing.items(), hierarchies):
+      entries[libraryName] = hierarchyCache.store(libraryName, version, to_json_bytes(hierarchy))
+
+    useMsgpack = wantsMsgpack(request)
+    etag = combinedEtag([entry.etag for entry in entries.values()] + (['msgpack'] if useMsgpack else []))
+    if etagMatches(request.headers.get('If-None-Match'), etag):
+      response = HttpResponseNotModified()
+    elif useMsgpack:
+      for entry in entries.values():
+        if entry.msgpackBody is None:
+          entry.msgpackBody = jsonToMsgpack(entry.body)
+      response = wireResponse(msgpackArray([entry.msgpackBody for entry in entries.values()]), True)
+    else:
+      response = wireResponse(b'[' + b', '.join(entry.body for entry in entries.values()) + b']', False)
+    response['ETag'] = etag
+    response['Vary'] = 'Accept'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
   
   except Exception as exc:
      print('get_operation_hierarchy(), exception:', exc)
      return HttpResponseServerError(str(exc))
 
 def getLibraryApi(libraryName):
-  global libraryApiImpl, library2Idx
-  load_library_apis()
-   
-  if not libraryName in library2Idx:
-    return None
-  
-  idx = library2Idx[libraryName]
-  libraryApiImpl = libraryApis[idx]
-  return libraryApiImpl
+  loaded = libraryRegistry.get(libraryName)
+  return loaded.syncApi if loaded else None
+
+def getAsyncLibraryApi(libraryName):
+  loaded = libraryRegistry.get(libraryName)
+  return loaded.asyncApi if loaded else None
+
+def wireResponse(body, useMsgpack):
+  response = HttpResponse(body, content_type=MSGPACK_CONTENT_TYPE if useMsgpack else 'application/json')
+  response['Vary'] = 'Accept'
+  return response
+
+async def cachedBranchResponse(request, libraryName, libraryApiImpl, method, operationBranch, build):
+  """
+  Returns the cached response for the branch, or builds, caches (if the library allows it) and returns it.
+  As MessagePack when the Accept header asks for it, converted from the JSON and cached as well.
+  """
+  version = hierarchyVersion(libraryApiImpl)
+  useMsgpack = wantsMsgpack(request)
+  if useMsgpack:
+    body = branchCache.lookup(libraryName, f'{method}.msgpack', operationBranch, version)
+    if body is not None:
+      return wireResponse(body, True)
+
+  body = branchCache.lookup(libraryName, method, operationBranch, version)
+  cacheable = True
+  if body is None:
+    body = await build()
+    cacheable = isCacheable(libraryApiImpl, method, operationBranch)
+    if cacheable:
+      branchCache.store(libraryName, method, operationBranch, version, body)
+  if useMsgpack:
+    body = jsonToMsgpack(body)
+    if cacheable:
+      branchCache.store(libraryName, f'{method}.msgpack', operationBranch, version, body)
+  return wireResponse(body, useMsgpack)
+
+@csrf_exempt
+async def get_description(request):
+  if request.method != 'POST':
+    return HttpResponseNotAllowed(['POST'])
+  if await sync_to_async(authenticateJwt)(request, allowQueryToken=False) is None:
+    return HttpResponse('Authentication credentials were not provided or are invalid', status=401)
 
-@api_view(['POST'])
-@authentication_classes([JWTAuthentication])
-@permission_classes([IsAuthenticated])
-def get_description(request):
   try:
     body = json.loads(request.body)
     libraryName = body["operationBranch"][0]
-    libraryApiImpl = getLibraryApi(libraryName)
+    libraryApiImpl = await sync_to_async(getAsyncLibraryApi)(libraryName)
     if not libraryApiImpl:
       errMsg = f'Libraryname "{libraryName}" not known!'
       print('get_description():', errMsg)
       return HttpResponseBadRequest(errMsg)
 
     operationBranch = body["operationBranch"][1:]
-    description = libraryApiImpl.getDescription(operationBranch)
-    if not description:
-       raise Exception(f'No description for {operationBranch}')
 
-    return JsonResponse(description, safe=False)
+    async def buildDescription():
+      description = await libraryApiImpl.getDescription(operationBranch)
+      if not description:
+        raise Exception(f'No description for {operationBranch}')
+      return json.dumps(description, cls=DjangoJSONEncoder).encode()
+
+    return await cachedBranchResponse(request, libraryName, libraryApiImpl, 'description', operationBranch, buildDescription)
   
   except Exception as exc:
      print('get_description(), exception:', exc)
      return HttpResponseServerError(str(exc))
 
-@api_view(['POST'])
-@authentication_classes([JWTAuthentication])
-@permission_classes([IsAuthenticated])
-def get_parameters(request):
+@csrf_exempt
+async def get_parameters(request):
+  if request.method != 'POST':
+    return HttpResponseNotAllowed(['POST'])
+  if await sync_to_async(authenticateJwt)(request, allowQueryToken=False) is None:
+    return HttpResponse('Authentication credentials were not provided or are invalid', status=401)
+
   try:
     body = json.loads(request.body)
     libraryName = body["operationBranch"][0]
-    libraryApiImpl = getLibraryApi(libraryName)
+    libraryApiImpl = await sync_to_async(getAsyncLibraryApi)(libraryName)
     if not libraryApiImpl:
       errMsg = f'Libraryname "{libraryName}" not known!'
       print('get_parameters():', errMsg)
       return HttpResponseBadRequest(errMsg)
 
     operationBranch = body["operationBranch"][1:]
-    parameterData = libraryApiImpl.getParameters(operationBranch) 
-    paramDict = asdict(parameterData) if parameterData is not None else {}
-    parameters = to_json_safe(paramDict)
 
-    return JsonResponse(parameters, safe=False)
+    async def buildParameters():
+      parameterData = await libraryApiImpl.getParameters(operationBranch)
+      return to_json_bytes(parameterData if parameterData is not None else {})
+
+    return await cachedBranchResponse(request, libraryName, libraryApiImpl, 'parameters', operationBranch, buildParameters)
 
   except Exception as exc:
      print('get_parameters(), exception:', exc)
      return HttpResponseServerError(str(exc))
 
-@api_view(['POST'])
-@authentication_classes([JWTAuthentication])
-@permission_classes([IsAuthenticated])
-def submit_operation(request):
+@csrf_exempt
+async def submit_operation(request):
+  if request.method != 'POST':
+    return HttpResponseNotAllowed(['POST'])
+  user = await sync_to_async(authenticateJwt)(request, allowQueryToken=False)
+  if user is None:
+    return HttpResponse('Authentication credentials were not provided or are invalid', status=401)
+
   try:
     body = json.loads(request.body)
     libraryName = body["operation_branch"][0]
-    libraryApiImpl = getLibraryApi(libraryName)
+    libraryApiImpl = await sync_to_async(getAsyncLibraryApi)(libraryName)
     if not libraryApiImpl:
       errMsg = f'Libraryname "{libraryName}" not known!'
       print('api.py--submit_operation():', errMsg)
@@ -221,51 +292,276 @@ def submit_operation(request):
     operationBranch = body["operation_branch"]
     command = body['command']
     servers = body["servers"]
+    try:
+      priority = parsePriority(body.get("priority", "normal"))
+    except ValueError as exc:
+      return HttpResponseBadRequest(str(exc))
 
     print(f"api.py--submit_operation(): libraryName={libraryName}, operationBranch={operationBranch}")
     print(f"command={command}, servers={servers}")
 
-    operationStatus = get_operation_handling().submitOperation(
-      libraryApiImpl, operationBranch, command, servers
+    operationHandling = await sync_to_async(get_operation_handling)()
+    operationStatus = await operationHandling.submitOperationAsync(
+      libraryApiImpl, operationBranch, command, servers, user.username, priority
     )
     print('operationStatus:', operationStatus)
 
-    operationStatusDict = asdict(operationStatus)
-    operationStatusSafe = to_json_safe(operationStatusDict)
-
-    return JsonResponse(operationStatusSafe, safe=False)
+    # 202 when the operation was only queued, the status events and list show its progress
+    responseStatus = 202 if operationHandling.queue is not None else 200
+    return HttpResponse(to_json_bytes(operationStatus), content_type='application/json', status=responseStatus)
 
   except Exception as exc:
      print('submit_operation(), exception:', exc)
      return HttpResponseServerError(str(exc))
 
+async def cachedHierarchyTree(libraryName, libraryApiImpl):
+  """
+  The full hierarchy of the library as SlottedOperationFolder, fetched once per hierarchy version.
+  Only the subtree requests of libraries without getOperationSubtree() need it, the entries stored
+  by get_operation_hierarchy() hold just the JSON.
+  """
+  version = hierarchyVersion(libraryApiImpl)
+  entry = hierarchyCache.lookup(libraryName, version)
+  if entry is None or entry.tree is None:
+    hierarchy = await libraryApiImpl.getOperationHierarchy()
+    entry = hierarchyCache.store(libraryName, version, to_json_bytes(hierarchy), compactTree(hierarchy))
+  return entry.tree
+
+@csrf_exempt
+async def get_operation_subtree(request):
+  """
+  One or a few levels of the operation hierarchy: the body is {"operationBranch": [library, folder, ...],
+  "depth": N (default 1)}. Folders carry child_count, those at the deepest level have no portfolio.
+  """
+  if request.method != 'POST':
+    return HttpResponseNotAllowed(['POST'])
+  if await sync_to_async(authenticateJwt)(request, allowQueryToken=False) is None:
+    return HttpResponse('Authentication credentials were not provided or are invalid', status=401)
+
+  try:
+    try:
+      body = json.loads(request.body)
+      libraryName = body["operationBranch"][0]
+      depth = int(body.get("depth", 1))
+    except (ValueError, TypeError, KeyError, IndexError):
+      return HttpResponseBadRequest('The body must be {"operationBranch": [library, ...], "depth": N}')
+    if depth < 0:
+      return HttpResponseBadRequest('depth must not be negative')
+    libraryApiImpl = await sync_to_async(getAsyncLibraryApi)(libraryName)
+    if not libraryApiImpl:
+      errMsg = f'Libraryname "{libraryName}" not known!'
+      print('get_operation_subtree():', errMsg)
+      return HttpResponseBadRequest(errMsg)
+
+    operationBranch = body["operationBranch"][1:]
+
+    async def buildSubtree():
+      # One level more than returned, for the child counts of the deepest folders
+      node = await libraryApiImpl.getOperationSubtree(operationBranch, depth + 1)
+      if node is None:
+        node = findNode(await cachedHierarchyTree(libraryName, libraryApiImpl), operationBranch)
+      if node is None:
+        raise NodeNotFound(f'{"/".join(body["operationBranch"])} not found')
+      return to_json_bytes(subtreeJson(node, depth))
+
+    return await cachedBranchResponse(request, libraryName, libraryApiImpl, f'subtree-{depth}', operationBranch, buildSubtree)
+
+  except NodeNotFound as exc:
+    return HttpResponseNotFound(str(exc))
+  except Exception as exc:
+     print('get_operation_subtree(), exception:', exc)
+     return HttpResponseServerError(str(exc))
+
+def parsePriority(value):
+  if value not in PRIORITY_CLASSES:
+    raise ValueError(f'priority must be one of {", ".join(PRIORITY_CLASSES)}')
+  return PRIORITY_CLASSES[value]
+
+def parseParallelism(value):
+  """The number of library calls a batch may make at the same time, between 1 and SUBMIT_BATCH_PARALLELISM."""
+  if isinstance(value, bool):
+    raise ValueError('parallelism must be an integer')
+  return max(1, min(int(value), settings.SUBMIT_BATCH_PARALLELISM))
+
+def batchOperations(body):
+  """
+  Expands the operations of a submit-operations body into (libraryApiImpl, operationBranch, command, servers, priority)
+  tuples. An operation with "fan_out" (or the body with "fan_out") is split into one operation per server,
+  "priority" can likewise be given per operation or for the body.
+  Returns the tuples and, per expanded operation, the index of the item it came from and an error or None.
+  """
+  items = body["operations"]
+  if not isinstance(items, list):
+    raise ValueError('operations must be a list')
+  operations = []
+  origins = []
+  for idx, item in enumerate(items):
+    operationBranch = item["operation_branch"]
+    command = item["command"]
+    servers = item["servers"]
+    priority = parsePriority(item.get("priority", body.get("priority", "normal")))
+    libraryApiImpl = getLibraryApi(operationBranch[0])
+    if not libraryApiImpl:
+      origins.append((idx, f'Libraryname "{operationBranch[0]}" not known!'))
+      operations.append(None)
+      continue
+    if item.get("fan_out", body.get("fan_out", False)):
+      for server in servers:
+        operations.append((libraryApiImpl, operationBranch, command, [server], priority))
+        origins.append((idx, None))
+    else:
+      operations.append((libraryApiImpl, operationBranch, command, servers, priority))
+      origins.append((idx, None))
+  return operations, origins
+
+@api_view(['POST'])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def submit_operations(request):
+  """
+  Submits many operations in one request. The body is {"operations": [{"operation_branch", "command",
+  "servers", optional "fan_out"}, ...], optional "parallelism"}. The response holds a result per
+  (expanded) operation, in order: {"index", "ok", "operation"} or {"index", "ok", "error"}.
+  """
+  try:
+    body = json.loads(request.body)
+    operations, origins = batchOperations(body)
+    parallelism = parseParallelism(body.get("parallelism", settings.SUBMIT_BATCH_PARALLELISM))
+  except (ValueError, KeyError, TypeError, IndexError) as exc:
+    print('submit_operations(), invalid request:', exc)
+    return HttpResponseBadRequest(f'Invalid request: {exc}')
+
+  if len(operations) > settings.SUBMIT_BATCH_MAX_SIZE:
+    return HttpResponseBadRequest(f'At most {settings.SUBMIT_BATCH_MAX_SIZE} operations can be submitted at once')
+
+  try:
+    operationHandling = get_operation_handling()
+    valid = [operation for operation in operations if operation is not None]
+    submitted = iter(operationHandling.submitOperations(valid, parallelism, request.user.username) if valid else [])
+
+    results = []
+    for operation, (idx, error) in zip(operations, origins):
+      outcome = next(submitted) if operation is not None else None
+      if isinstance(outcome, OperationStatus):
+        results.append({"index": idx, "ok": True, "operation": outcome})
+      else:
+        results.append({"index": idx, "ok": False, "error": error or str(outcome)})
+    print(f'api.py--submit_operations(): {len(results)} operations, {sum(r["ok"] for r in results)} submitted')
+
+    responseStatus = 202 if operationHandling.queue is not None else 200
+    return HttpResponse(to_json_bytes({"results": results}), content_type='application/json', status=responseStatus)
+
+  except Exception as exc:
+     print('submit_operations(), exception:', exc)
+     return HttpResponseServerError(str(exc))
+
+def parseTime(value, name):
+  try:
+    parsed = datetime.fromisoformat(value)
+  except ValueError:
+    raise ValueError(f'{name} is not an ISO 8601 time')
+  return parsed if parsed.tzinfo else parsed.replace(tzinfo=dt_timezone.utc)
+
+def prefixRange(fieldName, prefix):
+  """
+  Filter on the rows whose field starts with prefix, as a range instead of LIKE so the
+  index on the field is used on every database.
+  """
+  return {f'{fieldName}__gte': prefix, f'{fieldName}__lt': prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
+def filterStatus(qs, query):
+  """
+  Applies the filters of the status list: branch (a branch prefix, 'library/folder/...'),
+  status (repeatable, exact status text), start_after / start_before (ISO 8601) and folder
+  (a folder prefix). Raises ValueError for invalid values.
+  """
+  prefix = operationPath([name for name in query.get('branch', '').split('/') if name])
+  if prefix:
+    qs = qs.filter(**prefixRange('operation_path', prefix))
+  statusTexts = query.getlist('status')
+  if statusTexts:
+    qs = qs.filter(status__in=statusTexts)
+  if query.get('start_after'):
+    qs = qs.filter(start_time__gte=parseTime(query['start_after'], 'start_after'))
+  if query.get('start_before'):
+    qs = qs.filter(start_time__lt=parseTime(query['start_before'], 'start_before'))
+  if query.get('folder'):
+    qs = qs.filter(**prefixRange('directory', query['folder']))
+  return qs
+
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def get_operation_status_list(request):
+  """
+  Newest first. Pages either with offset/limit or, cheaper for deep pages, by passing the
+  next_after token of the previous page as after=. count=cached (default) reports a total
+  that may be a few seconds old, count=exact counts the rows and count=none skips it.
+  See filterStatus() for the filter parameters, a filtered total is always counted exactly.
+  """
   try:
-    offset = int(request.query_params.get("offset", 0))
-    limit = int(request.query_params.get("limit", 25))
-
-    qs = Status.objects.order_by('-start_time')
-    objects = qs[offset:offset + limit]
-    num_status = qs.count()
+    try:
+      offset = int(request.query_params.get("offset", 0))
+      limit = int(request.query_params.get("limit", 25))
+    except ValueError:
+      return HttpResponseBadRequest('offset and limit must be integers')
+    if offset < 0 or limit < 1:
+      return HttpResponseBadRequest('offset must not be negative and limit must be positive')
+    after = request.query_params.get("after")
+    countMode = request.query_params.get("count", "cached")
+    if countMode not in ("cached", "exact", "none"):
+      return HttpResponseBadRequest(f'Invalid count mode {countMode}')
+
+    try:
+      filteredQs = filterStatus(Status.objects.all(), request.query_params)
+    except ValueError as exc:
+      return HttpResponseBadRequest(str(exc))
+    filtered = any(request.query_params.get(name) for name in STATUS_FILTER_PARAMS)
+    qs = filteredQs.order_by('-start_time', '-id')
+    if after:
+      try:
+        afterTime, afterId = decodeCursor(after)
+        afterTime, afterId = datetime.fromisoformat(afterTime), UUID(afterId)
+      except (ValueError, TypeError):
+        return HttpResponseBadRequest('Invalid after token')
+      qs = qs.filter(Q(start_time__lt=afterTime) | Q(start_time=afterTime, id__lt=afterId))
+      offset = None
+      objects = qs[:limit]
+    else:
+      objects = qs[offset:offset + limit]
+    rows = list(objects.values_list('id', 'operation_branch', 'start_time', 'elapsed_time', 'status', 'directory'))
+
+    if countMode == "exact" or (countMode == "cached" and filtered):
+      num_status = filteredQs.count()
+    elif countMode == "cached":
+      num_status = statusCount.get(Status.objects.count)
+    else:
+      num_status = None
 
     data = {
         "total_num_status": num_status,
         "offset": offset,
+        "next_after": encodeCursor([rows[-1][2].isoformat(), str(rows[-1][0])]) if rows and len(rows) == limit else None,
         "status_data": [
             {
-                "uuid": obj.id,
-                "operation_branch": obj.operation_branch,
-                "start_time": obj.start_time,
-                "elapsed_time": obj.elapsed_time,
-                "status": obj.status,
-                "folder": obj.directory,
+                "uuid": id,
+                "operation_branch": operation_branch,
+                "start_time": start_time,
+                "elapsed_time": elapsed_time,
+                "status": status,
+                "folder": directory,
             }
-            for obj in objects
+            for id, operation_branch, start_time, elapsed_time, status, directory in rows
         ]
     }
+
+    # Where the queued operations are in the queue and how long they waited (or are waiting)
+    queue = get_operation_handling().queue
+    if queue is not None and rows:
+      queueInfo = queue.queueInfo([row[0] for row in rows])
+      for statusData in data["status_data"]:
+        if statusData["uuid"] in queueInfo:
+          statusData["queue_position"], statusData["wait_time"] = queueInfo[statusData["uuid"]]
     dataSafe = to_json_safe(data)
     return JsonResponse(dataSafe)
 
@@ -274,7 +570,7 @@ def get_operation_status_list(request):
      return HttpResponseServerError(str(exc))
 
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def folder_access(request, path):
   try:
@@ -288,20 +584,124 @@ def folder_access(request, path):
       return HttpResponseNotFound(errMsg)
 
     if os.path.isfile(full_path):
-      with open(full_path, "r") as f:
-        content = f.read()
-      return JsonResponse({
-        'type': 'file',
-        'content': content,
-      })
+      try:
+        fileRange = openFileRange(full_path, request.query_params)
+      except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+      # Served over ASGI the content has to be an async iterator to be streamed
+      streamJson = astreamFileJson if isinstance(request._request, ASGIRequest) else streamFileJson
+      return StreamingHttpResponse(streamJson(*fileRange), content_type='application/json')
     
-    file_list = os.listdir(full_path)
+    try:
+      listing = listDirectory(full_path, request.query_params)
+    except ValueError as exc:
+      return HttpResponseBadRequest(str(exc))
     return JsonResponse({
       'type': 'directory',
       'path': path,
-      'file_list': file_list,
+      'file_list': [entry['name'] for entry in listing['entries']],
+      **listing,
     })
   
   except Exception as exc:
      print('folder_access(), exception:', exc)
      return HttpResponseServerError(str(exc))
+
+def authenticateJwt(request, allowQueryToken=True):
+  """JWT authentication for the plain Django views, DRF cannot serve async views."""
+  jwtAuth = CachedJWTAuthentication()
+  header = jwtAuth.get_header(request)
+  try:
+    rawToken = jwtAuth.get_raw_token(header) if header is not None else None
+  except AuthenticationFailed:
+    return None   # A malformed Authorization header
+  if rawToken is None and allowQueryToken:
+    # EventSource cannot set headers, so the access token may also come as query parameter
+    rawToken = request.GET.get('token')
+  if not rawToken:
+    return None
+  try:
+    user = jwtAuth.get_user(jwtAuth.get_validated_token(rawToken))
+  except (InvalidToken, AuthenticationFailed):
+    return None
+  return user if user.is_active else None
+
+def formatEvent(event):
+  return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+def currentStatusEvents(uuids):
+  events = []
+  for obj in Status.objects.filter(id__in=uuids):
+    events.append(to_json_safe({
+      'type': 'status',
+      'uuid': str(obj.id),
+      'operation_branch': obj.operation_branch,
+      'start_time': obj.start_time,
+      'status': obj.status,
+      'folder': obj.directory,
+      'elapsed_time': obj.elapsed_time,
+    }))
+  return events
+
+async def operationEventStream(handling, uuids):
+  subscription = eventBroker.subscribe(uuids)
+  followed = [uuid for uuid in uuids if await sync_to_async(handling.followOutput)(uuid)]
+  try:
+    for event in await sync_to_async(currentStatusEvents)(uuids):
+      yield formatEvent(event)
+
+    while True:
+      try:
+        event = await asyncio.wait_for(subscription.queue.get(), EVENT_STREAM_KEEPALIVE)
+      except asyncio.TimeoutError:
+        yield ': keepalive\n\n'
+        continue
+      if subscription.droppedEvents:
+        # The client was too slow, tell it to reload the state it shows
+        subscription.droppedEvents = 0
+        yield formatEvent({'type': 'resync'})
+      yield formatEvent(event)
+
+  finally:
+    eventBroker.unsubscribe(subscription)
+    for uuid in followed:
+      handling.unfollowOutput(uuid)
+
+async def operation_events(request):
+  """
+  Server-Sent Events stream. Without uuid parameters it carries the status changes of all
+  operations; with ?uuid=...&uuid=... the status changes and new output lines of those.
+  """
+  if request.method != 'GET':
+    return HttpResponseNotAllowed(['GET'])
+  if not isinstance(request, ASGIRequest):
+    return HttpResponse('operation-events needs the server to run under ASGI', status=501)
+
+  user = await sync_to_async(authenticateJwt)(request)
+  if user is None:
+    return HttpResponse('Authentication credentials were not provided or are invalid', status=401)
+
+  uuids = request.GET.getlist('uuid')
+  try:
+    uuids = [str(UUID(value)) for value in uuids]
+  except ValueError:
+    return HttpResponseBadRequest('Invalid uuid')
+
+  handling = await sync_to_async(get_operation_handling)()
+  response = StreamingHttpResponse(operationEventStream(handling, uuids), content_type='text/event-stream')
+  response['Cache-Control'] = 'no-cache'
+  response['X-Accel-Buffering'] = 'no'   # Do not let nginx buffer the stream
+  return response
+
+def get_metrics(request):
+  """
+  The metrics of this process in the Prometheus text format. Scrapers send METRICS_TOKEN as
+  bearer token when it is set, otherwise an access token is needed as for the other views.
+  """
+  if request.method != 'GET':
+    return HttpResponseNotAllowed(['GET'])
+  header = request.headers.get('Authorization', '')
+  tokenMatches = settings.METRICS_TOKEN and hmac.compare_digest(header.encode(), f'Bearer {settings.METRICS_TOKEN}'.encode())
+  if not tokenMatches and authenticateJwt(request, allowQueryToken=False) is None:
+    return HttpResponse('Authentication credentials were not provided or are invalid', status=401)
+  return HttpResponse(Metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
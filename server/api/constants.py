@@ -1,4 +1,6 @@
+import os
 from pathlib import Path
 
 BYSTAR_DIRECTORY = Path('/bxo/usg/bystar').resolve()
-OPERATION_ROOT_DIRECTORY = (BYSTAR_DIRECTORY / 'operationTasks').resolve()
+# Overridable for the benchmarks, which run against a temporary operation root
+OPERATION_ROOT_DIRECTORY = Path(os.getenv('OPERATION_ROOT_DIRECTORY', BYSTAR_DIRECTORY / 'operationTasks')).resolve()
@@ -0,0 +1,75 @@
+#
+# Archive finished operations and their folders
+#
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.Lease import DbLease
+from api.Retention import FOLDER_ACTIONS, StatusRetention
+
+LEASE_TTL = 3600   # Seconds, a run holding the lease longer than this can be overlapped by another one
+
+
+def formatSize(numBytes):
+    for unit in ('B', 'KB', 'MB'):
+        if numBytes < 1024:
+            return f'{numBytes:.1f} {unit}'
+        numBytes /= 1024
+    return f'{numBytes:.1f} GB'
+
+
+class Command(BaseCommand):
+    help = 'Move finished operations older than the retention period to the archive and compress or delete their folders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=settings.STATUS_RETENTION_DAYS,
+                            help='Days since the operation started (default STATUS_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows handled per batch')
+        parser.add_argument('--max-batches', type=int, default=0, help='Stop after this many batches, 0 is unlimited')
+        parser.add_argument('--folders', choices=FOLDER_ACTIONS, default='compress',
+                            help='compress the operation folders into the archive, prune (delete) them or keep them')
+        parser.add_argument('--archive-dir', type=str, default=None, help='Default STATUS_ARCHIVE_DIRECTORY')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and archive every INTERVAL seconds, 0 runs once')
+
+    def handle(self, *args, **options):
+        lease = DbLease('status-retention', LEASE_TTL)
+        while True:
+            if lease.acquire():
+                try:
+                    self.runOnce(options)
+                finally:
+                    lease.release()
+            else:
+                self.stdout.write(self.style.WARNING('Another archiveOperations run is busy, skipped'))
+
+            if options['interval'] <= 0:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def runOnce(self, options):
+        retention = StatusRetention(
+            olderThanDays=options['older_than'], batchSize=options['batch_size'], maxBatches=options['max_batches'],
+            folderAction=options['folders'], archiveDirectory=options['archive_dir'], dryRun=options['dry_run'],
+        )
+        startTime = time.monotonic()
+        stats = retention.run()
+        elapsed = time.monotonic() - startTime
+
+        prefix = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(f'{prefix} {stats.rows} operations started before {retention.cutoff:%Y-%m-%d %H:%M} '
+                          f'in {stats.batches} batches, {elapsed:.1f} s')
+        self.stdout.write(f'  folders: {stats.foldersCompressed} compressed, {stats.foldersPruned} pruned, '
+                          f'{stats.foldersMissing} missing, {stats.foldersShared} still used by newer operations')
+        self.stdout.write(f'  folder size: {formatSize(stats.folderBytes)}'
+                          + (f', compressed {formatSize(stats.compressedBytes)}' if stats.compressedBytes else ''))
+        if not options['dry_run']:
+            self.stdout.write(f'  archive: {formatSize(stats.archiveBytes)} written to {retention.archiveDirectory}')
+        remaining = retention.expired().count()
+        if remaining and not options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{remaining} expired operations left, --max-batches was reached'))
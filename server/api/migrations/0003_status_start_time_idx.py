@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_status"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="status",
+            index=models.Index(fields=["-start_time", "-id"], name="status_start_time_idx"),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:36
+
+from django.db import migrations, models
+
+
+def fill_operation_path(apps, schema_editor):
+    Status = apps.get_model("api", "Status")
+    batch = []
+    for status in Status.objects.only("id", "operation_branch").iterator(chunk_size=2000):
+        status.operation_path = "".join(f"{name}/" for name in status.operation_branch)
+        batch.append(status)
+        if len(batch) >= 2000:
+            Status.objects.bulk_update(batch, ["operation_path"])
+            batch = []
+    if batch:
+        Status.objects.bulk_update(batch, ["operation_path"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_status_start_time_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="status",
+            name="operation_path",
+            field=models.CharField(default="", editable=False, max_length=1024),
+        ),
+        migrations.RunPython(fill_operation_path, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="status",
+            index=models.Index(fields=["operation_path", "-start_time"], name="status_operation_path_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="status",
+            index=models.Index(fields=["status", "-start_time"], name="status_status_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="status",
+            index=models.Index(fields=["directory"], name="status_directory_idx"),
+        ),
+    ]
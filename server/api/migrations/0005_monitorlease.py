@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_status_filters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonitorLease",
+            fields=[
+                ("name", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("owner", models.CharField(max_length=255)),
+                ("expires_at", models.DateTimeField()),
+            ],
+        ),
+    ]
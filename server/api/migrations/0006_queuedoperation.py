@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_monitorlease"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueuedOperation",
+            fields=[
+                ("id", models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ("operation_branch", models.JSONField(default=list)),
+                ("command", models.JSONField(default=list)),
+                ("servers", models.JSONField(default=list)),
+                ("state", models.CharField(choices=[("queued", "Queued"), ("dispatching", "Dispatching"), ("submitted", "Submitted"), ("failed", "Failed")], default="queued", max_length=16)),
+                ("enqueued_at", models.DateTimeField()),
+                ("dispatched_at", models.DateTimeField(blank=True, null=True)),
+                ("error", models.TextField(blank=True)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["state", "enqueued_at"], name="queued_operation_state_idx")],
+            },
+        ),
+    ]
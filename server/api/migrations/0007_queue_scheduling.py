@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_queuedoperation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="queuedoperation",
+            name="priority",
+            field=models.SmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="queuedoperation",
+            name="username",
+            field=models.CharField(blank=True, max_length=150),
+        ),
+        migrations.AlterField(
+            model_name="queuedoperation",
+            name="state",
+            field=models.CharField(choices=[("queued", "Queued"), ("dispatching", "Dispatching"), ("submitted", "Submitted"), ("failed", "Failed"), ("done", "Done")], default="queued", max_length=16),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_queue_scheduling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.CharField(max_length=36)),
+                ('origin', models.CharField(max_length=255)),
+                ('event', models.JSONField()),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='operation_event_created_idx')],
+            },
+        ),
+    ]
@@ -12,14 +12,81 @@ class LibraryRegistration(models.Model):
     def __str__(self):
         return f"library {self.library_name}: {self.module_path}.{self.class_name}"
 
+def operationPath(operationBranch):
+    """Indexable form of an operation branch, 'library/folder/operation/'. A branch prefix is a string prefix."""
+    return ''.join(f'{name}/' for name in operationBranch)
+
 class Status(models.Model):
     id = models.UUIDField(primary_key=True, editable=False)  
     operation_branch = models.JSONField(default=list)
+    operation_path = models.CharField(max_length=1024, default='', editable=False)
     start_time = models.DateTimeField()
     elapsed_time = models.DurationField(null=True, blank=True)  
     status = models.CharField(max_length=128)
     directory = models.CharField(max_length=512)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-start_time', '-id'], name='status_start_time_idx'),
+            models.Index(fields=['operation_path', '-start_time'], name='status_operation_path_idx'),
+            models.Index(fields=['status', '-start_time'], name='status_status_idx'),
+            models.Index(fields=['directory'], name='status_directory_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+      self.operation_path = operationPath(self.operation_branch)
+      super().save(*args, **kwargs)
+
     def __str__(self):
       return f"{self.operation_branch} {self.start_time} {self.status}"
-    
\ No newline at end of file
+    
+class MonitorLease(models.Model):
+    name = models.CharField(max_length=64, primary_key=True)
+    owner = models.CharField(max_length=255)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+      return f"{self.name}: {self.owner} until {self.expires_at}"
+
+class QueuedOperation(models.Model):
+    QUEUED = 'queued'
+    DISPATCHING = 'dispatching'
+    SUBMITTED = 'submitted'
+    FAILED = 'failed'
+    DONE = 'done'
+    STATES = [(QUEUED, 'Queued'), (DISPATCHING, 'Dispatching'), (SUBMITTED, 'Submitted'), (FAILED, 'Failed'), (DONE, 'Done')]
+    RUNNING_STATES = [DISPATCHING, SUBMITTED]
+
+    id = models.UUIDField(primary_key=True, editable=False)   # Same id as the Status row
+    operation_branch = models.JSONField(default=list)
+    command = models.JSONField(default=list)
+    servers = models.JSONField(default=list)
+    username = models.CharField(max_length=150, blank=True)   # Who submitted it, for fair queueing between users
+    priority = models.SmallIntegerField(default=1)            # Scheduler.PRIORITY_CLASSES, lower runs first
+    state = models.CharField(max_length=16, choices=STATES, default=QUEUED)
+    enqueued_at = models.DateTimeField()
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'enqueued_at'], name='queued_operation_state_idx'),
+        ]
+
+    def __str__(self):
+      return f"{self.operation_branch} {self.enqueued_at} {self.state}"
+
+class OperationEvent(models.Model):
+    """A status event, stored so the server processes that did not publish it can pass it to their streams."""
+    uuid = models.CharField(max_length=36)
+    origin = models.CharField(max_length=255)   # The process that published it, see EventRelay
+    event = models.JSONField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='operation_event_created_idx'),
+        ]
+
+    def __str__(self):
+      return f"{self.uuid} {self.created_at} {self.event.get('status')}"
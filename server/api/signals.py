@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .AuthCache import authCache, bumpAuthGeneration
+from .LibraryRegistry import libraryRegistry
+from .models import LibraryRegistration, Status
+from .ResponseCache import branchCache, hierarchyCache, statusCount
+
+
+@receiver([post_save, post_delete], sender=LibraryRegistration)
+def libraryRegistrationChanged(sender, instance, **kwargs):
+  hierarchyCache.invalidate(instance.library_name)
+  branchCache.invalidate(instance.library_name)
+  libraryRegistry.invalidate(instance.library_name)
+
+
+@receiver(post_save, sender=Status)
+def statusSaved(sender, instance, created, **kwargs):
+  if created:
+    statusCount.invalidate()
+
+
+@receiver(post_delete, sender=Status)
+def statusDeleted(sender, instance, **kwargs):
+  statusCount.invalidate()
+
+
+# Password changes, deactivation and deletion, also by the superuserUpdate/superuserDelete commands
+@receiver([post_save, post_delete], sender=User)
+def userChanged(sender, instance, **kwargs):
+  authCache.invalidateUser(instance.pk)
+  bumpAuthGeneration()
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def tokenBlacklisted(sender, instance, created, **kwargs):
+  if created:
+    authCache.addBlacklisted(instance.token.jti)
+    bumpAuthGeneration()
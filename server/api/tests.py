@@ -1,3 +1,1412 @@
-from django.test import TestCase
+import asyncio
+from dataclasses import asdict, dataclass
+import io
+import json
+from pathlib import Path
+import queue
+import gzip
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock
+import uuid
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from webcligui_api import Operation, OperationFolder, OperationState, OperationStatusStart, OperationType, to_json_bytes
+from webcligui_api import AsyncLibraryAPI, LibraryAPI, ParameterList, ParameterOptionsToList, ParameterPreference, ParameterStringValue
+from webcligui_api import SlottedOperation, SlottedOperationFolder
+
+from .AuthCache import authCache
+from .EventBroker import EventBroker, eventBroker
+from .EventRelay import EventRelay
+from . import FileAccess
+from .Lease import DbLease
+from . import OperationHandling as OperationHandlingModule
+from .OperationHandling import STATUS_FILE_NAME, OperationHandling
+from . import OperationQueue as OperationQueueModule
+from .OperationQueue import OperationQueue
+from . import Retention
+from .LibraryAdapters import adaptLibrary
+from . import LibraryRegistry as LibraryRegistryModule
+from .LibraryRegistry import LibraryRegistry, LoadedLibrary
+from .LibraryWorkers import ProcessLibrary
+from . import Metrics
+from .FileAccess import astreamFileJson, fileRange, listDirectory, openFileRange, streamFileJson
+from . import api
+from .OperationTree import compactTree, findNode, subtreeJson
+from .models import LibraryRegistration, MonitorLease, OperationEvent, QueuedOperation, Status
+from .Scheduler import Candidate, Scheduler, parseLimits
+from .ResponseCache import BranchCache, HierarchyCache, branchCache, etagMatches, isCacheable, hierarchyCache, hierarchyVersion
+from .StatusTailer import OutputFollower, StatusTailer
+from .StatusWatcher import StatusWatcher, loadInotify
+
+EVENT_TIMEOUT = 5   # Seconds to wait for an inotify event
+
+
+class TemporaryFolderMixin:
+  def setUp(self):
+    super().setUp()
+    self.folder = Path(tempfile.mkdtemp()).resolve()
+    self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+
+
+@unittest.skipIf(loadInotify() is None, 'inotify is not available')
+class StatusWatcherTests(TemporaryFolderMixin, SimpleTestCase):
+  def setUp(self):
+    super().setUp()
+    self.changes = queue.Queue()
+    self.watcher = StatusWatcher(self.changes.put, lambda: self.changes.put('overflow'))
+
+  def nextChanges(self):
+    return self.changes.get(timeout=EVENT_TIMEOUT)
+
+  def test_reports_the_files_written_in_a_watched_folder(self):
+    operationFolder = self.folder / 'operation'
+    operationFolder.mkdir()
+    self.watcher.addWatch('uuid-1', operationFolder)
+
+    with open(operationFolder / 'neda_status.txt', 'a') as statusFile:
+      statusFile.write('Elapsed time: 0:00:01, running\n')
+
+    changed = {}
+    while 'neda_status.txt' not in changed.get('uuid-1', set()):
+      for uuid, names in self.nextChanges().items():
+        changed.setdefault(uuid, set()).update(names)
+    self.assertEqual(set(changed), {'uuid-1'})
+
+  def test_removed_watch_reports_nothing(self):
+    watched = self.folder / 'watched'
+    unwatched = self.folder / 'unwatched'
+    watched.mkdir()
+    unwatched.mkdir()
+    self.watcher.addWatch('watched', watched)
+    self.watcher.addWatch('unwatched', unwatched)
+    self.watcher.removeWatch('unwatched')
+
+    (unwatched / 'output.txt').write_text('ignored\n')
+    (watched / 'output.txt').write_text('seen\n')
+
+    seen = set()
+    while 'watched' not in seen:
+      seen.update(self.nextChanges())
+    self.assertNotIn('unwatched', seen)
+
+  def test_deleted_folder_drops_its_watch(self):
+    operationFolder = self.folder / 'operation'
+    operationFolder.mkdir()
+    self.watcher.addWatch('uuid-1', operationFolder)
+    shutil.rmtree(operationFolder)
+
+    for _ in range(50):
+      with self.watcher.watchLock:
+        if 'uuid-1' not in self.watcher.uuid2wd:
+          break
+      try:
+        self.changes.get(timeout=0.1)
+      except queue.Empty:
+        pass
+    with self.watcher.watchLock:
+      self.assertNotIn('uuid-1', self.watcher.uuid2wd)
+      self.assertEqual(self.watcher.wd2uuid, {})
+
+  def test_missing_folder_raises(self):
+    with self.assertRaises(OSError):
+      self.watcher.addWatch('uuid-1', self.folder / 'missing')
+
+
+class StatusTailerTests(TemporaryFolderMixin, SimpleTestCase):
+  def setUp(self):
+    super().setUp()
+    self.path = self.folder / 'neda_status.txt'
+    self.path.write_text('')
+    self.tailer = StatusTailer(self.path)
+
+  def append(self, text):
+    with open(self.path, 'a') as statusFile:
+      statusFile.write(text)
+
+  def test_returns_the_last_complete_line_once(self):
+    self.append('first\nsecond\n')
+    self.assertEqual(self.tailer.newLastLine(), 'second\n')
+    self.assertIsNone(self.tailer.newLastLine())
+    self.append('third\n')
+    self.assertEqual(self.tailer.newLastLine(), 'third\n')
+
+  def test_partial_line_waits_for_its_newline(self):
+    self.append('first\npart')
+    self.assertEqual(self.tailer.newLastLine(), 'first\n')
+    self.assertIsNone(self.tailer.newLastLine())
+    self.append('ial\n')
+    self.assertEqual(self.tailer.newLastLine(), 'partial\n')
+
+  def test_line_longer_than_a_read_block(self):
+    longLine = 'x' * 10000 + '\n'
+    self.append('first\n' + longLine)
+    self.assertEqual(self.tailer.newLastLine(), longLine)
+
+  def test_truncated_file_is_read_from_the_start(self):
+    self.append('first\nsecond\n')
+    self.tailer.newLastLine()
+    self.path.write_text('new\n')
+    self.assertEqual(self.tailer.newLastLine(), 'new\n')
+
+
+class OutputFollowerTests(TemporaryFolderMixin, SimpleTestCase):
+  def test_follows_existing_files_from_their_end(self):
+    (self.folder / 'output.log').write_text('old\n')
+    follower = OutputFollower(self.folder)
+    with open(self.folder / 'output.log', 'a') as outputFile:
+      outputFile.write('new 1\nnew 2\npartial')
+    self.assertEqual(follower.newLines('output.log'), ['new 1', 'new 2'])
+    self.assertEqual(follower.newLines('output.log'), [])
+
+  def test_follows_new_files_from_their_start(self):
+    follower = OutputFollower(self.folder)
+    (self.folder / 'created.log').write_text('line\n')
+    self.assertEqual(follower.fileNames(), ['created.log'])
+    self.assertEqual(follower.newLines('created.log'), ['line'])
+
+  def test_reads_at_most_max_bytes(self):
+    follower = OutputFollower(self.folder)
+    (self.folder / 'output.log').write_text('a' * 10 + '\n' + 'b' * 10 + '\n')
+    self.assertEqual(follower.newLines('output.log', maxBytes=15), ['a' * 10])
+    self.assertEqual(follower.newLines('output.log', maxBytes=15), ['b' * 10])
+
+
+class EventBrokerTests(SimpleTestCase):
+  async def test_delivers_the_events_a_subscription_wants(self):
+    broker = EventBroker()
+    everything = broker.subscribe([])
+    followed = broker.subscribe(['uuid-1'])
+
+    broker.publish('uuid-1', {'type': 'output', 'uuid': 'uuid-1'})
+    broker.publish('uuid-2', {'type': 'status', 'uuid': 'uuid-2'})
+    broker.publish('uuid-1', {'type': 'status', 'uuid': 'uuid-1'})
+    await asyncio.sleep(0)
+
+    self.assertEqual([everything.queue.get_nowait()['uuid'] for _ in range(everything.queue.qsize())], ['uuid-2', 'uuid-1'])
+    self.assertEqual([followed.queue.get_nowait()['type'] for _ in range(followed.queue.qsize())], ['output', 'status'])
+
+  async def test_unsubscribed_gets_nothing(self):
+    broker = EventBroker()
+    subscription = broker.subscribe([])
+    broker.unsubscribe(subscription)
+    broker.publish('uuid-1', {'type': 'status', 'uuid': 'uuid-1'})
+    await asyncio.sleep(0)
+    self.assertTrue(subscription.queue.empty())
+
+
+class FileRangeTests(TemporaryFolderMixin, SimpleTestCase):
+  CONTENT = b'line 1\nline 2\nline 3\n'
+
+  def range(self, query, content=CONTENT):
+    return fileRange(io.BytesIO(content), len(content), query)
+
+  def read(self, query):
+    path = self.folder / 'output.txt'
+    path.write_bytes(self.CONTENT)
+    return json.loads(''.join(streamFileJson(*openFileRange(path, query))))
+
+  def test_whole_file_without_parameters(self):
+    self.assertEqual(self.range({}), (0, len(self.CONTENT), False))
+
+  def test_offset_and_length(self):
+    self.assertEqual(self.range({'offset': '7', 'length': '7'}), (7, 14, False))
+    self.assertEqual(self.range({'offset': '100'}), (len(self.CONTENT), len(self.CONTENT), False))
+
+  def test_tail(self):
+    self.assertEqual(self.range({'tail': '2'}), (7, len(self.CONTENT), False))
+    self.assertEqual(self.range({'tail': '10'}), (0, len(self.CONTENT), False))
+    self.assertEqual(self.range({'tail': '0'}), (len(self.CONTENT), len(self.CONTENT), False))
+    self.assertEqual(self.range({'tail': '1'}, b'a\nno newline'), (2, 12, False))
+
+  def test_tail_across_read_chunks(self):
+    content = b''.join(b'%05d\n' % i for i in range(FileAccess.READ_CHUNK_SIZE // 3))
+    offset, end, _ = self.range({'tail': '3'}, content)
+    self.assertEqual(content[offset:end], b''.join(b'%05d\n' % i for i in range(FileAccess.READ_CHUNK_SIZE // 3 - 3, FileAccess.READ_CHUNK_SIZE // 3)))
+
+  def test_since_past_the_end_restarts_truncated(self):
+    self.assertEqual(self.range({'since': '14'}), (14, len(self.CONTENT), False))
+    self.assertEqual(self.range({'since': '100'}), (0, len(self.CONTENT), True))
+
+  def test_invalid_parameters_raise(self):
+    for query in ({'tail': '-1'}, {'offset': '-1'}, {'length': '-1'}, {'since': 'x'}):
+      with self.subTest(query=query), self.assertRaises(ValueError):
+        self.range(query)
+
+  def test_streams_the_range_as_json(self):
+    data = self.read({'tail': '1'})
+    self.assertEqual(data['content'], 'line 3\n')
+    self.assertEqual((data['offset'], data['next_offset'], data['size']), (14, 21, 21))
+
+  def test_multibyte_character_split_across_chunks(self):
+    path = self.folder / 'output.txt'
+    content = 'x' * (FileAccess.READ_CHUNK_SIZE - 1) + '\u00e9"\n'
+    path.write_text(content, encoding='utf-8')
+    data = json.loads(''.join(streamFileJson(*openFileRange(path, {}))))
+    self.assertEqual(data['content'], content)
+
+  async def test_async_stream_matches_the_sync_stream(self):
+    path = self.folder / 'output.txt'
+    path.write_bytes(self.CONTENT)
+    chunks = [chunk async for chunk in astreamFileJson(*openFileRange(path, {'offset': '7'}))]
+    self.assertEqual(json.loads(''.join(chunks)), self.read({'offset': '7'}))
+
+
+class ListDirectoryTests(TemporaryFolderMixin, SimpleTestCase):
+  def setUp(self):
+    super().setUp()
+    for name, size in (('b.log', 3), ('a.txt', 1), ('d.log', 2), ('c.txt', 4)):
+      (self.folder / name).write_bytes(b'x' * size)
+    (self.folder / 'sub').mkdir()
+
+  def pages(self, query):
+    names = []
+    cursor = None
+    while True:
+      page = listDirectory(self.folder, {**query, **({'cursor': cursor} if cursor else {})})
+      names.append([entry['name'] for entry in page['entries']])
+      cursor = page['next_cursor']
+      if cursor is None:
+        return names
+
+  def test_pages_through_the_sorted_entries(self):
+    self.assertEqual(self.pages({'limit': '2'}), [['a.txt', 'b.log'], ['c.txt', 'd.log'], ['sub']])
+
+  def test_descending_pages(self):
+    self.assertEqual(self.pages({'limit': '2', 'order': 'desc'}), [['sub', 'd.log'], ['c.txt', 'b.log'], ['a.txt']])
+
+  def test_sort_by_size_with_pattern(self):
+    self.assertEqual(self.pages({'sort': 'size', 'pattern': '*.log', 'limit': '1'}), [['d.log'], ['b.log']])
+
+  def test_entries_added_between_pages_are_not_repeated(self):
+    page = listDirectory(self.folder, {'limit': '2'})
+    (self.folder / '0-first.txt').write_text('')
+    rest = listDirectory(self.folder, {'limit': '10', 'cursor': page['next_cursor']})
+    self.assertEqual([entry['name'] for entry in rest['entries']], ['c.txt', 'd.log', 'sub'])
+    self.assertEqual(rest['total'], 6)
+
+  def test_entry_metadata(self):
+    entries = {entry['name']: entry for entry in listDirectory(self.folder, {})['entries']}
+    self.assertEqual((entries['c.txt']['type'], entries['c.txt']['size']), ('file', 4))
+    self.assertEqual(entries['sub']['type'], 'directory')
+
+  def test_invalid_parameters_raise(self):
+    nameCursor = listDirectory(self.folder, {'limit': '1'})['next_cursor']
+    for query in ({'sort': 'owner'}, {'limit': '0'}, {'cursor': 'not a cursor'}, {'sort': 'size', 'cursor': nameCursor}):
+      with self.subTest(query=query), self.assertRaises(ValueError):
+        listDirectory(self.folder, query)
+
+
+class VersionedLibrary:
+  def __init__(self):
+    self.version = 1
+
+  def getOperationHierarchyVersion(self):
+    return self.version
+
+
+class HierarchyCacheTests(SimpleTestCase):
+  def test_entry_is_valid_for_its_version(self):
+    cache = HierarchyCache()
+    library = VersionedLibrary()
+    entry = cache.store('lib', hierarchyVersion(library), b'{"name": "root"}')
+    self.assertIs(cache.lookup('lib', hierarchyVersion(library)), entry)
+    library.version = 2
+    self.assertIsNone(cache.lookup('lib', hierarchyVersion(library)))
+
+  def test_etag_follows_the_body(self):
+    cache = HierarchyCache()
+    first = cache.store('lib', (None, 1), b'one').etag
+    self.assertEqual(cache.store('lib', (None, 2), b'one').etag, first)
+    self.assertNotEqual(cache.store('lib', (None, 3), b'two').etag, first)
+
+  def test_invalidate(self):
+    cache = HierarchyCache()
+    cache.store('lib', (None, 1), b'one')
+    cache.store('other', (None, 1), b'two')
+    cache.invalidate('lib')
+    self.assertIsNone(cache.lookup('lib', (None, 1)))
+    self.assertIsNotNone(cache.lookup('other', (None, 1)))
+    cache.invalidate()
+    self.assertIsNone(cache.lookup('other', (None, 1)))
+
+  def test_etag_matches(self):
+    self.assertTrue(etagMatches('"abc"', '"abc"'))
+    self.assertTrue(etagMatches('"x", W/"abc"', '"abc"'))
+    self.assertTrue(etagMatches('*', '"abc"'))
+    self.assertFalse(etagMatches('"x"', '"abc"'))
+    self.assertFalse(etagMatches(None, '"abc"'))
+
+
+class HierarchyInvalidationTests(TestCase):
+  def tearDown(self):
+    hierarchyCache.invalidate()
+
+  def test_changed_registration_invalidates_the_library(self):
+    hierarchyCache.store('lib', (None, 1), b'one')
+    registration = LibraryRegistration.objects.create(library_name='lib', module_path='lib.module', class_name='Library')
+    self.assertIsNone(hierarchyCache.lookup('lib', (None, 1)))
+    hierarchyCache.store('lib', (None, 1), b'one')
+    registration.delete()
+    self.assertIsNone(hierarchyCache.lookup('lib', (None, 1)))
+
+
+class BranchCacheTests(SimpleTestCase):
+  def test_entry_is_valid_for_its_version(self):
+    cache = BranchCache()
+    cache.store('lib', 'description', ['folder', 'op'], (None, 1), b'body')
+    self.assertEqual(cache.lookup('lib', 'description', ('folder', 'op'), (None, 1)), b'body')
+    self.assertIsNone(cache.lookup('lib', 'parameters', ['folder', 'op'], (None, 1)))
+    self.assertIsNone(cache.lookup('lib', 'description', ['folder', 'op'], (None, 2)))
+    self.assertEqual(len(cache.entries), 0)
+
+  def test_least_recently_used_entry_is_evicted(self):
+    cache = BranchCache(maxSize=2)
+    cache.store('lib', 'description', ['a'], None, b'a')
+    cache.store('lib', 'description', ['b'], None, b'b')
+    cache.lookup('lib', 'description', ['a'], None)
+    cache.store('lib', 'description', ['c'], None, b'c')
+    self.assertEqual(cache.lookup('lib', 'description', ['a'], None), b'a')
+    self.assertIsNone(cache.lookup('lib', 'description', ['b'], None))
+
+  def test_invalidate_one_library(self):
+    cache = BranchCache()
+    cache.store('lib', 'description', ['a'], None, b'a')
+    cache.store('other', 'description', ['a'], None, b'other')
+    cache.invalidate('lib')
+    self.assertIsNone(cache.lookup('lib', 'description', ['a'], None))
+    self.assertEqual(cache.lookup('other', 'description', ['a'], None), b'other')
+
+  def test_library_hooks_decide_what_is_cacheable(self):
+    class Library:
+      def isDescriptionCacheable(self, operationBranch):
+        return operationBranch[0] != 'live'
+
+    self.assertTrue(isCacheable(Library(), 'description', ['static']))
+    self.assertFalse(isCacheable(Library(), 'description', ['live']))
+    self.assertTrue(isCacheable(Library(), 'parameters', ['live']))
+
+
+@dataclass
+class EncodedRecord:
+  state: OperationState
+  started: datetime
+  elapsed: timedelta
+  ratio: float
+  note: str | None
+  owner: str
+  operations: list
+
+
+class JsonEncoderTests(SimpleTestCase):
+  def assertEncodesLikeJsonDumps(self, obj):
+    self.assertEqual(to_json_bytes(obj), json.dumps(api.to_json_safe(asdict(obj))).encode())
+
+  def test_operation_dataclasses(self):
+    hierarchy = OperationFolder(name='bibliothèque', portfolio=[
+      OperationFolder(name='empty'),
+      Operation(name='opération', operation_type=OperationType.PYTHON, operation_module='module'),
+      Operation(name='op', operation_type=OperationType.PIPX),
+    ])
+    self.assertEncodesLikeJsonDumps(hierarchy)
+    self.assertEncodesLikeJsonDumps(OperationStatusStart(uuid='uuid-1', folder='/operations/日本',
+                                                         start_time=datetime(2026, 1, 1, 12, 30, tzinfo=timezone.utc)))
+
+  def test_parameter_dataclasses(self):
+    parameters = ParameterOptionsToList(name='options', mandatory=True, selectedListIdx=0, options=[
+      ParameterList(name='first', description='naïve', parameters=[
+        ParameterPreference(name='flag'),
+        ParameterStringValue(name='value', value='ünïcödé "quoted"\n', description=None),
+      ]),
+      ParameterList(name='second'),
+    ])
+    self.assertEncodesLikeJsonDumps(parameters)
+
+  def test_enum_datetime_timedelta_none_and_nan_fields(self):
+    for ratio in (float('nan'), float('inf'), 0.1):
+      record = EncodedRecord(state=OperationState.FAILED, started=datetime(2026, 1, 1, tzinfo=timezone.utc),
+                             elapsed=timedelta(minutes=1, microseconds=5), ratio=ratio, note=None, owner='Zoë',
+                             operations=[Operation(name='op', operation_type=OperationType.MODULE)])
+      with self.subTest(ratio=ratio):
+        self.assertEncodesLikeJsonDumps(record)
+
+
+class StatusListTestCase(TestCase):
+  """Status rows started a minute apart, the newest last, listed without the operation queue."""
+  START_TIME = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+  def setUp(self):
+    self.client = APIClient()
+    self.client.force_authenticate(User.objects.create_user('tester', password='secret'))
+    patcher = mock.patch.object(api, 'get_operation_handling', return_value=SimpleNamespace(queue=None))
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def addStatus(self, operationBranch, minutes, status='finished', directory='/operations/run'):
+    return Status.objects.create(id=uuid.uuid4(), operation_branch=operationBranch, status=status, directory=directory,
+                                 start_time=self.START_TIME + timedelta(minutes=minutes))
+
+  def statusList(self, **query):
+    return self.client.get('/api/get-operation-status-list', query)
+
+  def uuids(self, response):
+    return [statusData['uuid'] for statusData in response.json()['status_data']]
+
+
+class StatusListPagingTests(StatusListTestCase):
+  def setUp(self):
+    super().setUp()
+    # Two operations per start time, the cursor has to order them by id as well
+    self.newestFirst = sorted((self.addStatus(['lib', 'op'], minutes // 2) for minutes in range(7)),
+                              key=lambda status: (status.start_time, status.id), reverse=True)
+
+  def test_after_pages_through_every_row_once(self):
+    uuids = []
+    query = {'limit': 3}
+    while True:
+      data = self.statusList(**query).json()
+      uuids.extend(statusData['uuid'] for statusData in data['status_data'])
+      if data['next_after'] is None:
+        break
+      query['after'] = data['next_after']
+    self.assertEqual(uuids, [str(status.id) for status in self.newestFirst])
+
+  def test_after_matches_offset_paging(self):
+    firstPage = self.statusList(limit=2).json()
+    self.assertEqual(self.uuids(self.statusList(limit=2, after=firstPage['next_after'])),
+                     self.uuids(self.statusList(limit=2, offset=2)))
+
+  def test_invalid_paging_parameters(self):
+    for query in ({'limit': 0}, {'limit': -1}, {'limit': 'x'}, {'offset': -1}, {'after': 'not a token'}, {'count': 'all'}):
+      with self.subTest(query=query):
+        self.assertEqual(self.statusList(**query).status_code, 400)
+
+
+class StatusListFilterTests(StatusListTestCase):
+  def setUp(self):
+    super().setUp()
+    self.build = self.addStatus(['lib', 'build'], 0, directory='/operations/lib/build/1')
+    self.buildAll = self.addStatus(['lib', 'build_all'], 1, status='failed', directory='/operations/lib/build_all/1')
+    self.deploy = self.addStatus(['lib', 'deploy', 'prod'], 2, directory='/operations/lib/deploy/1')
+    self.other = self.addStatus(['other', 'build'], 3, directory='/other/1')
+
+  def filtered(self, **query):
+    return set(self.uuids(self.statusList(**query)))
+
+  def expected(self, *statuses):
+    return {str(status.id) for status in statuses}
+
+  def test_branch_prefix_matches_whole_names(self):
+    self.assertEqual(self.filtered(branch='lib/build'), self.expected(self.build))
+    self.assertEqual(self.filtered(branch='/lib/'), self.expected(self.build, self.buildAll, self.deploy))
+
+  def test_empty_branch_is_no_filter(self):
+    self.assertEqual(self.filtered(branch='/'), self.expected(self.build, self.buildAll, self.deploy, self.other))
+
+  def test_folder_prefix(self):
+    self.assertEqual(self.filtered(folder='/operations/lib/build'), self.expected(self.build, self.buildAll))
+    self.assertEqual(self.filtered(folder='/operations/lib/build/'), self.expected(self.build))
+
+  def test_status_and_start_time(self):
+    self.assertEqual(self.filtered(status='failed'), self.expected(self.buildAll))
+    self.assertEqual(self.filtered(start_after='2026-01-01T00:01:00Z', start_before='2026-01-01T00:03:00Z'),
+                     self.expected(self.buildAll, self.deploy))
+    self.assertEqual(self.statusList(start_after='yesterday').status_code, 400)
+
+  def test_filtered_total_is_exact(self):
+    self.assertEqual(self.statusList(branch='lib', limit=1).json()['total_num_status'], 3)
+
+
+@override_settings(OPERATION_MONITOR_MODE='poll', OPERATION_QUEUE_WORKERS=0, OPERATION_EVENT_RELAY_INTERVAL=0)
+class OperationHandlingTestCase(TemporaryFolderMixin, TestCase):
+  """An OperationHandling without its monitor timer, over operation folders in a temporary directory."""
+  START_TIME = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+  def setUp(self):
+    super().setUp()
+    for patcher in (mock.patch.object(OperationHandling, 'runInterval'),
+                    mock.patch.object(OperationHandlingModule, 'OPERATION_ROOT_DIRECTORY', self.folder),
+                    mock.patch.object(eventBroker, 'publish')):
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    self.handling = self.createHandling()
+    self.handling.uuids = {}
+
+  def createHandling(self):
+    return OperationHandling()
+
+  def addOperation(self, directory, statusLine=None):
+    (self.folder / directory).mkdir(parents=True, exist_ok=True)
+    if statusLine is not None:
+      self.writeStatus(directory, statusLine)
+    status = Status.objects.create(id=uuid.uuid4(), operation_branch=['lib', 'op'], status=OperationState.STARTED.value,
+                                   directory=directory, start_time=self.START_TIME)
+    self.handling.uuids[str(status.id)] = directory
+    return status
+
+  def writeStatus(self, directory, statusLine):
+    with open(self.folder / directory / STATUS_FILE_NAME, 'a') as statusFile:
+      statusFile.write(statusLine + '\n')
+
+
+class StatusSweepTests(OperationHandlingTestCase):
+  def test_changes_are_written_with_one_bulk_update(self):
+    statuses = [self.addOperation(f'op{idx}', f'Elapsed time: 0:00:0{idx}, running') for idx in range(3)]
+    with mock.patch.object(Status.objects, 'bulk_update', wraps=Status.objects.bulk_update) as bulkUpdate:
+      # The savepoint of the transaction, the UPDATE, the release of the savepoint
+      with self.assertNumQueries(3):
+        self.handling.checkUuids()
+    bulkUpdate.assert_called_once()
+    self.assertEqual({str(stat.id) for stat in bulkUpdate.call_args.args[0]}, {str(status.id) for status in statuses})
+    for idx, status in enumerate(statuses):
+      status.refresh_from_db()
+      self.assertEqual((status.status, status.elapsed_time), ('running', timedelta(seconds=idx)))
+
+  def test_unchanged_rows_are_not_rewritten(self):
+    changed = self.addOperation('changed', 'Elapsed time: 0:00:01, running')
+    self.addOperation('same', 'Elapsed time: 0:00:01, running')
+    self.addOperation('rewritten', 'Elapsed time: 0:00:01, running')
+    self.handling.checkUuids()
+
+    with self.assertNumQueries(0):
+      self.handling.checkUuids()
+
+    self.writeStatus('changed', 'Elapsed time: 0:00:02, running')
+    self.writeStatus('rewritten', 'Elapsed time: 0:00:01, running')   # The same status written again
+    with mock.patch.object(Status.objects, 'bulk_update', wraps=Status.objects.bulk_update) as bulkUpdate:
+      self.handling.checkUuids()
+    self.assertEqual([str(stat.id) for stat in bulkUpdate.call_args.args[0]], [str(changed.id)])
+
+
+class DbLeaseTests(TestCase):
+  def test_one_holder_at_a_time(self):
+    first = DbLease('monitor', 60)
+    second = DbLease('monitor', 60)
+    self.assertTrue(first.acquire())
+    self.assertFalse(second.acquire())
+    self.assertTrue(first.acquire())
+    self.assertTrue(DbLease('other', 60).acquire())
+
+  def test_expired_lease_is_taken_over(self):
+    first = DbLease('monitor', 60)
+    second = DbLease('monitor', 60)
+    first.acquire()
+    MonitorLease.objects.filter(name='monitor').update(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+    self.assertTrue(second.acquire())
+    self.assertFalse(first.acquire())
+
+  def test_released_lease_is_free(self):
+    first = DbLease('monitor', 60)
+    second = DbLease('monitor', 60)
+    first.acquire()
+    second.release()   # Not the holder, changes nothing
+    self.assertFalse(second.acquire())
+    first.release()
+    self.assertTrue(second.acquire())
+
+
+class EventRelayTests(TestCase):
+  def setUp(self):
+    patcher = mock.patch.object(eventBroker, 'publish')
+    self.published = patcher.start()
+    self.addCleanup(patcher.stop)
+    self.leader = EventRelay('leader')
+    self.worker = EventRelay('worker')
+
+  def statusEvent(self, uuid, statusText):
+    return uuid, {'type': 'status', 'uuid': uuid, 'status': statusText}
+
+  def deliveredStatus(self):
+    return [event['status'] for _uuid, event in (call.args for call in self.published.call_args_list)]
+
+  def test_delivers_the_events_of_other_processes_once(self):
+    self.leader.record([self.statusEvent('uuid-1', 'before the worker started')])
+    self.assertEqual(self.worker.poll(), 0)
+
+    self.leader.record([self.statusEvent('uuid-1', 'running'), self.statusEvent('uuid-2', 'finished')])
+    self.worker.record([self.statusEvent('uuid-3', 'queued')])
+    self.assertEqual(self.worker.poll(), 2)
+    self.assertEqual(self.worker.poll(), 0)
+    self.assertEqual(self.deliveredStatus(), ['running', 'finished'])
+    self.published.assert_any_call('uuid-1', {'type': 'status', 'uuid': 'uuid-1', 'status': 'running'})
+
+  def test_event_committed_out_of_id_order_is_delivered(self):
+    self.worker.poll()
+    self.leader.record([self.statusEvent('uuid-1', 'first')])
+    late = OperationEvent.objects.get()
+    self.leader.record([self.statusEvent('uuid-1', 'second')])
+    # As if the transaction writing the first row committed after the second one was polled
+    late.delete()
+    self.worker.poll()
+    late.save()
+    self.worker.poll()
+    self.assertEqual(self.deliveredStatus(), ['second', 'first'])
+
+  def test_prune_deletes_old_events(self):
+    self.leader.record([self.statusEvent('uuid-1', 'old')])
+    OperationEvent.objects.update(created_at=datetime.now(timezone.utc) - timedelta(hours=1))
+    self.leader.record([self.statusEvent('uuid-1', 'new')])
+    self.leader.prune()
+    self.assertEqual([event.event['status'] for event in OperationEvent.objects.all()], ['new'])
+
+
+class StubLibrary(LibraryAPI):
+  """Starts every operation in a new folder below root, or raises error when given."""
+
+  def __init__(self, root, error=None):
+    self.root = root
+    self.error = error
+    self.submitted = []
+    self.threadNames = []   # Of the threads the methods were called on
+
+  def getOperationHierarchy(self):
+    self.threadNames.append(threading.current_thread().name)
+    return OperationFolder(name='lib', portfolio=[Operation(name='op', operation_type=OperationType.PYTHON)])
+
+  def getDescription(self, operationBranch):
+    self.threadNames.append(threading.current_thread().name)
+    return f'Description of {"/".join(operationBranch)}'
+
+  def getParameters(self, operationBranch):
+    self.threadNames.append(threading.current_thread().name)
+    return ParameterList(name='parameters', parameters=[ParameterStringValue(name='value')])
+
+  def submitOperation(self, operationBranch, command, servers):
+    self.threadNames.append(threading.current_thread().name)
+    if self.error is not None:
+      raise self.error
+    self.submitted.append((operationBranch, command, servers))
+    folder = f'run{len(self.submitted)}-{uuid.uuid4()}'
+    (self.root / folder).mkdir()
+    return OperationStatusStart(uuid=str(uuid.uuid4()), start_time=datetime.now(timezone.utc), folder=folder)
+
+
+class AsyncStubLibrary(AsyncLibraryAPI):
+  """The StubLibrary behind coroutines."""
+
+  def __init__(self, root):
+    self.stub = StubLibrary(root)
+
+  async def getOperationHierarchy(self):
+    await asyncio.sleep(0)
+    return self.stub.getOperationHierarchy()
+
+  async def getDescription(self, operationBranch):
+    await asyncio.sleep(0)
+    return self.stub.getDescription(operationBranch)
+
+  async def getParameters(self, operationBranch):
+    await asyncio.sleep(0)
+    return self.stub.getParameters(operationBranch)
+
+  async def submitOperation(self, operationBranch, command, servers):
+    await asyncio.sleep(0)
+    return self.stub.submitOperation(operationBranch, command, servers)
+
+
+class OperationQueueTestCase(OperationHandlingTestCase):
+  """An OperationQueue, without its dispatcher thread, of the leader; the queued operations run in the test's thread."""
+
+  def setUp(self):
+    super().setUp()
+    for patcher in (mock.patch.object(OperationQueue, 'dispatchLoop'),
+                    mock.patch.object(OperationQueueModule, 'close_old_connections')):
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    self.libraries = self.createLibraries()
+    self.queue = self.handling.queue = OperationQueue(self.handling, self.libraries.get, 2)
+    self.addCleanup(self.queue.executor.shutdown)
+    submitPatcher = mock.patch.object(self.queue.executor, 'submit', side_effect=lambda function, *args: function(*args))
+    submitPatcher.start()
+    self.addCleanup(submitPatcher.stop)
+    self.handling.isLeader = True
+
+  def enqueue(self, libraryName='lib'):
+    queuedUuid = str(uuid.uuid4())
+    self.queue.enqueue([(queuedUuid, [libraryName, 'op'], ['--flag'], ['host1'], 1)], 'tester')
+    return queuedUuid
+
+  def queueState(self, uuid):
+    return QueuedOperation.objects.get(id=uuid).state
+
+  def endOperation(self, uuid, statusText):
+    self.writeStatus(Status.objects.get(id=uuid).directory, f'Elapsed time: 0:00:05, {statusText}')
+    self.handling.checkUuids()
+
+
+class OperationQueueTests(OperationQueueTestCase):
+  def createLibraries(self):
+    return {'lib': StubLibrary(self.folder)}
+
+  def test_enqueue_stores_the_status_and_the_queued_operation(self):
+    uuid = self.enqueue()
+    self.assertEqual(Status.objects.get(id=uuid).status, OperationState.QUEUED.value)
+    queued = QueuedOperation.objects.get(id=uuid)
+    self.assertEqual((queued.state, queued.command, queued.servers, queued.username),
+                     (QueuedOperation.QUEUED, ['--flag'], ['host1'], 'tester'))
+
+  def test_claimed_operation_is_submitted_and_tracked(self):
+    uuid = self.enqueue()
+    self.queue.dispatch()
+    self.assertEqual(self.libraries['lib'].submitted, [(['op'], ['--flag'], ['host1'])])
+    self.assertEqual(self.queueState(uuid), QueuedOperation.SUBMITTED)
+    status = Status.objects.get(id=uuid)
+    self.assertEqual(status.status, OperationState.STARTED.value)
+    self.assertTrue((self.folder / status.directory / STATUS_FILE_NAME).exists())
+    self.assertIn(uuid, self.handling.uuids)
+    self.assertEqual(self.queue.inFlight, set())
+
+  def test_claim_happens_once(self):
+    self.enqueue()
+    queued = QueuedOperation.objects.get()
+    self.assertTrue(self.queue.claim(queued))
+    self.assertFalse(self.queue.claim(queued))
+
+  def test_finished_and_failed_operations_are_done(self):
+    for statusText in (OperationState.FINISHED.value, OperationState.FAILED.value):
+      with self.subTest(status=statusText):
+        uuid = self.enqueue()
+        self.queue.dispatch()
+        self.endOperation(uuid, statusText)
+        self.assertEqual(self.queueState(uuid), QueuedOperation.DONE)
+        self.assertNotIn(uuid, self.handling.uuids)
+        self.assertNotIn(uuid, self.handling.tailers)
+        self.assertEqual(self.queue.loadCandidates(), ([], []))
+
+  def test_library_error_fails_the_operation(self):
+    self.libraries['lib'].error = RuntimeError('no such server')
+    uuid = self.enqueue()
+    self.queue.dispatch()
+    queued = QueuedOperation.objects.get(id=uuid)
+    self.assertEqual((queued.state, queued.error), (QueuedOperation.FAILED, 'no such server'))
+    self.assertEqual(Status.objects.get(id=uuid).status, OperationState.FAILED.value)
+
+  def test_only_the_leader_dispatches(self):
+    self.handling.isLeader = False
+    uuid = self.enqueue()
+    self.queue.dispatch()
+    self.assertEqual(self.queueState(uuid), QueuedOperation.QUEUED)
+
+  def test_requeue_abandoned(self):
+    abandoned = self.enqueue()
+    finished = self.enqueue()
+    running = self.enqueue()
+    QueuedOperation.objects.filter(id=abandoned).update(state=QueuedOperation.DISPATCHING, dispatched_at=self.START_TIME)
+    QueuedOperation.objects.filter(id__in=[finished, running]).update(state=QueuedOperation.SUBMITTED)
+    Status.objects.filter(id=finished).update(status=OperationState.FAILED.value)
+    Status.objects.filter(id=running).update(status='running')
+
+    self.queue.requeueAbandoned()
+    self.assertEqual(self.queueState(abandoned), QueuedOperation.QUEUED)
+    self.assertIsNone(QueuedOperation.objects.get(id=abandoned).dispatched_at)
+    self.assertEqual(self.queueState(finished), QueuedOperation.DONE)
+    self.assertEqual(self.queueState(running), QueuedOperation.SUBMITTED)
+
+
+class LibraryAdapterTests(OperationQueueTestCase):
+  def createLibraries(self):
+    self.syncLibrary = StubLibrary(self.folder)
+    self.asyncLibrary = AsyncStubLibrary(self.folder)
+    self.loaded = {}
+    for libraryName, libraryApiImpl in (('synclib', self.syncLibrary), ('asynclib', self.asyncLibrary)):
+      syncApi, asyncApi = adaptLibrary(libraryApiImpl, libraryName)
+      self.loaded[libraryName] = LoadedLibrary(registration=(__name__, type(libraryApiImpl).__name__),
+                                               syncApi=syncApi, asyncApi=asyncApi, importSeconds=0)
+    return {libraryName: loaded.syncApi for libraryName, loaded in self.loaded.items()}
+
+  def setUp(self):
+    super().setUp()
+    for patcher in (mock.patch.object(api.libraryRegistry, 'get', side_effect=self.loaded.get),
+                    mock.patch.object(api.libraryRegistry, 'loadAll', return_value=list(self.loaded.items())),
+                    mock.patch.object(api, 'get_operation_handling', return_value=self.handling)):
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    self.addCleanup(hierarchyCache.invalidate)
+    self.addCleanup(branchCache.invalidate)
+    user = User.objects.create_user('tester', password='secret')
+    self.authorization = f'Bearer {RefreshToken.for_user(user).access_token}'
+
+  def post(self, path, body):
+    return self.client.post(path, body, content_type='application/json', HTTP_AUTHORIZATION=self.authorization)
+
+  def test_sync_library_is_served_by_the_async_views(self):
+    self.handling.queue = None   # Submitted right away, through the library
+    response = self.client.get('/api/get-operation-hierarchy', HTTP_AUTHORIZATION=self.authorization)
+    self.assertEqual([hierarchy['portfolio'][0]['name'] for hierarchy in response.json()], ['op', 'op'])
+    self.assertEqual(self.post('/api/get-description', {'operationBranch': ['synclib', 'op']}).json(), 'Description of op')
+    self.assertEqual(self.post('/api/get-parameters', {'operationBranch': ['synclib', 'op']}).json()['name'], 'parameters')
+
+    response = self.post('/api/submit-operation', {'operation_branch': ['synclib', 'op'], 'command': ['run'], 'servers': ['host1']})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(self.syncLibrary.submitted, [(['op'], ['run'], ['host1'])])
+    self.assertEqual(Status.objects.get(id=response.json()['uuid']).status, OperationState.STARTED.value)
+    # On the threads of the libraryExecutor, not on the event loop
+    self.assertEqual(len(self.syncLibrary.threadNames), 4)
+    self.assertTrue(all(name.startswith('LibraryAPI') for name in self.syncLibrary.threadNames), self.syncLibrary.threadNames)
+
+  def test_async_library_is_submitted_by_the_queue(self):
+    uuid = self.enqueue('asynclib')
+    self.queue.dispatch()
+    self.assertEqual(self.asyncLibrary.stub.submitted, [(['op'], ['--flag'], ['host1'])])
+    self.assertEqual(self.queueState(uuid), QueuedOperation.SUBMITTED)
+    self.assertEqual(Status.objects.get(id=uuid).status, OperationState.STARTED.value)
+
+  def test_async_library_started_without_the_queue(self):
+    status = self.handling.startOperation(self.libraries['asynclib'], ['asynclib', 'op'], ['run'], ['host1'])
+    self.assertEqual(self.asyncLibrary.stub.submitted, [(['op'], ['run'], ['host1'])])
+    self.assertTrue((self.folder / status.folder / STATUS_FILE_NAME).exists())
+    self.assertEqual(Status.objects.get(id=status.uuid).directory, status.folder)
+
+
+class SubmitOperationsTests(OperationHandlingTestCase):
+  def setUp(self):
+    super().setUp()
+    self.libraries = {'lib': StubLibrary(self.folder), 'broken': StubLibrary(self.folder, error=RuntimeError('host down'))}
+    for patcher in (mock.patch.object(api, 'get_operation_handling', return_value=self.handling),
+                    mock.patch.object(api, 'getLibraryApi', side_effect=self.libraries.get)):
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    self.client = APIClient()
+    self.client.force_authenticate(User.objects.create_user('tester', password='secret'))
+
+  def submit(self, body):
+    return self.client.post('/api/submit-operations', body, format='json')
+
+  def test_fan_out_splits_an_operation_per_server(self):
+    response = self.submit({'operations': [
+      {'operation_branch': ['lib', 'op'], 'command': ['run'], 'servers': ['host1', 'host2', 'host3'], 'fan_out': True},
+      {'operation_branch': ['lib', 'op'], 'command': ['check'], 'servers': ['host1', 'host2']},
+    ]})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual([result['index'] for result in response.json()['results']], [0, 0, 0, 1])
+    self.assertCountEqual(self.libraries['lib'].submitted, [
+      (['op'], ['run'], ['host1']), (['op'], ['run'], ['host2']), (['op'], ['run'], ['host3']),
+      (['op'], ['check'], ['host1', 'host2']),
+    ])
+
+  def test_partial_success(self):
+    response = self.submit({'operations': [
+      {'operation_branch': ['lib', 'op'], 'command': [], 'servers': ['host1']},
+      {'operation_branch': ['unknown', 'op'], 'command': [], 'servers': ['host1']},
+      {'operation_branch': ['broken', 'op'], 'command': [], 'servers': ['host1']},
+    ]})
+    self.assertEqual(response.status_code, 200)
+    results = response.json()['results']
+    self.assertEqual(results[1], {'index': 1, 'ok': False, 'error': 'Libraryname "unknown" not known!'})
+    self.assertEqual(results[2], {'index': 2, 'ok': False, 'error': 'host down'})
+    self.assertEqual((results[0]['index'], results[0]['ok']), (0, True))
+    operation = results[0]['operation']
+    self.assertEqual((operation['operation_branch'], operation['status']), (['lib', 'op'], OperationState.STARTED.value))
+    self.assertEqual(list(Status.objects.values_list('id', flat=True)), [uuid.UUID(operation['uuid'])])
+
+  def test_status_rows_are_created_with_one_bulk_create(self):
+    with mock.patch.object(Status.objects, 'bulk_create', wraps=Status.objects.bulk_create) as bulkCreate:
+      response = self.submit({'fan_out': True, 'operations': [
+        {'operation_branch': ['lib', 'op'], 'command': [], 'servers': ['host1', 'host2']},
+        {'operation_branch': ['lib', 'other'], 'command': [], 'servers': ['host3']},
+      ]})
+    self.assertTrue(all(result['ok'] for result in response.json()['results']))
+    bulkCreate.assert_called_once()
+    self.assertEqual(len(bulkCreate.call_args.args[0]), 3)
+    self.assertEqual(Status.objects.count(), 3)
+
+  def test_parallelism_is_at_least_one(self):
+    operations = [{'operation_branch': ['lib', 'op'], 'command': [], 'servers': ['host1']}]
+    with mock.patch.object(self.handling, 'submitOperations', wraps=self.handling.submitOperations) as submitOperations:
+      for parallelism, expected in ((-5, 1), (0, 1), ('2', 2), (10000, settings.SUBMIT_BATCH_PARALLELISM)):
+        with self.subTest(parallelism=parallelism):
+          self.assertEqual(self.submit({'operations': operations, 'parallelism': parallelism}).status_code, 200)
+          self.assertEqual(submitOperations.call_args.args[1], expected)
+
+  def test_invalid_body_is_a_bad_request(self):
+    operation = {'operation_branch': ['lib', 'op'], 'command': [], 'servers': []}
+    for body in ({'operations': [operation], 'parallelism': 'abc'}, {'operations': [operation], 'parallelism': None},
+                 {'operations': [operation], 'priority': 'urgent'}, {'operations': 'all'}, {'operations': [{}]}, {}):
+      with self.subTest(body=body):
+        self.assertEqual(self.submit(body).status_code, 400)
+    self.assertEqual(Status.objects.count(), 0)
+
+
+class SchedulerTests(SimpleTestCase):
+  QUEUE_TIME = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+  def candidates(self, *specs):
+    """One candidate per (id, username, priority, library, servers), queued in the given order."""
+    return [Candidate(id=id, username=username, priority=priority, enqueued_at=self.QUEUE_TIME + timedelta(seconds=idx),
+                      libraryName=libraryName, servers=servers)
+            for idx, (id, username, priority, libraryName, servers) in enumerate(specs)]
+
+  def ids(self, candidates):
+    return [candidate.id for candidate in candidates]
+
+  def test_higher_priority_class_first(self):
+    queued = self.candidates(('low', 'ann', 2, 'lib', []), ('normal', 'ann', 1, 'lib', []), ('high', 'bob', 0, 'lib', []))
+    self.assertEqual(self.ids(Scheduler().order(queued, [])), ['high', 'normal', 'low'])
+
+  def test_round_robin_between_users(self):
+    queued = self.candidates(('ann-1', 'ann', 1, 'lib', []), ('ann-2', 'ann', 1, 'lib', []), ('ann-3', 'ann', 1, 'lib', []),
+                             ('bob-1', 'bob', 1, 'lib', []), ('bob-2', 'bob', 1, 'lib', []))
+    self.assertEqual(self.ids(Scheduler().order(queued, [])), ['ann-1', 'bob-1', 'ann-2', 'bob-2', 'ann-3'])
+
+  def test_users_with_running_operations_wait_their_turn(self):
+    running = self.candidates(('ann-0', 'ann', 1, 'lib', []))
+    queued = self.candidates(('ann-1', 'ann', 1, 'lib', []), ('bob-1', 'bob', 1, 'lib', []))
+    self.assertEqual(self.ids(Scheduler().order(queued, running)), ['bob-1', 'ann-1'])
+    self.assertEqual(Scheduler().positions(queued, running), {'bob-1': 1, 'ann-1': 2})
+
+  def test_server_limit_skips_to_the_next_candidate(self):
+    running = self.candidates(('running', 'ann', 1, 'lib', ['host1']))
+    queued = self.candidates(('host1', 'bob', 1, 'lib', ['host1']), ('host2', 'carl', 1, 'lib', ['host2']),
+                             ('host2-again', 'bob', 1, 'lib', ['host2']))
+    scheduler = Scheduler(serverLimit=1)
+    self.assertEqual(self.ids(scheduler.select(queued, running, maxCount=10)), ['host2'])
+
+  def test_library_limit_and_overrides(self):
+    queued = self.candidates(('a-1', 'ann', 1, 'a', []), ('a-2', 'bob', 1, 'a', []), ('b-1', 'carl', 1, 'b', []),
+                             ('b-2', 'dave', 1, 'b', []))
+    scheduler = Scheduler(libraryLimit=1, libraryLimits={'b': 0})
+    self.assertEqual(self.ids(scheduler.select(queued, [], maxCount=10)), ['a-1', 'b-1', 'b-2'])
+    self.assertEqual(self.ids(scheduler.select(queued, [], maxCount=2)), ['a-1', 'b-1'])
+
+  def test_parse_limits(self):
+    self.assertEqual(parseLimits('host1=2, host=with=equals=8,'), {'host1': 2, 'host=with=equals': 8})
+    self.assertEqual(parseLimits(''), {})
+    for text in ('host1', 'host1=x'):
+      with self.subTest(text=text), self.assertRaises(ValueError):
+        parseLimits(text)
+
+
+class OperationSubtreeTests(TestCase):
+  def setUp(self):
+    user = User.objects.create_user('tester', password='secret')
+    self.authorization = f'Bearer {RefreshToken.for_user(user).access_token}'
+
+  def subtree(self, body):
+    return self.client.post('/api/get-operation-subtree', body, content_type='application/json',
+                            HTTP_AUTHORIZATION=self.authorization)
+
+  def test_invalid_body_is_a_bad_request(self):
+    for body in ('{"operationBranch": ["lib"], "depth": "deep"}', '{"operationBranch": ["lib"], "depth": -1}',
+                 '{"operationBranch": ["lib"], "depth": null}', '{"operationBranch": []}', '{}', 'not json'):
+      with self.subTest(body=body):
+        self.assertEqual(self.subtree(body).status_code, 400)
+
+  def test_needs_an_access_token(self):
+    self.authorization = 'Bearer invalid'
+    self.assertEqual(self.subtree('{"operationBranch": ["lib"]}').status_code, 401)
+
+
+class LibraryRegistryTests(TestCase):
+  def setUp(self):
+    LibraryRegistration.objects.create(library_name='versioned', module_path=__name__, class_name='VersionedLibrary')
+    self.registry = LibraryRegistry()
+
+  def test_loads_a_library_once(self):
+    loaded = self.registry.get('versioned')
+    self.assertEqual(loaded.syncApi.getOperationHierarchyVersion(), 1)
+    self.assertIs(self.registry.get('versioned'), loaded)
+    self.assertIsNone(self.registry.get('unknown'))
+
+  def test_import_times_are_a_metric(self):
+    self.assertEqual(self.registry.importTimes(), {})
+    self.registry.get('versioned')
+    self.assertEqual(list(self.registry.importTimes()), [('versioned',)])
+
+    with mock.patch.object(Metrics.libraryImportSeconds, 'function', self.registry.importTimes):
+      self.assertRegex(Metrics.render(), r'webcligui_library_import_seconds\{library="versioned"\} [0-9.e-]+\n')
+
+  def test_preload_starts_only_when_configured(self):
+    with mock.patch.object(LibraryRegistryModule.threading, 'Thread') as thread:
+      with override_settings(LIBRARY_PRELOAD_THREADS=0):
+        LibraryRegistryModule.startPreload()
+      thread.assert_not_called()
+      with override_settings(LIBRARY_PRELOAD_THREADS=2):
+        LibraryRegistryModule.startPreload()
+    self.assertEqual(thread.call_args.kwargs['args'], (2,))
+    thread.return_value.start.assert_called_once()
+
+
+class ProcessLibraryTests(SimpleTestCase):
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.library = ProcessLibrary('synthetic', 'benchmarks.synthetic_library', 'SyntheticLibrary')
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.library.close()
+    super().tearDownClass()
+
+  def setUp(self):
+    patcher = mock.patch.object(self.library.pool, 'call', wraps=self.library.pool.call)
+    self.poolCall = patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def calledMethods(self):
+    return [call.args[0] for call in self.poolCall.call_args_list]
+
+  def test_hierarchy_version_is_answered_from_the_cache(self):
+    self.assertEqual(self.library.getOperationHierarchyVersion(), '100x20')
+    self.assertEqual(self.library.getOperationHierarchyVersion(), '100x20')
+    self.assertEqual(self.calledMethods(), [])
+
+  def test_expired_version_is_refreshed_in_the_background(self):
+    self.library.versionExpires = 0
+    self.assertEqual(self.library.getOperationHierarchyVersion(), '100x20')
+    for _ in range(50):
+      if not self.library.refreshing:
+        break
+      time.sleep(0.1)
+    self.assertEqual(self.calledMethods(), ['getOperationHierarchyVersion'])
+    self.assertGreater(self.library.versionExpires, time.monotonic())
+
+  def test_cacheable_is_asked_with_the_branch(self):
+    self.library.getDescription(['folder1', 'operation1'])
+    self.assertEqual(self.calledMethods(), ['getDescription', 'isDescriptionCacheable'])
+    self.assertTrue(self.library.isDescriptionCacheable(['folder1', 'operation1']))
+    self.assertTrue(self.library.isParametersCacheable(['folder1', 'operation1']))
+    self.assertEqual(self.calledMethods(), ['getDescription', 'isDescriptionCacheable', 'isParametersCacheable'])
+
+  def test_hooks_do_not_count_towards_the_worker_calls(self):
+    worker = self.library.pool.acquire()
+    try:
+      numCalls = worker.numCalls
+      worker.call('isDescriptionCacheable', (['folder1'],), 10)
+      worker.call('getDescription', (['folder1'],), 10)
+      self.assertEqual(worker.numCalls, numCalls + 1)
+    finally:
+      self.library.pool.release(worker)
+
+
+class AsyncProcessLibraryTests(SimpleTestCase):
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.library = ProcessLibrary('asyncsynthetic', 'benchmarks.synthetic_library', 'AsyncSyntheticLibrary')
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.library.close()
+    super().tearDownClass()
+
+  def test_coroutines_are_run_by_the_worker(self):
+    self.assertEqual(self.library.getDescription(['folder1', 'operation1']), 'Synthetic operation folder1/operation1')
+    self.assertEqual(len(self.library.getOperationHierarchy().portfolio), 100)
+    self.assertEqual(self.library.getParameters(['folder1']).name, 'parameters')
+    self.assertIsNone(self.library.getOperationSubtree([], 1))
+    self.assertTrue(self.library.isParametersCacheable(['folder1']))
+
+
+class OperationTreeTests(SimpleTestCase):
+  def setUp(self):
+    self.hierarchy = OperationFolder(name='lib', portfolio=[
+      OperationFolder(name='folder', portfolio=[
+        Operation(name='op1', operation_type=OperationType.PYTHON, operation_module='module1'),
+        OperationFolder(name='empty'),
+      ]),
+      Operation(name='op2', operation_type=OperationType.PIPX),
+    ])
+
+  def test_compact_tree_encodes_like_the_hierarchy(self):
+    compact = compactTree(self.hierarchy)
+    self.assertIsInstance(compact, SlottedOperationFolder)
+    self.assertFalse(hasattr(compact, '__dict__'))
+    self.assertFalse(hasattr(compact.portfolio[1], '__dict__'))
+    self.assertEqual(to_json_bytes(compact), to_json_bytes(self.hierarchy))
+
+  def test_slotted_parts_are_not_copied(self):
+    slotted = compactTree(self.hierarchy)
+    self.assertIs(compactTree(slotted), slotted)
+
+    mixed = SlottedOperationFolder(name='lib', portfolio=[slotted.portfolio[0], Operation(name='op', operation_type=OperationType.PIPX)])
+    compact = compactTree(mixed)
+    self.assertIsNot(compact, mixed)
+    self.assertIs(compact.portfolio[0], slotted.portfolio[0])
+    self.assertIsInstance(compact.portfolio[1], SlottedOperation)
+
+  def test_public_dataclasses_are_not_slotted(self):
+    self.hierarchy.note = 'libraries may add attributes'
+    self.assertEqual(self.hierarchy.note, 'libraries may add attributes')
+
+  def test_find_node(self):
+    for tree in (self.hierarchy, compactTree(self.hierarchy)):
+      with self.subTest(tree=type(tree).__name__):
+        self.assertEqual(findNode(tree, ['folder', 'op1']).operation_module, 'module1')
+        self.assertIs(findNode(tree, []), tree)
+        self.assertIsNone(findNode(tree, ['folder', 'missing']))
+        self.assertIsNone(findNode(tree, ['op2', 'below an operation']))
+
+  def test_subtree_json(self):
+    subtree = json.loads(to_json_bytes(subtreeJson(compactTree(self.hierarchy), 1)))
+    self.assertEqual(subtree['child_count'], 2)
+    self.assertEqual(subtree['portfolio'][0], {'name': 'folder', 'child_count': 2})
+    self.assertEqual(subtree['portfolio'][1]['operation_type'], 'pipx')
+
+
+class SlottedLibrary(StubLibrary):
+  """Keeps its hierarchy, built from the slotted classes."""
+
+  def __init__(self):
+    super().__init__(root=None)
+    self.hierarchy = SlottedOperationFolder(name='lib', portfolio=[
+      SlottedOperationFolder(name='folder', portfolio=[SlottedOperation(name='op', operation_type=OperationType.PYTHON)]),
+    ])
+
+  def getOperationHierarchy(self):
+    return self.hierarchy
+
+
+class CachedTreeTests(TestCase):
+  def setUp(self):
+    self.loaded = {}
+    for libraryName, libraryApiImpl in (('plain', StubLibrary(root=None)), ('slotted', SlottedLibrary())):
+      syncApi, asyncApi = adaptLibrary(libraryApiImpl, libraryName)
+      self.loaded[libraryName] = LoadedLibrary(registration=(__name__, type(libraryApiImpl).__name__),
+                                               syncApi=syncApi, asyncApi=asyncApi, importSeconds=0)
+    for patcher in (mock.patch.object(api.libraryRegistry, 'get', side_effect=self.loaded.get),
+                    mock.patch.object(api.libraryRegistry, 'loadAll', return_value=list(self.loaded.items()))):
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    self.addCleanup(hierarchyCache.invalidate)
+    self.addCleanup(branchCache.invalidate)
+    user = User.objects.create_user('tester', password='secret')
+    self.authorization = f'Bearer {RefreshToken.for_user(user).access_token}'
+
+  def cachedTree(self, libraryName):
+    return hierarchyCache.lookup(libraryName, hierarchyVersion(self.loaded[libraryName].asyncApi)).tree
+
+  def subtree(self, operationBranch):
+    return self.client.post('/api/get-operation-subtree', {'operationBranch': operationBranch, 'depth': 1},
+                            content_type='application/json', HTTP_AUTHORIZATION=self.authorization)
+
+  def test_hierarchy_endpoint_caches_only_the_json(self):
+    with mock.patch.object(api, 'compactTree', wraps=compactTree) as compact:
+      response = self.client.get('/api/get-operation-hierarchy', HTTP_AUTHORIZATION=self.authorization)
+    self.assertEqual(response.status_code, 200)
+    compact.assert_not_called()
+    self.assertIsNone(self.cachedTree('plain'))
+
+    self.assertEqual(self.subtree(['plain']).json()['child_count'], 1)
+    self.assertIsInstance(self.cachedTree('plain'), SlottedOperationFolder)
+
+  def test_slotted_hierarchy_is_shared_with_the_library(self):
+    self.assertEqual(self.subtree(['slotted', 'folder']).json()['portfolio'], [{'name': 'op', 'operation_type': 'python',
+                                                                                'operation_module': None}])
+    self.assertIs(self.cachedTree('slotted'), self.loaded['slotted'].syncApi.wrapped.hierarchy)
+
+
+class AuthCacheTests(TemporaryFolderMixin, TestCase):
+  def setUp(self):
+    super().setUp()
+    settingsOverride = override_settings(AUTH_CACHE_TTL=30, AUTH_GENERATION_FILE=self.folder / 'auth_generation')
+    settingsOverride.enable()
+    self.addCleanup(settingsOverride.disable)
+    authCache.invalidateUser()
+    authCache.invalidateBlacklist()
+    self.user = User.objects.create_user('tester', password='secret')
+    self.login()
+
+  def login(self):
+    response = self.client.post('/api/login', {'username': 'tester', 'password': 'secret'}, content_type='application/json')
+    self.assertEqual(response.status_code, 200)
+    self.access = response.json()['access']
+
+  def authenticatedStatus(self):
+    # An empty body: 400 once authenticated, 401 otherwise
+    return self.client.post('/api/get-operation-subtree', '{}', content_type='application/json',
+                            HTTP_AUTHORIZATION=f'Bearer {self.access}').status_code
+
+  def logout(self):
+    return self.client.post('/api/logout', HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+  def test_cached_authentication_does_not_query(self):
+    self.assertEqual(self.authenticatedStatus(), 400)
+    with self.assertNumQueries(0):
+      self.assertEqual(self.authenticatedStatus(), 400)
+
+  def test_logout_blacklists_both_tokens(self):
+    refreshCookie = self.client.cookies['refresh_token'].value
+    self.assertEqual(self.client.get('/api/get-access-token').status_code, 200)
+    self.assertEqual(self.logout().status_code, 200)
+    self.assertEqual(self.authenticatedStatus(), 401)
+    self.client.cookies['refresh_token'] = refreshCookie
+    response = self.client.get('/api/get-access-token')
+    self.assertEqual((response.status_code, response.content), (403, b'Token is blacklisted'))
+
+  def test_logout_with_a_blacklisted_refresh_token_still_blacklists_the_access_token(self):
+    refreshCookie = self.client.cookies['refresh_token'].value
+    self.logout()
+    self.login()
+    self.client.cookies['refresh_token'] = refreshCookie
+    self.assertEqual(self.logout().status_code, 200)
+    self.assertEqual(self.authenticatedStatus(), 401)
+
+  def test_deactivated_user_is_refused(self):
+    self.assertEqual(self.authenticatedStatus(), 400)
+    self.user.is_active = False
+    self.user.save()
+    self.assertEqual(self.authenticatedStatus(), 401)
+    self.assertTrue((self.folder / 'auth_generation').exists())
+
+
+class RetentionTests(TemporaryFolderMixin, TestCase):
+  def setUp(self):
+    super().setUp()
+    self.operations = self.folder / 'operations'
+    self.archive = self.folder / 'archive'
+    patcher = mock.patch.object(Retention, 'OPERATION_ROOT_DIRECTORY', self.operations)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def addOperation(self, directory, startTime, status='*****Neda Finished*****'):
+    if directory:
+      (self.operations / directory).mkdir(parents=True, exist_ok=True)
+      (self.operations / directory / 'output.txt').write_text(f'output of {directory}\n')
+    return Status.objects.create(id=uuid.uuid4(), operation_branch=['lib', 'op'], status=status, directory=directory,
+                                 start_time=startTime)
+
+  def retention(self, **kwargs):
+    return Retention.StatusRetention(olderThanDays=30, batchSize=10, archiveDirectory=self.archive, **kwargs)
+
+  def archived(self, month):
+    with gzip.open(self.archive / f'status-{month}.jsonl.gz', 'rt') as archive:
+      return [json.loads(line) for line in archive]
+
+  def test_archives_expired_rows_by_the_month_they_started(self):
+    january = self.addOperation('a', datetime(2025, 1, 31, 23, 0, tzinfo=timezone.utc))
+    february = self.addOperation('b', datetime(2025, 2, 1, 1, 0, tzinfo=timezone.utc))
+    running = self.addOperation('c', datetime(2025, 1, 1, tzinfo=timezone.utc), status='running')
+    recent = self.addOperation('d', datetime.now(timezone.utc))
+
+    stats = self.retention().run()
+    self.assertEqual(stats.rows, 2)
+    self.assertEqual([record['id'] for record in self.archived('2025-01')], [str(january.id)])
+    self.assertEqual([record['id'] for record in self.archived('2025-02')], [str(february.id)])
+    self.assertEqual(set(Status.objects.values_list('id', flat=True)), {running.id, recent.id})
+
+  def test_folders_are_packed_under_their_relative_path(self):
+    old = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    self.addOperation('a_b/c', old)
+    self.addOperation('a/b_c', old)
+
+    self.retention().run()
+    for directory in ('a_b/c', 'a/b_c'):
+      with self.subTest(directory=directory):
+        self.assertFalse((self.operations / directory).exists())
+        with tarfile.open(self.archive / 'folders' / f'{directory}.tar.gz') as tar:
+          member = tar.extractfile(f'{directory}/output.txt')
+          self.assertEqual(member.read(), f'output of {directory}\n'.encode())
+    self.assertEqual({record['folder_archive'] for record in self.archived('2025-01')},
+                     {str(self.archive / 'folders' / 'a_b/c.tar.gz'), str(self.archive / 'folders' / 'a/b_c.tar.gz')})
+
+  def test_nothing_is_deleted_when_the_archive_cannot_be_written(self):
+    old = self.addOperation('a', datetime(2025, 1, 1, tzinfo=timezone.utc))
+    with mock.patch.object(Retention.StatusRetention, 'writeArchive', side_effect=OSError('disk full')):
+      with self.assertRaises(OSError):
+        self.retention().run()
+    self.assertTrue((self.operations / 'a' / 'output.txt').exists())
+    self.assertTrue(Status.objects.filter(id=old.id).exists())
+
+  def test_folder_used_by_a_kept_operation_is_left_alone(self):
+    self.addOperation('shared', datetime(2025, 1, 1, tzinfo=timezone.utc))
+    self.addOperation('shared', datetime.now(timezone.utc))
+    stats = self.retention().run()
+    self.assertEqual((stats.rows, stats.foldersShared), (1, 1))
+    self.assertTrue((self.operations / 'shared').is_dir())
+
+  def test_prune_and_dry_run(self):
+    self.addOperation('a', datetime(2025, 1, 1, tzinfo=timezone.utc))
+    stats = self.retention(folderAction='prune', dryRun=True).run()
+    self.assertEqual((stats.rows, stats.foldersPruned), (1, 1))
+    self.assertTrue((self.operations / 'a').is_dir())
+    self.assertFalse(self.archive.exists())
+
+    self.retention(folderAction='prune').run()
+    self.assertFalse((self.operations / 'a').exists())
+    self.assertFalse((self.archive / 'folders').exists())
+    self.assertEqual(Status.objects.count(), 0)
+
+
+class MetricsTests(TestCase):
+  def setUp(self):
+    authCache.invalidateUser()
+    user = User.objects.create_user('tester', password='secret')
+    self.authorization = f'Bearer {RefreshToken.for_user(user).access_token}'
+
+  def metrics(self, authorization=None):
+    headers = {'HTTP_AUTHORIZATION': authorization} if authorization else {}
+    return self.client.get('/api/metrics', **headers)
+
+  @override_settings(METRICS_TOKEN='scrape-token')
+  def test_metrics_token_or_access_token(self):
+    response = self.metrics('Bearer scrape-token')
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+    self.assertEqual(self.metrics(self.authorization).status_code, 200)
+    for authorization in ('Bearer wrong-token', 'scrape-token', 'Bearer scrape-token2', None):
+      with self.subTest(authorization=authorization):
+        self.assertEqual(self.metrics(authorization).status_code, 401)
+
+  @override_settings(METRICS_TOKEN='')
+  def test_without_metrics_token_an_access_token_is_needed(self):
+    self.assertEqual(self.metrics('Bearer ').status_code, 401)
+    self.assertEqual(self.metrics(self.authorization).status_code, 200)
+
+  def test_histogram_text_format(self):
+    with mock.patch.object(Metrics, 'registry', []):
+      histogram = Metrics.Histogram('test_duration_seconds', 'Test durations', ('view', 'method'), buckets=(0.5, 1))
+      for seconds in (0.25, 0.5, 4):
+        histogram.observe(seconds, 'status "list"\n', 'GET')
+      self.assertEqual(Metrics.render(), '\n'.join([
+        '# HELP test_duration_seconds Test durations',
+        '# TYPE test_duration_seconds histogram',
+        r'test_duration_seconds_bucket{view="status \"list\"\n",method="GET",le="0.5"} 2',
+        r'test_duration_seconds_bucket{view="status \"list\"\n",method="GET",le="1"} 2',
+        r'test_duration_seconds_bucket{view="status \"list\"\n",method="GET",le="+Inf"} 3',
+        r'test_duration_seconds_sum{view="status \"list\"\n",method="GET"} 4.75',
+        r'test_duration_seconds_count{view="status \"list\"\n",method="GET"} 3',
+      ]) + '\n')
+
+  def test_requests_are_recorded_per_view(self):
+    self.metrics(self.authorization)
+    text = self.metrics(self.authorization).content.decode()
+    self.assertRegex(text, r'\nwebcligui_request_duration_seconds_bucket\{view="metrics",method="GET",le="\+Inf"\} [1-9]\d*\n')
+    self.assertRegex(text, r'\nwebcligui_request_duration_seconds_count\{view="metrics",method="GET"\} [1-9]\d*\n')
+    self.assertRegex(text, r'\nwebcligui_requests_total\{view="metrics",method="GET",status="200"\} [1-9]\d*\n')
+
+  def assertQueriesCounted(self, request):
+    with mock.patch.object(Metrics.requestQueries, 'observe') as observe:
+      with CaptureQueriesContext(connection) as queries:
+        request()
+    numQueries, view = observe.call_args.args
+    self.assertGreater(len(queries), 0)
+    self.assertEqual(numQueries, len(queries))
+    return view
+
+  def test_queries_of_a_request_are_counted(self):
+    Status.objects.create(id=uuid.uuid4(), operation_branch=['lib', 'op'], status='running', directory='op',
+                          start_time=datetime(2026, 1, 1, tzinfo=timezone.utc))
+    patcher = mock.patch.object(api, 'get_operation_handling', return_value=SimpleNamespace(queue=None))
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    view = self.assertQueriesCounted(lambda: self.client.get('/api/get-operation-status-list', {'count': 'exact'},
+                                                             HTTP_AUTHORIZATION=self.authorization))
+    self.assertEqual(view, 'get-operation-status-list')
+
+  def test_queries_of_an_async_view_are_counted(self):
+    # Authenticated on a thread through sync_to_async(), the user is not cached yet
+    view = self.assertQueriesCounted(lambda: self.client.post('/api/get-operation-subtree', '{}', content_type='application/json',
+                                                              HTTP_AUTHORIZATION=self.authorization))
+    self.assertEqual(view, 'get-operation-subtree')
@@ -6,9 +6,13 @@ urlpatterns = [
   path("logout", api.logout, name="logout"),
   path("get-access-token", api.get_access_token, name="get-access-token"),
   path("get-operation-hierarchy", api.get_operation_hierarchy, name="get-operation-hierarchy"),
+  path("get-operation-subtree", api.get_operation_subtree, name="get-operation-subtree"),
   path("get-description", api.get_description, name="get-description"),
   path("get-parameters", api.get_parameters, name="get-parameters"),
   path("submit-operation", api.submit_operation, name="submit-operation"),
+  path("submit-operations", api.submit_operations, name="submit-operations"),
   path("get-operation-status-list", api.get_operation_status_list, name="get-operation-status-list"),
   path("folder-access/<path:path>", api.folder_access, name="folder-access"),
+  path("operation-events", api.operation_events, name="operation-events"),
+  path("metrics", api.get_metrics, name="metrics"),
 ]
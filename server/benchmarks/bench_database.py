@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""
+Runs the database traffic of a busy server against the previous database settings (SQLite
+with the rollback journal, a connection per request) and the configured profile (WAL,
+synchronous=NORMAL, IMMEDIATE transactions, busy timeout, persistent connections):
+
+  - submitters queue operations (a Status and a QueuedOperation row in one transaction)
+  - a dispatcher moves queued operations to started (read, then write in one transaction)
+  - a monitor saves status changes of the started operations
+  - readers load the status list and its count
+
+Each profile runs in its own process on a new SQLite file. With DATABASE_ENGINE=postgresql
+only the configured profile runs, against DATABASE_NAME, which should be a scratch database.
+
+  cd server
+  python benchmarks/bench_database.py --seconds 20 --submitters 4 --readers 4
+"""
+import argparse
+from datetime import timedelta
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webCliGui.settings')
+
+KINDS = ('submit', 'dispatch', 'monitor', 'read')
+
+
+def setupDjango(profile, dbFile):
+  from django.conf import settings
+  database = settings.DATABASES['default']
+  if settings.DATABASE_ENGINE == 'sqlite':
+    database['NAME'] = dbFile
+  if profile == 'previous':
+    database['OPTIONS'] = {}
+    database['CONN_MAX_AGE'] = 0
+
+  import django
+  django.setup()
+  from django.core.management import call_command
+  call_command('migrate', verbosity=0)
+
+
+class Recorder:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.latencies = {kind: [] for kind in KINDS}
+    self.errors = {kind: 0 for kind in KINDS}
+
+  def run(self, kind, function):
+    from django.db import OperationalError
+    start = time.perf_counter()
+    try:
+      if function() is False:   # Nothing to do yet
+        return
+    except OperationalError:
+      with self.lock:
+        self.errors[kind] += 1
+      return
+    elapsed = time.perf_counter() - start
+    with self.lock:
+      self.latencies[kind].append(elapsed)
+
+
+def runProfile(args):
+  from django.db import close_old_connections, connections, transaction
+  from django.utils import timezone
+  from webcligui_api import OperationState
+  from api.models import QueuedOperation, Status, operationPath
+
+  recorder = Recorder()
+  started = []
+  startedLock = threading.Lock()
+  stop = threading.Event()
+
+  def submit():
+    uuid = uuid4()
+    branch = ['benchLib', 'folder', f'operation{random.randrange(100)}']
+    now = timezone.now()
+    with transaction.atomic():
+      Status.objects.create(id=uuid, operation_branch=branch, operation_path=operationPath(branch),
+                            start_time=now, status=OperationState.QUEUED.value, directory='')
+      QueuedOperation.objects.create(id=uuid, operation_branch=branch, command=['run'], servers=['host1'],
+                                     enqueued_at=now)
+
+  def dispatch():
+    with transaction.atomic():
+      ids = list(QueuedOperation.objects.filter(state=QueuedOperation.QUEUED)
+                 .order_by('enqueued_at').values_list('id', flat=True)[:8])
+      if not ids:
+        return False
+      QueuedOperation.objects.filter(id__in=ids).update(state=QueuedOperation.SUBMITTED, dispatched_at=timezone.now())
+      Status.objects.filter(id__in=ids).update(status=OperationState.STARTED.value, directory='/tmp/bench')
+    with startedLock:
+      started.extend(ids)
+
+  def monitor():
+    with startedLock:
+      if not started:
+        return False
+      uuid = random.choice(started)
+    stat = Status.objects.get(id=uuid)
+    stat.status = f'{random.randrange(100)}% done'
+    stat.elapsed_time = timedelta(seconds=random.randrange(3600))
+    stat.save()
+
+  def read():
+    list(Status.objects.order_by('-start_time', '-id')[:100])
+    Status.objects.count()
+
+  def loop(kind, function, pause):
+    while not stop.is_set():
+      recorder.run(kind, function)
+      # Like the end of a request: without CONN_MAX_AGE every operation opens a new connection
+      close_old_connections()
+      if pause:
+        time.sleep(pause)
+    connections.close_all()
+
+  threads = [threading.Thread(target=loop, args=('submit', submit, args.submit_interval)) for _ in range(args.submitters)]
+  threads += [threading.Thread(target=loop, args=('read', read, 0)) for _ in range(args.readers)]
+  threads.append(threading.Thread(target=loop, args=('dispatch', dispatch, 0.01)))
+  threads.append(threading.Thread(target=loop, args=('monitor', monitor, 0)))
+  for thread in threads:
+    thread.start()
+  time.sleep(args.seconds)
+  stop.set()
+  for thread in threads:
+    thread.join()
+
+  result = {}
+  for kind in KINDS:
+    latencies = sorted(recorder.latencies[kind])
+    result[kind] = {
+      'ops': len(latencies),
+      'errors': recorder.errors[kind],
+      'p50': latencies[len(latencies) // 2] if latencies else 0,
+      'p99': latencies[int(len(latencies) * 0.99)] if latencies else 0,
+    }
+  return result
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--seconds', type=float, default=10)
+  parser.add_argument('--submitters', type=int, default=4)
+  parser.add_argument('--readers', type=int, default=4)
+  parser.add_argument('--submit-interval', type=float, default=0.02, help='seconds each submitter waits between operations')
+  parser.add_argument('--profile', choices=['previous', 'configured'], help=argparse.SUPPRESS)
+  parser.add_argument('--db-file', help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.profile:
+    setupDjango(args.profile, args.db_file)
+    print(json.dumps(runProfile(args)))
+    return
+
+  profiles = ['configured'] if os.getenv('DATABASE_ENGINE', 'sqlite') == 'postgresql' else ['previous', 'configured']
+  print(f'{args.submitters} submitters, {args.readers} readers, 1 dispatcher, 1 monitor, {args.seconds:g} s per profile')
+  print(f'{"profile":<11} {"traffic":<9} {"ops/s":>8} {"locked":>7} {"p50 ms":>8} {"p99 ms":>8}')
+  for profile in profiles:
+    with tempfile.TemporaryDirectory() as directory:
+      output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--profile', profile, '--db-file', os.path.join(directory, 'bench.sqlite3'),
+         '--seconds', str(args.seconds), '--submitters', str(args.submitters), '--readers', str(args.readers),
+         '--submit-interval', str(args.submit_interval)],
+        check=True, capture_output=True, text=True,
+      ).stdout
+    result = json.loads(output.splitlines()[-1])
+    for kind in KINDS:
+      stats = result[kind]
+      print(f'{profile:<11} {kind:<9} {stats["ops"] / args.seconds:>8.0f} {stats["errors"]:>7}'
+            f' {stats["p50"] * 1000:>8.2f} {stats["p99"] * 1000:>8.2f}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""
+Sends requests to every endpoint of api/urls.py through the real URLconf, middleware and
+authentication, and reports p50/p99 latency, requests/s and the peak memory allocated while
+serving them. The endpoints are backed by synthetic_library.SyntheticLibrary, a temporary
+SQLite database holding --status-rows operations and a temporary operation root holding
+--operation-folders folders. The operation queue is turned off, the submit endpoints measure
+the inline submission. operation-events is a stream and is not measured.
+
+The results are saved to benchmarks/results/<commit>.json; --compare prints the change
+against an earlier result:
+
+  cd server
+  python benchmarks/bench_http.py --requests 200
+  python benchmarks/bench_http.py --compare benchmarks/results/<earlier commit>.json
+"""
+import argparse
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from uuid import uuid4
+
+SERVER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIRECTORY)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webCliGui.settings')
+
+RESULTS_DIRECTORY = os.path.join(SERVER_DIRECTORY, 'benchmarks', 'results')
+LIBRARY_NAME = 'synthetic'
+USERNAME = 'benchmark'
+PASSWORD = 'benchmark-password'
+
+
+@dataclass
+class Endpoint:
+  name: str
+  method: str
+  path: str
+  body: dict | None = None
+  headers: dict = field(default_factory=dict)
+  expect: tuple = (200,)
+  maxRequests: int = 0    # 0 is --requests
+  prepare: object = None  # Called with the client before every request, returns extra headers
+
+
+def setupDjango(workDirectory, args):
+  os.environ['OPERATION_ROOT_DIRECTORY'] = os.path.join(workDirectory, 'operations')
+  os.environ['AUTH_GENERATION_FILE'] = os.path.join(workDirectory, 'auth_generation')
+  # Submitted inline, no queue thread may still be creating operation folders when the work directory is removed
+  os.environ['OPERATION_QUEUE_WORKERS'] = '0'
+  os.environ['OPERATION_EVENT_RELAY_INTERVAL'] = '0'
+  os.environ['BENCH_FOLDERS'] = str(args.folders)
+  os.environ['BENCH_OPERATIONS'] = str(args.operations)
+  os.environ['BENCH_OPTIONS'] = str(args.options)
+  os.environ['BENCH_PARAMETERS'] = str(args.parameters)
+
+  from django.conf import settings
+  if settings.DATABASE_ENGINE == 'sqlite':
+    settings.DATABASES['default']['NAME'] = os.path.join(workDirectory, 'bench.sqlite3')
+  import django
+  django.setup()
+  settings.ALLOWED_HOSTS.append('testserver')
+  from django.core.management import call_command
+  call_command('migrate', verbosity=0)
+
+
+def populate(args):
+  """Creates the user, registers the library and fills the Status table and the operation root."""
+  from django.contrib.auth.models import User
+  from webcligui_api import OperationState
+  from api.constants import OPERATION_ROOT_DIRECTORY
+  from api.models import LibraryRegistration, Status, operationPath
+
+  User.objects.create_user(username=USERNAME, password=PASSWORD)
+  LibraryRegistration.objects.create(library_name=LIBRARY_NAME, module_path='benchmarks.synthetic_library',
+                                     class_name='SyntheticLibrary')
+
+  random.seed(0)
+  states = [OperationState.FINISHED.value, OperationState.FAILED.value, OperationState.STARTED.value]
+  now = datetime.now(timezone.utc)
+  rows = []
+  for i in range(args.status_rows):
+    branch = [LIBRARY_NAME, f'folder{random.randrange(args.folders)}', f'operation{random.randrange(args.operations)}']
+    rows.append(Status(id=uuid4(), operation_branch=branch, operation_path=operationPath(branch),
+                       start_time=now - timedelta(seconds=i * 60), elapsed_time=timedelta(seconds=random.randrange(3600)),
+                       status=random.choice(states[:2]) if i >= 100 else states[2], directory=f'operation-{i}'))
+  Status.objects.bulk_create(rows, batch_size=1000)
+
+  for i in range(args.operation_folders):
+    folder = OPERATION_ROOT_DIRECTORY / f'operation-{i}'
+    folder.mkdir(parents=True)
+    (folder / 'neda_status.txt').write_text(''.join(f'Elapsed time: 0:00:{j % 60:02d}, step {j}\n' for j in range(200)))
+    (folder / 'output.log').write_text('output line\n' * 2000)
+
+
+def buildEndpoints(args):
+  from rest_framework_simplejwt.tokens import RefreshToken
+  from django.contrib.auth.models import User
+  from api.WireFormat import msgpack, MSGPACK_CONTENT_TYPE
+
+  user = User.objects.get(username=USERNAME)
+  operation = [LIBRARY_NAME, 'folder0', 'operation0']
+
+  def freshTokens(client):
+    # logout blacklists the tokens it is called with, every request needs its own
+    refresh = RefreshToken.for_user(user)
+    client.cookies['refresh_token'] = str(refresh)
+    return {'HTTP_AUTHORIZATION': f'Bearer {refresh.access_token}'}
+
+  endpoints = [
+    Endpoint('login', 'post', '/api/login', {'username': USERNAME, 'password': PASSWORD}, maxRequests=10),
+    Endpoint('logout', 'post', '/api/logout', prepare=freshTokens, maxRequests=50),
+    Endpoint('get-access-token', 'get', '/api/get-access-token'),
+    Endpoint('get-operation-hierarchy', 'get', '/api/get-operation-hierarchy'),
+    Endpoint('get-operation-subtree', 'post', '/api/get-operation-subtree', {'operationBranch': [LIBRARY_NAME], 'depth': 1}),
+    Endpoint('get-description', 'post', '/api/get-description', {'operationBranch': operation}),
+    Endpoint('get-parameters', 'post', '/api/get-parameters', {'operationBranch': operation}),
+    Endpoint('get-operation-status-list', 'get', '/api/get-operation-status-list?limit=25'),
+    Endpoint('get-operation-status-list branch', 'get', f'/api/get-operation-status-list?limit=25&branch={LIBRARY_NAME}/folder1'),
+    Endpoint('get-operation-status-list exact', 'get', '/api/get-operation-status-list?limit=25&count=exact&status=*****Neda Failed*****'),
+    Endpoint('folder-access directory', 'get', '/api/folder-access/.?limit=100'),
+    Endpoint('folder-access file', 'get', '/api/folder-access/operation-0/output.log'),
+    Endpoint('metrics', 'get', '/api/metrics'),
+    Endpoint('submit-operation', 'post', '/api/submit-operation',
+             {'operation_branch': operation, 'command': ['run'], 'servers': ['host1']}, expect=(200, 202)),
+    Endpoint('submit-operations', 'post', '/api/submit-operations',
+             {'operations': [{'operation_branch': operation, 'command': ['run'], 'servers': [f'host{i}']} for i in range(10)]},
+             expect=(200, 202)),
+  ]
+  if msgpack is not None:
+    endpoints.insert(4, Endpoint('get-operation-hierarchy msgpack', 'get', '/api/get-operation-hierarchy',
+                                 headers={'HTTP_ACCEPT': MSGPACK_CONTENT_TYPE}))
+  if args.only:
+    endpoints = [endpoint for endpoint in endpoints if any(name in endpoint.name for name in args.only)]
+  return endpoints
+
+
+def sendRequest(client, endpoint, headers):
+  if endpoint.prepare:
+    headers = {**headers, **endpoint.prepare(client)}
+  start = time.perf_counter()
+  if endpoint.method == 'get':
+    response = client.get(endpoint.path, **headers)
+  else:
+    response = client.post(endpoint.path, data=json.dumps(endpoint.body or {}), content_type='application/json', **headers)
+  if response.streaming:
+    b''.join(response.streaming_content)
+  elapsed = time.perf_counter() - start
+  if response.status_code not in endpoint.expect:
+    raise RuntimeError(f'{endpoint.name}: HTTP {response.status_code} {response.content[:200]!r}')
+  return elapsed
+
+
+def measure(endpoint, refresh, args):
+  # A client per endpoint, logout changes its cookies
+  from django.test import Client
+  client = Client()
+  client.cookies['refresh_token'] = str(refresh)
+  authHeaders = {'HTTP_AUTHORIZATION': f'Bearer {refresh.access_token}'}
+
+  numRequests = min(args.requests, endpoint.maxRequests) if endpoint.maxRequests else args.requests
+  headers = {**authHeaders, **endpoint.headers}
+  for _ in range(min(args.warmup, numRequests)):
+    sendRequest(client, endpoint, headers)
+
+  latencies = []
+  for _ in range(numRequests):
+    latencies.append(sendRequest(client, endpoint, headers))
+
+  # Separate pass, tracemalloc slows down every allocation
+  tracemalloc.start()
+  for _ in range(min(args.memory_requests, numRequests)):
+    sendRequest(client, endpoint, headers)
+  _current, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+
+  latencies.sort()
+  return {
+    'requests': numRequests,
+    'p50_ms': latencies[len(latencies) // 2] * 1000,
+    'p99_ms': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+    'rps': numRequests / sum(latencies),
+    'peak_kib': peak / 1024,
+  }
+
+
+def gitCommit():
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIRECTORY, check=True,
+                          capture_output=True, text=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return 'unknown'
+
+
+def printResults(results, baseline):
+  print(f'{"endpoint":<36} {"p50 ms":>8} {"p99 ms":>8} {"req/s":>8} {"peak KiB":>9}' + ('  p50 vs baseline' if baseline else ''))
+  for name, stats in results.items():
+    line = f'{name:<36} {stats["p50_ms"]:>8.2f} {stats["p99_ms"]:>8.2f} {stats["rps"]:>8.0f} {stats["peak_kib"]:>9.0f}'
+    previous = baseline.get(name) if baseline else None
+    if previous:
+      line += f'  {(stats["p50_ms"] / previous["p50_ms"] - 1) * 100:>+7.1f}%'
+    print(line)
+
+
+def saveResults(results, args):
+  commit = gitCommit()
+  savePath = args.save or os.path.join(RESULTS_DIRECTORY, f'{commit}.json')
+  os.makedirs(os.path.dirname(os.path.abspath(savePath)), exist_ok=True)
+  with open(savePath, 'w') as file:
+    json.dump({
+      'commit': commit,
+      'time': datetime.now(timezone.utc).isoformat(),
+      'python': platform.python_version(),
+      'machine': platform.machine(),
+      'arguments': {name: value for name, value in vars(args).items() if name not in ('save', 'compare')},
+      'results': results,
+    }, file, indent=2)
+  return savePath
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--requests', type=int, default=200, help='measured requests per endpoint')
+  parser.add_argument('--warmup', type=int, default=10)
+  parser.add_argument('--memory-requests', type=int, default=10, help='requests per endpoint under tracemalloc')
+  parser.add_argument('--folders', type=int, default=100, help='folders in the synthetic hierarchy')
+  parser.add_argument('--operations', type=int, default=20, help='operations per folder')
+  parser.add_argument('--options', type=int, default=10, help='options in the synthetic parameters')
+  parser.add_argument('--parameters', type=int, default=20, help='parameters per option')
+  parser.add_argument('--status-rows', type=int, default=10000)
+  parser.add_argument('--operation-folders', type=int, default=200)
+  parser.add_argument('--only', nargs='*', help='only the endpoints whose name contains one of these')
+  parser.add_argument('--save', help='default benchmarks/results/<commit>.json')
+  parser.add_argument('--compare', help='earlier results to compare with')
+  args = parser.parse_args()
+
+  # The views print every submitted operation, the monitor prints from its thread
+  with tempfile.TemporaryDirectory() as workDirectory, open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+    setupDjango(workDirectory, args)
+    populate(args)
+
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from django.contrib.auth.models import User
+
+    refresh = RefreshToken.for_user(User.objects.get(username=USERNAME))
+    results = {}
+    for endpoint in buildEndpoints(args):
+      results[endpoint.name] = measure(endpoint, refresh, args)
+      print(f'{endpoint.name}: done', file=sys.stderr)
+    # Before the work directory is removed, the results are kept even if that fails
+    savePath = saveResults(results, args)
+
+  baseline = None
+  if args.compare:
+    with open(args.compare) as file:
+      baseline = json.load(file)['results']
+  printResults(results, baseline)
+  print(f'Saved to {savePath}')
+
+
+if __name__ == '__main__':
+  main()
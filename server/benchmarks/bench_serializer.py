@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Compares the compiled webcligui_api.to_json_bytes() encoder with the path the views used
+before it: dataclasses.asdict() + to_json_safe() + json.dumps().
+
+  cd server
+  python benchmarks/bench_serializer.py --folders 200 --operations 50
+"""
+import argparse
+from dataclasses import asdict
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webCliGui.settings')
+
+import django
+django.setup()
+
+from django.core.serializers.json import DjangoJSONEncoder
+from webcligui_api import Operation, OperationFolder, OperationType, to_json_bytes
+from webcligui_api import ParameterList, ParameterOptionsToList, ParameterPreference, ParameterStringValue
+from api.api import to_json_safe
+
+
+def buildHierarchy(numFolders, numOperations):
+  return OperationFolder(name='library', portfolio=[
+    OperationFolder(name=f'folder{i}', portfolio=[
+      Operation(name=f'operation{i}.{j}', operation_type=OperationType.PYTHON, operation_module=f'module{j}')
+      for j in range(numOperations)
+    ])
+    for i in range(numFolders)
+  ])
+
+
+def buildParameters(numOptions, numParameters):
+  return ParameterOptionsToList(name='parameters', mandatory=True, options=[
+    ParameterList(name=f'option{i}', description=f'Option {i}', parameters=[
+      ParameterStringValue(name=f'value{j}', value=str(j)) if j % 2 else ParameterPreference(name=f'flag{j}')
+      for j in range(numParameters)
+    ])
+    for i in range(numOptions)
+  ])
+
+
+def currentPath(obj):
+  return json.dumps(to_json_safe(asdict(obj)), cls=DjangoJSONEncoder).encode()
+
+
+def bench(name, obj, repeat):
+  assert currentPath(obj) == to_json_bytes(obj), f'{name}: encoders disagree'
+  size = len(to_json_bytes(obj))
+  current = min(timeit.repeat(lambda: currentPath(obj), number=1, repeat=repeat))
+  compiled = min(timeit.repeat(lambda: to_json_bytes(obj), number=1, repeat=repeat))
+  print(f'{name:<12} {size / 1024:>9.0f} KiB  asdict+to_json_safe+dumps {current * 1000:>8.2f} ms'
+        f'  to_json_bytes {compiled * 1000:>8.2f} ms  speedup {current / compiled:>5.2f}x')
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--folders', type=int, default=200)
+  parser.add_argument('--operations', type=int, default=50)
+  parser.add_argument('--options', type=int, default=20)
+  parser.add_argument('--parameters', type=int, default=50)
+  parser.add_argument('--repeat', type=int, default=20)
+  args = parser.parse_args()
+
+  bench('hierarchy', buildHierarchy(args.folders, args.operations), args.repeat)
+  bench('parameters', buildParameters(args.options, args.parameters), args.repeat)
+
+
+if __name__ == '__main__':
+  main()
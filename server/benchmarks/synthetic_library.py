@@ -0,0 +1,76 @@
+"""
+A LibraryAPI generating hierarchies and parameter sets of configurable size, registered by
+bench_http.py. The sizes are read from the environment when the library is loaded:
+BENCH_FOLDERS x BENCH_OPERATIONS operations, BENCH_OPTIONS x BENCH_PARAMETERS parameters.
+AsyncSyntheticLibrary is the same library as an AsyncLibraryAPI.
+"""
+import asyncio
+from datetime import datetime
+import os
+from uuid import uuid4
+
+from webcligui_api import AsyncLibraryAPI, LibraryAPI, Operation, OperationFolder, OperationStatusStart, OperationType
+from webcligui_api import ParameterList, ParameterOptionsToList, ParameterPreference, ParameterStringValue
+from api.constants import OPERATION_ROOT_DIRECTORY
+
+
+class SyntheticLibrary(LibraryAPI):
+  def __init__(self):
+    self.numFolders = int(os.getenv('BENCH_FOLDERS', 100))
+    self.numOperations = int(os.getenv('BENCH_OPERATIONS', 20))
+    self.numOptions = int(os.getenv('BENCH_OPTIONS', 10))
+    self.numParameters = int(os.getenv('BENCH_PARAMETERS', 20))
+
+  def getOperationHierarchy(self):
+    return OperationFolder(name='synthetic', portfolio=[
+      OperationFolder(name=f'folder{i}', portfolio=[
+        Operation(name=f'operation{j}', operation_type=OperationType.PYTHON, operation_module=f'module{j}')
+        for j in range(self.numOperations)
+      ])
+      for i in range(self.numFolders)
+    ])
+
+  def getOperationHierarchyVersion(self):
+    return f'{self.numFolders}x{self.numOperations}'
+
+  def getDescription(self, operationBranch):
+    return f'Synthetic operation {"/".join(operationBranch)}'
+
+  def getParameters(self, operationBranch):
+    return ParameterOptionsToList(name='parameters', mandatory=True, options=[
+      ParameterList(name=f'option{i}', description=f'Option {i}', parameters=[
+        ParameterStringValue(name=f'value{j}', value=str(j)) if j % 2 else ParameterPreference(name=f'flag{j}')
+        for j in range(self.numParameters)
+      ])
+      for i in range(self.numOptions)
+    ])
+
+  def submitOperation(self, operationBranch, command, servers):
+    uuid = str(uuid4())
+    folder = f'synthetic-{uuid}'
+    (OPERATION_ROOT_DIRECTORY / folder).mkdir(parents=True)
+    return OperationStatusStart(uuid=uuid, start_time=datetime.now().astimezone(), folder=folder)
+
+
+class AsyncSyntheticLibrary(AsyncLibraryAPI):
+  def __init__(self):
+    self.synthetic = SyntheticLibrary()
+
+  async def getOperationHierarchy(self):
+    await asyncio.sleep(0)
+    return self.synthetic.getOperationHierarchy()
+
+  def getOperationHierarchyVersion(self):
+    return self.synthetic.getOperationHierarchyVersion()
+
+  async def getDescription(self, operationBranch):
+    await asyncio.sleep(0)
+    return self.synthetic.getDescription(operationBranch)
+
+  async def getParameters(self, operationBranch):
+    await asyncio.sleep(0)
+    return self.synthetic.getParameters(operationBranch)
+
+  async def submitOperation(self, operationBranch, command, servers):
+    await asyncio.sleep(0)
+    return self.synthetic.submitOperation(operationBranch, command, servers)
@@ -52,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.Metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,12 +85,49 @@ WSGI_APPLICATION = 'webCliGui.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE selects 'sqlite' (default) or 'postgresql', see "Database" in the README.
+# Connections are kept open for DATABASE_CONN_MAX_AGE seconds, a query waits up to
+# DATABASE_BUSY_TIMEOUT seconds for a lock (SQLite) or a pooled connection (PostgreSQL).
+DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'sqlite')
+DATABASE_CONN_MAX_AGE = int(os.getenv('DATABASE_CONN_MAX_AGE', 600))
+DATABASE_BUSY_TIMEOUT = float(os.getenv('DATABASE_BUSY_TIMEOUT', 20))
+
+if DATABASE_ENGINE == 'postgresql':
+    # Needs psycopg[pool]; 0 switches the pool off and keeps one persistent connection per thread instead
+    DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', 20))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DATABASE_NAME', 'webcligui'),
+            'USER': os.getenv('DATABASE_USER', ''),
+            'PASSWORD': os.getenv('DATABASE_PASSWORD', ''),
+            'HOST': os.getenv('DATABASE_HOST', ''),
+            'PORT': os.getenv('DATABASE_PORT', ''),
+            # Pooled connections go back to the pool after every request, Django refuses CONN_MAX_AGE with a pool
+            'CONN_MAX_AGE': 0 if DATABASE_POOL_SIZE > 0 else DATABASE_CONN_MAX_AGE,
+            'OPTIONS': {
+                'pool': {'min_size': 2, 'max_size': DATABASE_POOL_SIZE, 'timeout': DATABASE_BUSY_TIMEOUT},
+            } if DATABASE_POOL_SIZE > 0 else {},
+        }
+    }
+else:
+    # WAL lets the status list be read while the monitor and the submissions write. It does not
+    # work on network file systems, DATABASE_SQLITE_WAL=0 keeps the rollback journal there.
+    DATABASE_SQLITE_WAL = os.getenv('DATABASE_SQLITE_WAL', '1') != '0'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'OPTIONS': {
+                'timeout': DATABASE_BUSY_TIMEOUT,
+                # Take the write lock at the start of a transaction, upgrading a read lock fails
+                # with "database is locked" right away instead of waiting for the timeout
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ('PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;' if DATABASE_SQLITE_WAL else ''),
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -151,7 +189,60 @@ SPECTACULAR_SETTINGS = {
     # Other settings like authentication can be added here
 }
 
+# How running operations are monitored: 'inotify', 'poll' or 'auto' (inotify when available)
+OPERATION_MONITOR_MODE = os.getenv('OPERATION_MONITOR_MODE', 'auto')
+
+# Seconds between the polls of the OperationEvent table, through which the server processes pass
+# the status events to each other's streams. 0 (the default) turns the relay off, enough for a single
+# process; deployments with several worker processes or hosts set it, for example to 1.
+OPERATION_EVENT_RELAY_INTERVAL = float(os.getenv('OPERATION_EVENT_RELAY_INTERVAL', 0))
+
+# Number of threads submitting queued operations to the libraries, 0 submits inline in the request
+OPERATION_QUEUE_WORKERS = int(os.getenv('OPERATION_QUEUE_WORKERS', 4))
+
+# Threads importing the registered libraries in the background when the server starts, 0 imports
+# each library on its first use. Also used when a request needs all libraries at once.
+LIBRARY_PRELOAD_THREADS = int(os.getenv('LIBRARY_PRELOAD_THREADS', 0))
+
+# 'subprocess' hosts every library in a pool of LIBRARY_WORKERS worker processes instead of in
+# the server process ('inprocess'). A call taking longer than LIBRARY_WORKER_TIMEOUT seconds kills
+# its worker; a worker is replaced after LIBRARY_WORKER_MAX_CALLS calls or once its RSS exceeds
+# LIBRARY_WORKER_MAX_RSS_MB (0 is unlimited for both).
+LIBRARY_EXECUTION = os.getenv('LIBRARY_EXECUTION', 'inprocess')
+LIBRARY_WORKERS = int(os.getenv('LIBRARY_WORKERS', 2))
+LIBRARY_WORKER_TIMEOUT = float(os.getenv('LIBRARY_WORKER_TIMEOUT', 60))
+LIBRARY_WORKER_MAX_CALLS = int(os.getenv('LIBRARY_WORKER_MAX_CALLS', 1000))
+LIBRARY_WORKER_MAX_RSS_MB = int(os.getenv('LIBRARY_WORKER_MAX_RSS_MB', 512))
+
+# Threads running the calls of synchronous libraries for the async views
+LIBRARY_THREAD_POOL_SIZE = int(os.getenv('LIBRARY_THREAD_POOL_SIZE', 32))
+
+# Most operations running at the same time per target server and per library, 0 is unlimited.
+# OPERATION_SERVER_LIMITS / OPERATION_LIBRARY_LIMITS override them per name: 'host1=2,host2=8'
+OPERATION_SERVER_CONCURRENCY = int(os.getenv('OPERATION_SERVER_CONCURRENCY', 4))
+OPERATION_LIBRARY_CONCURRENCY = int(os.getenv('OPERATION_LIBRARY_CONCURRENCY', 0))
+OPERATION_SERVER_LIMITS = os.getenv('OPERATION_SERVER_LIMITS', '')
+OPERATION_LIBRARY_LIMITS = os.getenv('OPERATION_LIBRARY_LIMITS', '')
+
+# Most operations accepted by one submit-operations request, and how many of them are
+# submitted to the libraries at the same time when they are not queued
+SUBMIT_BATCH_MAX_SIZE = int(os.getenv('SUBMIT_BATCH_MAX_SIZE', 1000))
+SUBMIT_BATCH_PARALLELISM = int(os.getenv('SUBMIT_BATCH_PARALLELISM', 8))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
+
+# Seconds authenticated users and the token blacklist are kept in memory, 0 queries them on every
+# request. Processes signal each other to drop the cache by touching AUTH_GENERATION_FILE.
+AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 30))
+AUTH_GENERATION_FILE = Path(os.getenv('AUTH_GENERATION_FILE', BASE_DIR / '.auth_generation'))
+
+# archiveOperations: finished operations started more than STATUS_RETENTION_DAYS ago are moved
+# to STATUS_ARCHIVE_DIRECTORY, their folders compressed there as well
+STATUS_RETENTION_DAYS = int(os.getenv('STATUS_RETENTION_DAYS', 30))
+STATUS_ARCHIVE_DIRECTORY = Path(os.getenv('STATUS_ARCHIVE_DIRECTORY', BASE_DIR / 'archive'))
+
+# Bearer token Prometheus sends to /api/metrics, without it the endpoint needs an access token
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
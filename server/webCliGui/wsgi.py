@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webCliGui.settings')
 
 application = get_wsgi_application()
+
+# Start monitoring the running operations now instead of at the first submission,
+# so operations that were running when the server stopped are picked up again
+from api.api import get_operation_handling  # noqa: E402
+get_operation_handling()
+
+from api.LibraryRegistry import startPreload  # noqa: E402
+startPreload()
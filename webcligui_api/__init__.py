@@ -1,10 +1,15 @@
 from .src.webcligui_api.operation import OperationType, OperationState, Operation, OperationFolder, OperationStatusStart
+from .src.webcligui_api.operation import SlottedOperation, SlottedOperationFolder
 from .src.webcligui_api.parameters import ParameterBase, ParameterList, ParameterOptionsToList, ParameterPreference, ParameterStringValue
 from .src.webcligui_api.parameters import ParameterData
 from .src.webcligui_api.library_api import LibraryAPI
+from .src.webcligui_api.async_library_api import AsyncLibraryAPI
+from .src.webcligui_api.encoder import to_json_bytes
 
 
 __all__ = ["OperationType", "OperationState", "Operation", "OperationFolder", "OperationStatusStart",
+           "SlottedOperation", "SlottedOperationFolder",
            "ParameterBase", "ParameterList", "ParameterOptionsToList", "ParameterPreference", "ParameterStringValue",
            "ParameterData",
-           "LibraryAPI"]
+           "LibraryAPI", "AsyncLibraryAPI",
+           "to_json_bytes"]
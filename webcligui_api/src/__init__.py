@@ -1,10 +1,15 @@
 from .webcligui_api.operation import OperationType, OperationState, Operation, OperationFolder, OperationStatusStart
+from .webcligui_api.operation import SlottedOperation, SlottedOperationFolder
 from .webcligui_api.parameters import ParameterBase, ParameterList, ParameterOptionsToList, ParameterPreference, ParameterStringValue
 from .webcligui_api.parameters import ParameterData
 from .webcligui_api.library_api import LibraryAPI
+from .webcligui_api.async_library_api import AsyncLibraryAPI
+from .webcligui_api.encoder import to_json_bytes
 
 
 __all__ = ["OperationType", "OperationState", "Operation", "OperationFolder", "OperationStatusStart",
+           "SlottedOperation", "SlottedOperationFolder",
            "ParameterBase", "ParameterList", "ParameterOptionsToList", "ParameterPreference", "ParameterStringValue", 
            "ParameterData",
-           "LibraryAPI"]
+           "LibraryAPI", "AsyncLibraryAPI",
+           "to_json_bytes"]
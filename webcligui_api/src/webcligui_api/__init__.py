@@ -1,10 +1,15 @@
 from .operation import OperationType, OperationState, Operation, OperationFolder, OperationStatusStart
+from .operation import SlottedOperation, SlottedOperationFolder
 from .parameters import ParameterBase, ParameterData, ParameterList, ParameterOptionsToList, ParameterPreference, ParameterStringValue
 from .parameters import ParameterData
 from .library_api import LibraryAPI
+from .async_library_api import AsyncLibraryAPI
+from .encoder import to_json_bytes
 
 
 __all__ = ["OperationType", "OperationState", "Operation", "OperationFolder", "OperationStatusStart",
+           "SlottedOperation", "SlottedOperationFolder",
            "ParameterBase", "ParameterList", "ParameterOptionsToList", "ParameterPreference", "ParameterStringValue",
            "ParameterData",
-           "LibraryAPI"]
+           "LibraryAPI", "AsyncLibraryAPI",
+           "to_json_bytes"]
@@ -0,0 +1,45 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from .operation import Operation, OperationFolder, OperationStatusStart, SlottedOperation, SlottedOperationFolder
+from .parameters import ParameterData
+
+
+class AsyncLibraryAPI(ABC):
+    """
+    LibraryAPI for libraries doing I/O, e.g. looking up an inventory or probing servers over
+    SSH: the server awaits the methods on its event loop instead of blocking a thread on them.
+    The optional hooks are the same as in LibraryAPI and stay synchronous, they must be cheap.
+    """
+
+    @abstractmethod
+    async def getOperationHierarchy(self) -> OperationFolder | SlottedOperationFolder:
+        pass
+
+    def getOperationHierarchyVersion(self) -> str | None:
+        """Optional, see LibraryAPI.getOperationHierarchyVersion()."""
+        return None
+
+    async def getOperationSubtree(self, operationBranch: list[str],
+                                  depth: int) -> Operation | OperationFolder | SlottedOperation | SlottedOperationFolder | None:
+        """Optional, see LibraryAPI.getOperationSubtree()."""
+        return None
+
+    @abstractmethod
+    async def getDescription(self, operationBranch: list[str]) -> str:
+        pass
+
+    @abstractmethod
+    async def getParameters(self, operationBranch: list[str]) -> ParameterData:
+        pass
+
+    def isDescriptionCacheable(self, operationBranch: list[str]) -> bool:
+        """Optional, see LibraryAPI.isDescriptionCacheable()."""
+        return True
+
+    def isParametersCacheable(self, operationBranch: list[str]) -> bool:
+        """Optional, see LibraryAPI.isParametersCacheable()."""
+        return True
+
+    @abstractmethod
+    async def submitOperation(self, operationBranch: list[str], command: list[str], servers: list[str]) -> OperationStatusStart:
+        pass
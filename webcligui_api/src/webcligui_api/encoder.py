@@ -0,0 +1,122 @@
+from dataclasses import fields, is_dataclass
+from datetime import date, datetime, time, timedelta
+from enum import Enum
+from json.encoder import encode_basestring_ascii
+from uuid import UUID
+
+# Compiled encoder per dataclass, built the first time an instance of the class is encoded
+_classEncoders = {}
+
+
+def _encodeFloat(value, write):
+    if value != value:
+        write('NaN')
+    elif value == float('inf'):
+        write('Infinity')
+    elif value == -float('inf'):
+        write('-Infinity')
+    else:
+        write(float.__repr__(value))
+
+
+def _encodeList(value, write):
+    if not value:
+        write('[]')
+        return
+    write('[')
+    first = True
+    for item in value:
+        if not first:
+            write(', ')
+        first = False
+        _encodeValue(item, write)
+    write(']')
+
+
+def _encodeDict(value, write):
+    if not value:
+        write('{}')
+        return
+    write('{')
+    first = True
+    for key, item in value.items():
+        if not first:
+            write(', ')
+        first = False
+        write(encode_basestring_ascii(key if isinstance(key, str) else str(key)))
+        write(': ')
+        _encodeValue(item, write)
+    write('}')
+
+
+_typeEncoders = {
+    str: lambda value, write: write(encode_basestring_ascii(value)),
+    int: lambda value, write: write(int.__repr__(value)),
+    bool: lambda value, write: write('true' if value else 'false'),
+    type(None): lambda value, write: write('null'),
+    float: _encodeFloat,
+    list: _encodeList,
+    tuple: _encodeList,
+    dict: _encodeDict,
+}
+
+
+def _compileClassEncoder(cls):
+    """
+    Generates the source of a function that writes the fields of cls in declaration order,
+    with the keys already encoded, the same output as json.dumps(asdict(obj)).
+    """
+    lines = ['def encode(obj, write):']
+    separator = '{'
+    for field in fields(cls):
+        lines.append(f'    write({separator + encode_basestring_ascii(field.name) + ": "!r})')
+        lines.append(f'    encodeValue(obj.{field.name}, write)')
+        separator = ', '
+    lines.append("    write('}')" if separator == ', ' else "    write('{}')")
+
+    namespace = {'encodeValue': _encodeValue}
+    exec('\n'.join(lines), namespace)
+    encode = namespace['encode']
+    encode.__qualname__ = f'encode_{cls.__name__}'
+    return encode
+
+
+def _encodeValue(value, write):
+    valueType = type(value)
+    encoder = _typeEncoders.get(valueType) or _classEncoders.get(valueType)
+    if encoder is not None:
+        encoder(value, write)
+    elif is_dataclass(value) and not isinstance(value, type):
+        encoder = _classEncoders[valueType] = _compileClassEncoder(valueType)
+        encoder(value, write)
+    elif isinstance(value, Enum):
+        _encodeValue(value.value, write)
+    elif isinstance(value, (datetime, date, time)):
+        write('"' + value.isoformat() + '"')
+    elif isinstance(value, timedelta):
+        _encodeFloat(value.total_seconds(), write)
+    elif isinstance(value, UUID):
+        write('"' + str(value) + '"')
+    elif isinstance(value, str):
+        write(encode_basestring_ascii(value))
+    elif isinstance(value, int):
+        write(int.__repr__(int(value)))
+    elif isinstance(value, float):
+        _encodeFloat(float(value), write)
+    elif isinstance(value, (list, tuple)):
+        _encodeList(value, write)
+    elif isinstance(value, dict):
+        _encodeDict(value, write)
+    else:
+        raise TypeError(f'Object of type {valueType.__name__} is not JSON serializable')
+
+
+def to_json_bytes(obj) -> bytes:
+    """
+    Encodes dataclass instances (Operation, OperationFolder, Parameter*, ...) and the usual
+    JSON types to JSON in a single pass. Enum values, datetimes (ISO 8601) and timedeltas
+    (seconds) are converted inline, so there is no need for asdict() first.
+    """
+    parts = []
+    _encodeValue(obj, parts.append)
+    return ''.join(parts).encode()
@@ -1,14 +1,33 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from .operation import OperationFolder, OperationStatusStart
+from .operation import Operation, OperationFolder, OperationStatusStart, SlottedOperation, SlottedOperationFolder
 from .parameters import ParameterData
 
 
 class LibraryAPI(ABC):    
     @abstractmethod
-    def getOperationHierarchy(self) -> OperationFolder:
+    def getOperationHierarchy(self) -> OperationFolder | SlottedOperationFolder:
         pass
 
+    def getOperationHierarchyVersion(self) -> str | None:
+        """
+        Optional. The server caches the serialized hierarchy until the library module changes.
+        A library whose hierarchy changes at runtime returns a cheap version string here that
+        changes along with it.
+        """
+        return None
+
+    def getOperationSubtree(self, operationBranch: list[str],
+                            depth: int) -> Operation | OperationFolder | SlottedOperation | SlottedOperationFolder | None:
+        """
+        Optional. Returns the folder at operationBranch (without the library name, [] is the
+        root) with depth levels of portfolio below it, for libraries with hierarchies too big
+        to send at once. The server asks for one level more than it returns, to count the
+        children of the deepest folders. Returning None makes the server slice the result of
+        getOperationHierarchy() instead.
+        """
+        return None
+
     @abstractmethod
     def getDescription(self, operationBranch: list[str]) -> str:
         pass
@@ -17,6 +36,14 @@ class LibraryAPI(ABC):
     def getParameters(self, operationBranch: list[str]) -> ParameterData:
         pass
 
+    def isDescriptionCacheable(self, operationBranch: list[str]) -> bool:
+        """Optional. Return False when the description of this branch must be fetched on every request."""
+        return True
+
+    def isParametersCacheable(self, operationBranch: list[str]) -> bool:
+        """Optional. Return False for dynamic parameters that must be fetched on every request."""
+        return True
+
     @abstractmethod
     def submitOperation(self, operationBranch: list[str], command: list[str], servers: list[str]) -> OperationStatusStart:
         pass
@@ -9,8 +9,10 @@ class OperationType(Enum):
     PYTHON = "python"
 
 class OperationState(Enum):
+    QUEUED = "*****Neda Queued*****"
     STARTED = "*****Neda Started*****"
     FINISHED = "*****Neda Finished*****"
+    FAILED = "*****Neda Failed*****"
 
 @dataclass
 class OperationBase:
@@ -30,3 +32,18 @@ class OperationStatusStart:
     uuid: str
     start_time: datetime
     folder: str
+
+# Slotted variants of Operation and OperationFolder with the same fields, for libraries with big
+# hierarchies: they take about a quarter less memory and encode to the same JSON, but accept no
+# attributes beyond their fields. They do not derive from the unslotted classes, whose instances
+# would keep their per-instance dict.
+@dataclass(slots=True)
+class SlottedOperation:
+    name: str
+    operation_type: OperationType
+    operation_module: str | None = None
+
+@dataclass(slots=True)
+class SlottedOperationFolder:
+    name: str
+    portfolio: list[SlottedOperation | SlottedOperationFolder] = field(default_factory=list)